@@ -0,0 +1,24 @@
+"""The routes of ``urls.py`` with the token endpoint served by its native
+async view.
+
+``bankly/asgi.py`` mounts them; under WSGI an async view costs an event
+loop per request.
+"""
+
+from django.urls import path
+
+from . import urls
+from .views import AsyncTokenObtainPairView
+
+ASYNC_VIEWS = {
+    "token_obtain_pair": AsyncTokenObtainPairView,
+}
+
+urlpatterns = [
+    (
+        path(str(route.pattern), ASYNC_VIEWS[route.name].as_view(), name=route.name)
+        if route.name in ASYNC_VIEWS
+        else route
+    )
+    for route in urls.urlpatterns
+]
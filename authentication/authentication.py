@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication as drf_authentication
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser as BaseTokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def token_user_claims(user):
+    """The claims a ``TokenUser`` is built from, added to issued tokens."""
+    return {
+        "username": user.get_username(),
+        "is_active": user.is_active,
+        "is_staff": user.is_staff,
+        "is_superuser": user.is_superuser,
+    }
+
+
+class TokenUser(BaseTokenUser):
+    """The user of a token, built from its claims without a query.
+
+    Claims are copied when the token is issued, so they can be as old as the
+    token. ``load_user()`` returns the full model when a view needs it.
+    """
+
+    @cached_property
+    def id(self):
+        # simplejwt writes the id claim as a string
+        return get_user_model()._meta.pk.to_python(
+            self.token[api_settings.USER_ID_CLAIM]
+        )
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def is_active(self):
+        return self.token.get("is_active", True)
+
+
+class UserCache:
+    """Users by id, kept for ``ttl`` seconds, the least recently used first
+    to go once there are ``max_size`` of them.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return user
+
+    def set(self, user):
+        with self.lock:
+            self.entries[user.pk] = (user, time.monotonic() + self.ttl)
+            self.entries.move_to_end(user.pk)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache(
+    getattr(settings, "JWT_USER_CACHE_SECONDS", 30),
+    getattr(settings, "JWT_USER_CACHE_SIZE", 10000),
+)
+
+
+def check_active(user):
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+    return user
+
+
+def user_not_found():
+    return AuthenticationFailed(_("User not found"), code="user_not_found")
+
+
+def load_user(user):
+    """The ``User`` behind ``request.user``.
+
+    Token users are loaded by id and cached for ``JWT_USER_CACHE_SECONDS``,
+    so a deactivated user is rejected after that long at most; model
+    instances are returned as they are.
+    """
+    if not isinstance(user, BaseTokenUser):
+        return user
+    loaded = user_cache.get(user.id)
+    if loaded is None:
+        try:
+            loaded = get_user_model().objects.get(pk=user.id)
+        except get_user_model().DoesNotExist as e:
+            raise user_not_found() from e
+        user_cache.set(loaded)
+    return check_active(loaded)
+
+
+async def aload_user(user):
+    """``load_user()`` with the query awaited."""
+    if not isinstance(user, BaseTokenUser):
+        return user
+    loaded = user_cache.get(user.id)
+    if loaded is None:
+        try:
+            loaded = await get_user_model().objects.aget(pk=user.id)
+        except get_user_model().DoesNotExist as e:
+            raise user_not_found() from e
+        user_cache.set(loaded)
+    return check_active(loaded)
+
+
+def token_users_enabled():
+    return getattr(settings, "JWT_TOKEN_USER", False)
+
+
+class BasicAuthentication(drf_authentication.BasicAuthentication):
+    """DRF's basic authentication, unless ``API_BASIC_AUTHENTICATION`` is off.
+
+    It hashes the password on every request, so clients are better served by
+    tokens.
+    """
+
+    def authenticate(self, request):
+        if not getattr(settings, "API_BASIC_AUTHENTICATION", True):
+            return None
+        return super().authenticate(request)
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """simplejwt's authentication with an ``aauthenticate`` for async views.
+
+    The token is validated the same way, only the user is fetched with the
+    async ORM so the event loop is not blocked. With ``JWT_TOKEN_USER`` on,
+    the user is a ``TokenUser`` built from the claims instead, without a
+    query; deactivating a user or changing their password then only takes
+    effect when their access tokens expire.
+    """
+
+    def get_user(self, validated_token):
+        if token_users_enabled():
+            return self.get_token_user(validated_token)
+        return super().get_user(validated_token)
+
+    def get_token_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        return check_active(TokenUser(validated_token))
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if token_users_enabled():
+            return self.get_token_user(validated_token), validated_token
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        # The checks of get_user(), with the query awaited
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+        try:
+            user = await self.user_model.objects.aget(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(
+                _("User not found"), code="user_not_found"
+            ) from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
@@ -0,0 +1,37 @@
+"""Password hashers with their cost taken from the settings.
+
+``PASSWORD_HASHERS`` lists the hasher of new passwords first. The others
+only verify older hashes, which Django rehashes with the first one on the
+next successful login, as it does when the cost of a hasher changes.
+"""
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class TunedHasherMixin:
+    """Override the cost attributes of a hasher with the ``params_setting``
+    dict of the settings.
+    """
+
+    params_setting = None
+
+    def __init__(self):
+        for name, value in getattr(settings, self.params_setting, {}).items():
+            setattr(self, name, value)
+
+
+class ScryptPasswordHasher(TunedHasherMixin, hashers.ScryptPasswordHasher):
+    """Scrypt (standard library), tuned with ``PASSWORD_SCRYPT_PARAMS``:
+    ``work_factor``, ``block_size``, ``parallelism`` and ``maxmem``.
+    """
+
+    params_setting = "PASSWORD_SCRYPT_PARAMS"
+
+
+class Argon2PasswordHasher(TunedHasherMixin, hashers.Argon2PasswordHasher):
+    """Argon2 (needs ``argon2-cffi``), tuned with ``PASSWORD_ARGON2_PARAMS``:
+    ``time_cost``, ``memory_cost`` and ``parallelism``.
+    """
+
+    params_setting = "PASSWORD_ARGON2_PARAMS"
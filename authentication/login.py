@@ -0,0 +1,86 @@
+"""Password checks of the token endpoint, a bounded number at a time.
+
+Hashing a password takes tens to hundreds of milliseconds of CPU, so a burst
+of logins could starve every other request. The token endpoint checks
+credentials with ``django.contrib.auth.authenticate()``, so the
+``AUTHENTICATION_BACKENDS``, ``user_can_authenticate()`` and the login
+signals all apply, in the thread of its request (under ASGI, the sync
+thread Django gives each request). At most ``LOGIN_HASHING_THREADS`` logins
+authenticate at once; when ``LOGIN_HASHING_QUEUE`` logins are already
+waiting or hashing, new ones are turned away with a 503 rather than queued
+for longer than any client would wait.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from bankly.metrics import registry
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many logins in progress, try again shortly."
+    default_code = "login_busy"
+
+
+class HashingPool:
+    """Run at most ``max_workers`` calls at a time, and turn calls away once
+    ``max_pending`` are waiting or running.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.workers = threading.BoundedSemaphore(max_workers)
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.pending = 0
+
+    @contextmanager
+    def admit(self):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                registry.increment("login_hashing_rejected_total")
+                raise HashingBusy()
+            self.pending += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    async def arun(self, fn, *args, **kwargs):
+        with self.admit():
+            return await sync_to_async(self.call)(fn, *args, **kwargs)
+
+    def run(self, fn, *args, **kwargs):
+        with self.admit():
+            return self.call(fn, *args, **kwargs)
+
+    def call(self, fn, *args, **kwargs):
+        with self.workers:
+            return fn(*args, **kwargs)
+
+
+pool = HashingPool(
+    getattr(settings, "LOGIN_HASHING_THREADS", 4),
+    getattr(settings, "LOGIN_HASHING_QUEUE", 64),
+)
+
+
+def pooled_authenticate(request, **credentials):
+    """``authenticate()`` in the pool: the user with these credentials that
+    may log in, or ``None``.
+
+    ``ModelBackend`` replaces a password hashed with an outdated hasher.
+    """
+    return pool.run(authenticate, request, **credentials)
+
+
+async def apooled_authenticate(request, **credentials):
+    """``pooled_authenticate()`` for the async token view."""
+    return await pool.arun(authenticate, request, **credentials)
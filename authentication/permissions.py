@@ -0,0 +1,16 @@
+from rest_framework import permissions
+
+from .authentication import load_user
+
+
+class IsAdminUser(permissions.IsAdminUser):
+    """DRF's ``IsAdminUser``, checked on the ``User`` row instead of the
+    claims of a token user, which can be as old as the token.
+    """
+
+    def has_permission(self, request, view):
+        return bool(
+            request.user
+            and request.user.is_authenticated
+            and load_user(request.user).is_staff
+        )
@@ -1,5 +1,11 @@
-from django.contrib.auth.models import User
-from rest_framework import serializers
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User, update_last_login
+from rest_framework import exceptions, serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import token_user_claims
+from .login import apooled_authenticate, pooled_authenticate
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -12,3 +18,53 @@ class UserSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
         return user
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    """Issue tokens that carry the claims a ``TokenUser`` is built from.
+
+    Access tokens made by refreshing copy the claims of the refresh token.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for claim, value in token_user_claims(user).items():
+            token[claim] = value
+        return token
+
+    def get_tokens(self, user):
+        refresh = self.get_token(user)
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
+        return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+    def credentials(self, attrs):
+        return {
+            self.username_field: attrs[self.username_field],
+            "password": attrs["password"],
+        }
+
+    def check_user(self):
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise exceptions.AuthenticationFailed(
+                self.error_messages["no_active_account"], "no_active_account"
+            )
+
+    def validate(self, attrs):
+        # The credentials are checked by ``authenticate()`` in the hashing
+        # pool (see ``authentication/login.py``)
+        self.user = pooled_authenticate(
+            self.context.get("request"), **self.credentials(attrs)
+        )
+        self.check_user()
+        return self.get_tokens(self.user)
+
+    async def aobtain(self):
+        """``is_valid()`` and ``validated_data`` for the async token view."""
+        attrs = self.to_internal_value(self.initial_data)
+        self.user = await apooled_authenticate(
+            self.context.get("request"), **self.credentials(attrs)
+        )
+        self.check_user()
+        return await sync_to_async(self.get_tokens)(self.user)
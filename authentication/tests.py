@@ -1,8 +1,22 @@
-from django.test import TestCase
+import base64
+from unittest import mock
+
+from django.conf import settings
+from django.test import AsyncClient, TestCase, override_settings
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.contrib.auth.signals import user_login_failed
+from django.urls import resolve, reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+
+from banking import read_cache
+from banking.models import Account
+from . import login
+from .authentication import TokenUser, load_user, user_cache
+from .throttling import get_buckets
+from .views import AsyncTokenObtainPairView, TokenObtainPairView
+
 
 # Unit testing
 class TestUserAuthentication(TestCase):
@@ -92,3 +106,234 @@ class UserRegistrationLoginIntegrationTest(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue("access" in response.data)
+
+
+# Integration testing
+@override_settings(JWT_TOKEN_USER=True)
+class TokenUserAuthenticationTest(TestCase):
+    def setUp(self):
+        self.password = "testpassword123"
+        self.user = User.objects.create_user("testuser", password=self.password)
+        self.client = APIClient()
+        user_cache.clear()
+        read_cache.clear()
+
+    def login(self):
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"username": "testuser", "password": self.password},
+        )
+        return response.data
+
+    def test_tokens_carry_the_user_claims(self):
+        tokens = self.login()
+        access = AccessToken(tokens["access"])
+        self.assertEqual(access["username"], "testuser")
+        self.assertTrue(access["is_active"])
+        self.assertFalse(access["is_staff"])
+
+        # Refreshed access tokens keep them
+        response = self.client.post(
+            reverse("token_refresh"), {"refresh": tokens["refresh"]}
+        )
+        self.assertEqual(AccessToken(response.data["access"])["username"], "testuser")
+
+    def test_requests_do_not_query_the_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.login()['access']}")
+        # Only the accounts are queried
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("account_list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with override_settings(JWT_TOKEN_USER=False):
+            read_cache.clear()
+            with self.assertNumQueries(2):
+                self.client.get(reverse("account_list"))
+
+        response = self.client.post(
+            reverse("account_create"), {"account_type": "individual"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        account = Account.objects.get(id=response.data["id"])
+        account.balance = 10
+        account.save()
+        # The token user owns the account
+        response = self.client.post(
+            reverse("transaction_create"),
+            {"transaction_type": "withdraw", "amount": 1, "sender": account.id},
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    async def test_async_views(self):
+        token = AccessToken.for_user(self.user)
+        response = await AsyncClient().get(
+            reverse("account_list"), headers={"authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_inactive_claim_is_rejected(self):
+        token = AccessToken.for_user(self.user)
+        token["is_active"] = False
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.get(reverse("account_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data["code"], "user_inactive")
+
+    def test_full_user_is_loaded_and_cached(self):
+        token = AccessToken.for_user(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(load_user(TokenUser(token)), self.user)
+            self.assertEqual(load_user(TokenUser(token)), self.user)
+
+        # Admin checks use the row, not a claim
+        token["is_staff"] = True
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+# Integration testing
+class BasicAuthenticationTest(TestCase):
+    def setUp(self):
+        User.objects.create_user("testuser", password="testpassword123")
+        self.client = APIClient()
+        credentials = base64.b64encode(b"testuser:testpassword123").decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
+
+    def test_basic_authentication(self):
+        response = self.client.get(reverse("account_list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(API_BASIC_AUTHENTICATION=False)
+    def test_basic_authentication_can_be_turned_off(self):
+        response = self.client.get(reverse("account_list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+# Integration testing
+class LoginProtectionTest(TestCase):
+    def setUp(self):
+        self.password = "testpassword123"
+        self.user = User.objects.create_user("testuser", password=self.password)
+        self.client = APIClient()
+        get_buckets().clear()
+
+    def login(self, username="testuser", password=None, **extra):
+        return self.client.post(
+            reverse("token_obtain_pair"),
+            {"username": username, "password": password or self.password},
+            **extra,
+        )
+
+    @override_settings(
+        PASSWORD_HASHERS=[
+            "authentication.hashers.ScryptPasswordHasher",
+            "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+        ],
+        PASSWORD_SCRYPT_PARAMS={"work_factor": 2**12},
+    )
+    def test_password_is_rehashed_on_login(self):
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+        self.assertEqual(self.login("testuser", "wrong").status_code, 401)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("scrypt$4096$"))
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+    @override_settings(LOGIN_THROTTLE_RATES={"username": (2, 0.01), "ip": (3, 0.01)})
+    def test_attempts_are_rate_limited(self):
+        self.assertEqual(self.login(password="wrong").status_code, 401)
+        self.assertEqual(self.login("TestUser").status_code, 401)
+        response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+        # Other clients still get their own bucket, other usernames too until
+        # the bucket of their IP is empty
+        response = self.login(REMOTE_ADDR="10.0.0.1", username="other")
+        self.assertEqual(response.status_code, 401)
+        response = self.login(username="other")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    @override_settings(LOGIN_THROTTLE_RATES={"ip": (2, 0.01)})
+    def test_forwarded_for_headers_do_not_change_the_ip(self):
+        statuses = [
+            self.login(password="wrong", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}").status_code
+            for i in range(4)
+        ]
+        self.assertEqual(statuses, [401, 401, 429, 429])
+
+        # Behind a proxy, the address it appended is the client's
+        get_buckets().clear()
+        rest_framework = {**settings.REST_FRAMEWORK, "NUM_PROXIES": 1}
+        with self.settings(REST_FRAMEWORK=rest_framework):
+            statuses = [
+                self.login(
+                    password="wrong", HTTP_X_FORWARDED_FOR=f"10.0.0.{i}, 10.0.1.1"
+                ).status_code
+                for i in range(3)
+            ]
+        self.assertEqual(statuses, [401, 401, 429])
+
+    @override_settings(LOGIN_THROTTLE_RATES={"ip": (1, 0.01)})
+    def test_bodies_that_are_not_objects_are_throttled_by_ip(self):
+        for body in (["testuser"], 1):
+            response = self.client.post(
+                reverse("token_obtain_pair"), body, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            get_buckets().clear()
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.login().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_authentication_backends_and_signals_apply(self):
+        failed = []
+
+        def record(sender, credentials, **kwargs):
+            failed.append(credentials["username"])
+
+        user_login_failed.connect(record)
+        self.addCleanup(user_login_failed.disconnect, record)
+        self.assertEqual(self.login(password="wrong").status_code, 401)
+        self.assertEqual(failed, ["testuser"])
+
+        # A backend that takes other credentials
+        backends = ["django.contrib.auth.backends.RemoteUserBackend"]
+        with self.settings(AUTHENTICATION_BACKENDS=backends):
+            self.assertEqual(self.login().status_code, 401)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.login().status_code, 401)
+
+    def test_hashing_pool_is_bounded(self):
+        with mock.patch.object(login, "pool", login.HashingPool(1, 0)):
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.data["detail"].code, "login_busy")
+
+    def test_async_view_is_only_routed_under_asgi(self):
+        url = reverse("token_obtain_pair")
+        self.assertIs(resolve(url).func.view_class, TokenObtainPairView)
+        self.assertIs(
+            resolve(url, urlconf="bankly.asgi_urls").func.view_class,
+            AsyncTokenObtainPairView,
+        )
+
+    @override_settings(ROOT_URLCONF="bankly.asgi_urls")
+    async def test_async_login(self):
+        client = AsyncClient()
+        data = {"username": "testuser", "password": self.password}
+        response = await client.post(reverse("token_obtain_pair"), data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("access", response.json())
+
+        data["password"] = "wrong"
+        response = await client.post(reverse("token_obtain_pair"), data)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        with mock.patch.object(login, "pool", login.HashingPool(1, 0)):
+            response = await client.post(reverse("token_obtain_pair"), data)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -0,0 +1,140 @@
+"""Token-bucket limits on the login attempts of each username and client IP.
+
+Every attempt takes a token from the bucket of its username and from the
+bucket of its IP. A bucket holds up to ``burst`` tokens and gets ``rate``
+new ones per second, so a client can retry a few times in a row but a
+credential flood is turned away before any password is hashed.
+
+The buckets live in the memory of each process by default
+(``LocalTokenBuckets``). ``CacheTokenBuckets`` keeps them in a Django cache
+shared by the workers instead, at the price of a cache round trip per
+bucket; concurrent attempts on the same bucket can then both take its last
+token, which is fine for a limit.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+from bankly.metrics import registry
+
+
+def refill(state, burst, rate, now):
+    """The tokens of a bucket at ``now``, from its ``(tokens, updated_at)``."""
+    if state is None:
+        return burst
+    tokens, updated_at = state
+    return min(burst, tokens + (now - updated_at) * rate)
+
+
+class LocalTokenBuckets:
+    """The buckets of this process, the least recently used are forgotten
+    (which refills them) once there are ``max_size``.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, burst, rate):
+        """Take a token, or return the seconds until one is available."""
+        now = time.monotonic()
+        with self.lock:
+            tokens = refill(self.buckets.get(key), burst, rate, now)
+            if tokens >= 1:
+                tokens -= 1
+                wait = None
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_size:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheTokenBuckets:
+    """The buckets in the ``LOGIN_THROTTLE_CACHE_ALIAS`` cache."""
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, "LOGIN_THROTTLE_CACHE_ALIAS", "default")]
+
+    def take(self, key, burst, rate):
+        now = time.time()
+        key = f"login-throttle:{key}"
+        tokens = refill(self.cache.get(key), burst, rate, now)
+        if tokens >= 1:
+            tokens -= 1
+            wait = None
+        else:
+            wait = (1 - tokens) / rate
+        # Expires once the bucket would be full again
+        self.cache.set(key, (tokens, now), timeout=int((burst - tokens) / rate) + 1)
+        return wait
+
+    def clear(self):
+        self.cache.clear()
+
+
+_buckets = None
+
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        _buckets = import_string(
+            getattr(
+                settings,
+                "LOGIN_THROTTLE_BACKEND",
+                "authentication.throttling.LocalTokenBuckets",
+            )
+        )()
+    return _buckets
+
+
+class LoginRateThrottle(BaseThrottle):
+    """Limit the login attempts per username and per client IP.
+
+    ``LOGIN_THROTTLE_RATES`` maps ``"username"`` and ``"ip"`` to the
+    ``(burst, tokens per second)`` of their buckets.
+    """
+
+    username_field = "username"
+
+    def allow_request(self, request, view):
+        rates = getattr(settings, "LOGIN_THROTTLE_RATES", {})
+        keys = {"ip": self.get_ident(request)}
+        # Bodies that are not objects (a list, a number) are throttled by IP
+        # and then rejected by the view
+        data = request.data
+        username = data.get(self.username_field) if isinstance(data, Mapping) else None
+        if isinstance(username, str) and username:
+            # Usernames are case sensitive, but a flood should not get
+            # around its bucket by changing case
+            keys["username"] = username.lower()
+
+        buckets = get_buckets()
+        self.wait_seconds = None
+        for scope, ident in keys.items():
+            if scope not in rates:
+                continue
+            burst, rate = rates[scope]
+            wait = buckets.take(f"{scope}:{ident}", burst, rate)
+            if wait is not None:
+                registry.increment(f"login_throttled_{scope}_total")
+                self.wait_seconds = max(wait, self.wait_seconds or 0)
+        return self.wait_seconds is None
+
+    def wait(self):
+        return self.wait_seconds
@@ -14,11 +14,8 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.urls import path
-from rest_framework_simplejwt.views import (
-    TokenObtainPairView,
-    TokenRefreshView,
-)
-from .views import RegisterView
+from rest_framework_simplejwt.views import TokenRefreshView
+from .views import RegisterView, TokenObtainPairView
 
 
 urlpatterns = [
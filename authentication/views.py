@@ -1,9 +1,12 @@
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt import views as jwt_views
 from .serializers import UserSerializer
+from .throttling import LoginRateThrottle
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 
+from bankly.async_views import AsyncAPIViewMixin
+
 
 class RegisterView(APIView):
     def post(self, request):
@@ -12,3 +15,22 @@ class RegisterView(APIView):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class TokenObtainPairView(jwt_views.TokenObtainPairView):
+    """simplejwt's token view, with attempts rate limited per username and
+    client IP before any password is hashed, and only a bounded number of
+    logins hashing at once so they cannot hold up the other requests.
+    """
+
+    throttle_classes = [LoginRateThrottle]
+
+
+class AsyncTokenObtainPairView(AsyncAPIViewMixin, TokenObtainPairView):
+    """The token view as a native async view, routed under ASGI only (see
+    ``asgi_urls.py``), so waiting for the hashing pool holds no thread.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        return Response(await serializer.aobtain(), status=status.HTTP_200_OK)
@@ -2,12 +2,16 @@ from django.contrib import admin
 from .models import *
 from django.core.exceptions import ValidationError
 from django.contrib import messages
+from .posting import post_transaction
 
 
 class AdminValidationError(admin.ModelAdmin):
     def save_model(self, request, obj, form, change):
         try:
-            obj.save()  # Call the original save method
+            if isinstance(obj, Transaction) and not change:
+                post_transaction(obj)
+            else:
+                obj.save()  # Call the original save method
         except ValidationError as e:
             messages.set_level(request, messages.ERROR)
             self.message_user(request, e.message, level=messages.ERROR)
@@ -17,3 +21,5 @@ class AdminValidationError(admin.ModelAdmin):
 admin.site.register(Account, AdminValidationError)
 admin.site.register(Transaction, AdminValidationError)
 admin.site.register(Notification, AdminValidationError)
+admin.site.register(LedgerEntry, AdminValidationError)
+admin.site.register(BalanceSnapshot, AdminValidationError)
@@ -0,0 +1,148 @@
+"""Per account, per day and per transaction type totals.
+
+The posting engine adds every transaction to the ``DailyTotal`` rows of its
+accounts in the same database transaction, with one upsert per posting. An
+account summary then sums at most one row per day and type, however many
+transactions the account has.
+"""
+
+from collections import defaultdict
+from datetime import date
+
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyTotal, Transaction
+
+COUNTERS = ["sent_amount", "sent_count", "received_amount", "received_count"]
+
+
+def record_daily_totals(transactions):
+    """Add saved transactions to the daily totals of their accounts.
+
+    A single ``INSERT ... ON CONFLICT DO UPDATE`` (SQLite and PostgreSQL)
+    creates the missing rows and adds to the existing ones.
+    """
+    totals = defaultdict(lambda: [0, 0, 0, 0])
+    for txn in transactions:
+        day = timezone.localdate(txn.timestamp)
+        sent = totals[txn.sender_id, day, txn.transaction_type]
+        sent[0] += txn.amount
+        sent[1] += 1
+        if txn.recipient_id is not None:
+            received = totals[txn.recipient_id, day, txn.transaction_type]
+            received[2] += txn.amount
+            received[3] += 1
+    if not totals:
+        return
+
+    quote = connection.ops.quote_name
+    table = quote(DailyTotal._meta.db_table)
+    columns = ["account_id", "day", "transaction_type", *COUNTERS]
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    updates = ", ".join(
+        f"{quote(name)} = {table}.{quote(name)} + excluded.{quote(name)}"
+        for name in COUNTERS
+    )
+    sql = (
+        f"INSERT INTO {table} ({', '.join(quote(name) for name in columns)}) "
+        f"VALUES {', '.join([placeholders] * len(totals))} "
+        f"ON CONFLICT ({', '.join(quote(name) for name in columns[:3])}) "
+        f"DO UPDATE SET {updates}"
+    )
+    params = []
+    for (account_id, day, transaction_type), (
+        sent_amount,
+        sent_count,
+        received_amount,
+        received_count,
+    ) in totals.items():
+        params += [
+            account_id,
+            connection.ops.adapt_datefield_value(day),
+            transaction_type,
+            connection.ops.adapt_decimalfield_value(sent_amount),
+            sent_count,
+            connection.ops.adapt_decimalfield_value(received_amount),
+            received_count,
+        ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def daily_totals_from_transactions():
+    """Compute every ``DailyTotal`` from the transactions, for backfills."""
+    totals = {}
+
+    def add(side, account_field):
+        rows = (
+            Transaction.objects.filter(**{f"{account_field}__isnull": False})
+            .annotate(day=TruncDate("timestamp"))
+            .values(account_field, "day", "transaction_type")
+            .annotate(amount=Sum("amount"), count=Count("id"))
+            .order_by()
+        )
+        for row in rows:
+            key = (row[account_field], row["day"], row["transaction_type"])
+            if key not in totals:
+                totals[key] = DailyTotal(
+                    account_id=key[0], day=key[1], transaction_type=key[2]
+                )
+            setattr(totals[key], f"{side}_amount", row["amount"])
+            setattr(totals[key], f"{side}_count", row["count"])
+
+    add("sent", "sender")
+    add("received", "recipient")
+    return list(totals.values())
+
+
+def format_amount(amount):
+    return f"{amount or 0:.2f}"
+
+
+def account_summary(account_id, today=None):
+    """Totals of an account for the current month and all time, in one query.
+
+    ``sent`` counts transfers out, ``received`` everything in (transfers and
+    bill payments to a company account), ``withdrawn`` and ``bills_paid``
+    the withdrawals and bill payments out.
+    """
+    today = today or timezone.localdate()
+    month = Q(day__gte=date(today.year, today.month, 1))
+    rows = (
+        DailyTotal.objects.filter(account_id=account_id)
+        .values("transaction_type")
+        .annotate(
+            **{f"all_{name}": Sum(name) for name in COUNTERS},
+            **{f"month_{name}": Sum(name, filter=month) for name in COUNTERS},
+        )
+        .order_by()
+    )
+    periods = {"this_month": "month", "all_time": "all"}
+    summary = {
+        period: {
+            name: {"amount": 0, "count": 0}
+            for name in ("sent", "received", "withdrawn", "bills_paid")
+        }
+        for period in periods
+    }
+    outgoing = {
+        Transaction.TRANSFER: "sent",
+        Transaction.WITHDRAW: "withdrawn",
+        Transaction.PAY_BILL: "bills_paid",
+    }
+    for row in rows:
+        for period, prefix in periods.items():
+            totals = summary[period]
+            sent = totals[outgoing[row["transaction_type"]]]
+            sent["amount"] += row[f"{prefix}_sent_amount"] or 0
+            sent["count"] += row[f"{prefix}_sent_count"] or 0
+            totals["received"]["amount"] += row[f"{prefix}_received_amount"] or 0
+            totals["received"]["count"] += row[f"{prefix}_received_count"] or 0
+
+    for totals in summary.values():
+        for total in totals.values():
+            total["amount"] = format_amount(total["amount"])
+    return summary
@@ -0,0 +1,30 @@
+"""The routes of ``banking/urls.py`` with the read endpoints served by their
+native async views (see ``async_views.py``).
+
+They only pay off under ASGI, so ``bankly/asgi.py`` mounts them; under WSGI
+an async view costs an event loop per request and loses the browsable API.
+"""
+
+from django.urls import path
+
+from . import urls
+from .async_views import (
+    AsyncAccountListView,
+    AsyncBankStatementListView,
+    AsyncUnreadNotificationListView,
+)
+
+ASYNC_VIEWS = {
+    "account_list": AsyncAccountListView,
+    "bank_statement_list": AsyncBankStatementListView,
+    "unread_notifications": AsyncUnreadNotificationListView,
+}
+
+urlpatterns = [
+    (
+        path(str(route.pattern), ASYNC_VIEWS[route.name].as_view(), name=route.name)
+        if route.name in ASYNC_VIEWS
+        else route
+    )
+    for route in urls.urlpatterns
+]
@@ -0,0 +1,194 @@
+"""Native async versions of the read endpoints.
+
+DRF views are synchronous, so under ASGI Django runs each of them in a
+thread. The views here reuse the querysets, serializers and pagination of
+their sync counterparts but authenticate, check permissions and query the
+database with ``await``, so a single worker can serve many concurrent
+requests while they wait on the database or on slow clients.
+"""
+
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from bankly import routers
+from bankly.async_views import AsyncAPIViewMixin
+
+from .events import get_backend, notification_event
+from .serializers import NotificationSerializer
+from .views import (
+    AccountListView,
+    BankStatementListView,
+    CachedListMixin,
+    ReplicaReadMixin,
+    UnreadNotificationListView,
+    unread_notifications_queryset,
+)
+
+
+class AsyncListModelMixin:
+    """``ListModelMixin.list()`` awaited, through the read cache and on the
+    read replicas of the views that use them.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        cached = self.get_cached_read() if isinstance(self, CachedListMixin) else None
+        if cached is None:
+            return await self.alist(request)
+        hit, data = await cached.aget()
+        if hit:
+            return Response(data)
+        response = await self.alist(request)
+        await cached.aset(response.data)
+        return response
+
+    async def alist(self, request):
+        if isinstance(self, ReplicaReadMixin) and self.read_alias is None:
+            self.read_alias = await routers.aread_alias(request.user.id)
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer([row async for row in queryset], many=True)
+        return Response(serializer.data)
+
+
+class AsyncAccountListView(AsyncAPIViewMixin, AsyncListModelMixin, AccountListView):
+    pass
+
+
+class AsyncBankStatementListView(
+    AsyncAPIViewMixin, AsyncListModelMixin, BankStatementListView
+):
+    pass
+
+
+class AsyncUnreadNotificationListView(
+    AsyncAPIViewMixin, AsyncListModelMixin, UnreadNotificationListView
+):
+    pass
+
+
+def server_sent_event(event):
+    return f"id: {event.id}\nevent: notification\ndata: {event.data}\n\n"
+
+
+class NotificationStreamView(AsyncAPIViewMixin, APIView):
+    """Push the new notifications of the user as server-sent events.
+
+    Each event holds a notification, as in the unread list, with its id as
+    the event id. A client that passes the id of the last notification it saw
+    (in ``Last-Event-ID``, which browsers send when they reconnect, or in
+    ``?last_event_id=``) first gets the unread notifications it missed. An
+    idle stream gets a comment every ``NOTIFICATION_STREAM_HEARTBEAT_SECONDS``
+    and every stream ends after ``NOTIFICATION_STREAM_MAX_SECONDS``, after
+    which the client reconnects.
+
+    WSGI servers only send a body once the view has returned, so a request
+    that is not served over ASGI is answered as a long poll instead: with the
+    missed notifications, or else with the first new one that arrives within
+    ``NOTIFICATION_LONG_POLL_SECONDS``. The client reconnects right after.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # Clients ask for text/event-stream, errors are still sent as JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get_last_event_id(self):
+        value = self.request.headers.get(
+            "Last-Event-ID", self.request.query_params.get("last_event_id")
+        )
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError({"last_event_id": "Expected a notification id."})
+
+    async def get(self, request, *args, **kwargs):
+        self.last_event_id = last_event_id = self.get_last_event_id()
+        # Subscribe before reading the missed notifications so none falls in
+        # between; the ones seen twice are skipped by the stream
+        subscription = get_backend().subscribe(request.user.id)
+        try:
+            missed = []
+            if last_event_id is not None:
+                queryset = unread_notifications_queryset(request.user, {}).filter(
+                    id__gt=last_event_id
+                )
+                missed = NotificationSerializer(
+                    [row async for row in queryset], many=True
+                ).data
+        except BaseException:
+            subscription.close()
+            raise
+
+        if not isinstance(request._request, ASGIRequest):
+            return await self.long_poll(subscription, missed)
+
+        response = StreamingHttpResponse(
+            self.stream(subscription, missed), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        # Keeps proxies like nginx from buffering the events
+        response["X-Accel-Buffering"] = "no"
+        # The stream may be closed before it is iterated
+        response._resource_closers.append(subscription.close)
+        return response
+
+    async def long_poll(self, subscription, missed):
+        # The events are collected in the event loop that runs this view,
+        # which Django closes once the view has returned
+        timeout = getattr(settings, "NOTIFICATION_LONG_POLL_SECONDS", 20)
+        events = self.stream(subscription, missed, timeout, first_events_only=True)
+        response = HttpResponse(
+            "".join([event async for event in events]),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    async def stream(
+        self, subscription, missed, duration=None, first_events_only=False
+    ):
+        heartbeat = getattr(settings, "NOTIFICATION_STREAM_HEARTBEAT_SECONDS", 15)
+        if duration is None:
+            duration = getattr(settings, "NOTIFICATION_STREAM_MAX_SECONDS", 300)
+        deadline = time.monotonic() + duration
+        try:
+            replayed = set()
+            for data in missed:
+                replayed.add(data["id"])
+                yield server_sent_event(notification_event(data))
+            if replayed and first_events_only:
+                return
+
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    event = await subscription.get(min(heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    if not first_events_only:
+                        yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # Overflowed, the client catches up when it reconnects
+                    return
+                # Backends may repeat recent events the client has seen
+                if event.id not in replayed and event.id > (self.last_event_id or 0):
+                    yield server_sent_event(event)
+                    if first_events_only:
+                        return
+        finally:
+            subscription.close()
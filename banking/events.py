@@ -0,0 +1,236 @@
+"""Real-time delivery of notifications to the streams of their users.
+
+The posting engine publishes every notification once its transaction has
+committed. The backend set in ``NOTIFICATION_EVENTS_BACKEND`` carries the
+events to the hub of every worker, which puts them on the queue of each open
+stream of the user.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from bankly.metrics import registry
+
+from .models import Notification
+from .serializers import NotificationSerializer
+
+logger = logging.getLogger(__name__)
+
+Event = namedtuple("Event", ["id", "data"])
+
+
+class Subscription:
+    """The queue of one open stream, fed from any thread."""
+
+    def __init__(self, hub, user_id, queue_size):
+        self.hub = hub
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.queue_size = queue_size
+        self.overflowed = False
+
+    def put(self, event):
+        # Runs in the event loop of the stream
+        if self.overflowed:
+            return
+        if self.queue.qsize() >= self.queue_size:
+            # The client does not keep up: end its stream, it reconnects with
+            # Last-Event-ID and gets the missed notifications from the database
+            self.overflowed = True
+            registry.increment("notification_streams_overflowed_total")
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout):
+        """The next event, ``None`` once overflowed or ``TimeoutError``."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+
+class NotificationHub:
+    """The open streams of this process, by user id."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(
+            self, user_id, getattr(settings, "NOTIFICATION_STREAM_QUEUE_SIZE", 100)
+        )
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def user_ids(self):
+        with self.lock:
+            return list(self.subscriptions)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id)
+            if subscriptions is None:
+                return
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self.subscriptions[subscription.user_id]
+
+    def deliver(self, user_id, event):
+        """Hand an event to the streams of ``user_id``, from any thread."""
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # The event loop of the stream is closed
+                self.unsubscribe(subscription)
+
+
+hub = NotificationHub()
+
+
+class InProcessBackend:
+    """Deliver events to the streams of this process only.
+
+    This is enough for a single worker that also writes the notifications.
+    With several workers, or notifications written by ``process_outbox``,
+    use ``DatabaseBackend``.
+    """
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, user_id, event):
+        self.hub.deliver(user_id, event)
+
+    def subscribe(self, user_id):
+        return self.hub.subscribe(user_id)
+
+
+class DatabaseBackend:
+    """Deliver events to the streams of every worker through the database.
+
+    Notifications are rows whichever process wrote them, so ``publish()``
+    has nothing to send. While a worker has open streams, a thread of its own
+    reads the unread notifications of their users from the last
+    ``NOTIFICATION_POLL_LOOKBACK_SECONDS`` every ``NOTIFICATION_POLL_SECONDS``
+    (on ``notification_unread_idx``) and hands the ones it has not delivered
+    yet to ``hub.deliver()``. Looking back rather than after the last id seen
+    catches rows that commit after rows with higher ids, so the look back
+    must be longer than a posting takes to commit, plus the clock skew of the
+    workers.
+    """
+
+    # Users per query, within the SQLite limit of parameters
+    chunk_size = 500
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.lock = threading.Lock()
+        self.thread = None
+        # The ids delivered within the look back, with their timestamps
+        self.delivered = {}
+
+    def publish(self, user_id, event):
+        pass
+
+    def subscribe(self, user_id):
+        subscription = self.hub.subscribe(user_id)
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="notification-poller", daemon=True
+                )
+                self.thread.start()
+        return subscription
+
+    def run(self):
+        try:
+            while True:
+                with self.lock:
+                    user_ids = self.hub.user_ids()
+                    if not user_ids:
+                        # The next subscribe() starts a new thread
+                        self.thread = None
+                        return
+                try:
+                    self.poll(user_ids)
+                except DatabaseError:
+                    logger.exception("Could not read the new notifications")
+                time.sleep(getattr(settings, "NOTIFICATION_POLL_SECONDS", 1))
+        finally:
+            connection.close()
+
+    def poll(self, user_ids):
+        since = timezone.now() - timedelta(
+            seconds=getattr(settings, "NOTIFICATION_POLL_LOOKBACK_SECONDS", 10)
+        )
+        self.delivered = {
+            notification_id: timestamp
+            for notification_id, timestamp in self.delivered.items()
+            if timestamp >= since
+        }
+        user_ids = iter(user_ids)
+        while chunk := list(itertools.islice(user_ids, self.chunk_size)):
+            notifications = [
+                notification
+                for notification in Notification.objects.filter(
+                    user_id__in=chunk, is_read=False, timestamp__gte=since
+                ).order_by("id")
+                if notification.id not in self.delivered
+            ]
+            for notification, data in zip(
+                notifications, NotificationSerializer(notifications, many=True).data
+            ):
+                self.delivered[notification.id] = notification.timestamp
+                self.hub.deliver(notification.user_id, notification_event(data))
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_class = import_string(
+            getattr(
+                settings,
+                "NOTIFICATION_EVENTS_BACKEND",
+                "banking.events.InProcessBackend",
+            )
+        )
+        _backend = backend_class(hub)
+    return _backend
+
+
+def notification_event(data):
+    return Event(data["id"], json.dumps(data))
+
+
+def publish_notifications(notifications):
+    """Push new notifications to the streams of their users.
+
+    Called by the posting engine once the transaction that wrote them commits,
+    so streams never see notifications that were rolled back.
+    """
+    backend = get_backend()
+    for notification, data in zip(
+        notifications, NotificationSerializer(notifications, many=True).data
+    ):
+        backend.publish(notification.user_id, notification_event(data))
@@ -0,0 +1,151 @@
+"""``Idempotency-Key`` support for the endpoints that post transactions.
+
+The first request with a key is handled normally and, when it succeeds, its
+response is stored in the same database transaction as the transfers it
+posted. Later requests with the same key (from the same user) get the stored
+response back without being validated or posted again. Two concurrent
+requests with the same key race on the unique index: the loser is rolled
+back and replays the winner's response.
+
+Stored responses are also kept in a per-process LRU cache, so most replays
+do not query the database. Keys expire after ``IDEMPOTENCY_KEY_TTL_HOURS``
+and are deleted by the ``sweep_idempotency_keys`` command.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = IdempotencyKey._meta.get_field("key").max_length
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used for a different request."
+    default_code = "idempotency_key_reused"
+
+
+class LRUCache:
+    """A thread-safe mapping that forgets its least recently used entries."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+cache = LRUCache(getattr(settings, "IDEMPOTENCY_CACHE_SIZE", 10000))
+
+
+def key_ttl():
+    return timedelta(hours=getattr(settings, "IDEMPOTENCY_KEY_TTL_HOURS", 24))
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.path}\n{body}".encode()).hexdigest()
+
+
+def lookup(user_id, key):
+    """The unexpired stored response for a key, or ``None``."""
+    record = cache.get((user_id, key))
+    if record is None:
+        record = IdempotencyKey.objects.filter(user_id=user_id, key=key).first()
+        if record is None:
+            return None
+    if record.created_at + key_ttl() <= timezone.now():
+        # Expired but not swept yet, the key can be used again
+        cache.pop((user_id, key))
+        IdempotencyKey.objects.filter(id=record.id).delete()
+        return None
+    cache.set((user_id, key), record)
+    return record
+
+
+def replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        raise IdempotencyKeyReused()
+    return Response(
+        record.response,
+        status=record.status_code,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+class IdempotentMixin:
+    """Honor the ``Idempotency-Key`` header on POST requests.
+
+    Like DRF's ``CreateAPIView``, ``post()`` hands the request to
+    ``create()``. Only successful responses are stored, so a request that
+    failed can be retried with the same key.
+    """
+
+    def post(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return self.create(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise ValidationError(
+                {HEADER: f"Expected between 1 and {MAX_KEY_LENGTH} characters."}
+            )
+
+        user_id = request.user.id
+        fingerprint = request_fingerprint(request)
+        record = lookup(user_id, key)
+        if record is not None:
+            return replay(record, fingerprint)
+
+        try:
+            with transaction.atomic():
+                response = self.create(request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    record = IdempotencyKey.objects.create(
+                        user_id=user_id,
+                        key=key,
+                        fingerprint=fingerprint,
+                        status_code=response.status_code,
+                        response=response.data,
+                    )
+                    transaction.on_commit(partial(cache.set, (user_id, key), record))
+        except IntegrityError:
+            # A concurrent request with the same key committed first
+            record = lookup(user_id, key)
+            if record is None:
+                raise
+            return replay(record, fingerprint)
+        return response
@@ -0,0 +1,179 @@
+"""Derive balances from the append-only ledger.
+
+A balance is the latest ``BalanceSnapshot`` of the account plus the signed sum
+of the ledger entries written after it, so reading any balance only scans the
+entries since the last snapshot instead of the whole history.
+"""
+
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    F,
+    Max,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+from .models import Account, BalanceSnapshot, LedgerEntry
+
+ZERO = Value(0, output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def signed_amount():
+    """Credits add to the balance, debits subtract from it."""
+    return Case(
+        When(entry_type=LedgerEntry.CREDIT, then=F("amount")),
+        default=-F("amount"),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def ledger_entries_for(txn):
+    """The ledger entries of a posted transaction, ready to be bulk-created."""
+    return [
+        LedgerEntry(
+            account_id=txn.sender_id,
+            transaction=txn,
+            entry_type=LedgerEntry.DEBIT,
+            amount=txn.amount,
+        ),
+        LedgerEntry(
+            account_id=txn.recipient_id,
+            transaction=txn,
+            entry_type=LedgerEntry.CREDIT,
+            amount=txn.amount,
+        ),
+    ]
+
+
+def _latest_snapshot():
+    return BalanceSnapshot.objects.filter(account=OuterRef("pk")).order_by(
+        "-last_entry_id", "-id"
+    )
+
+
+def with_derived_balance(accounts):
+    """Annotate ``derived_balance`` (and the snapshot it starts from) on accounts."""
+    latest_snapshot = _latest_snapshot()
+    entries_since = (
+        LedgerEntry.objects.filter(
+            account=OuterRef("pk"), id__gt=OuterRef("snapshot_entry_id")
+        )
+        .values("account")
+        .annotate(total=Sum(signed_amount()))
+        .values("total")
+    )
+    return accounts.annotate(
+        snapshot_balance=Coalesce(
+            Subquery(latest_snapshot.values("balance")[:1]), ZERO
+        ),
+        snapshot_entry_id=Coalesce(
+            Subquery(latest_snapshot.values("last_entry_id")[:1]), Value(0)
+        ),
+    ).annotate(
+        derived_balance=F("snapshot_balance") + Coalesce(Subquery(entries_since), ZERO)
+    )
+
+
+def balance_at(account, when):
+    """The balance of ``account`` right after everything posted up to ``when``."""
+    snapshot = (
+        BalanceSnapshot.objects.filter(account=account, timestamp__lte=when)
+        .order_by("-last_entry_id", "-id")
+        .first()
+    )
+    balance = snapshot.balance if snapshot else 0
+    entries = LedgerEntry.objects.filter(
+        account=account,
+        id__gt=snapshot.last_entry_id if snapshot else 0,
+        timestamp__lte=when,
+    )
+    return (
+        balance + entries.aggregate(total=Coalesce(Sum(signed_amount()), ZERO))["total"]
+    )
+
+
+def take_snapshots(account_ids):
+    """Snapshot the derived balance of the given accounts."""
+    last_entry = (
+        LedgerEntry.objects.filter(account=OuterRef("pk"))
+        .order_by("-id")
+        .values("id")[:1]
+    )
+    accounts = with_derived_balance(
+        Account.objects.filter(id__in=account_ids)
+    ).annotate(last_entry_id=Subquery(last_entry))
+    BalanceSnapshot.objects.bulk_create(
+        BalanceSnapshot(
+            account_id=account.id,
+            balance=account.derived_balance,
+            last_entry_id=account.last_entry_id or account.snapshot_entry_id,
+        )
+        for account in accounts
+    )
+
+
+def accounts_due_for_snapshot(min_entries):
+    """The accounts with at least ``min_entries`` ledger entries since their
+    latest snapshot, whose balances take longest to derive.
+    """
+    latest_snapshot = _latest_snapshot()
+    entries_since = (
+        LedgerEntry.objects.filter(
+            account=OuterRef("pk"), id__gt=OuterRef("snapshot_entry_id")
+        )
+        .values("account")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return (
+        Account.objects.annotate(
+            snapshot_entry_id=Coalesce(
+                Subquery(latest_snapshot.values("last_entry_id")[:1]), Value(0)
+            )
+        )
+        .annotate(entries_since=Coalesce(Subquery(entries_since), Value(0)))
+        .filter(entries_since__gte=min_entries)
+    )
+
+
+def open_snapshots(accounts, batch_size=None):
+    """Snapshot the opening balance of accounts created with ``bulk_create()``,
+    which skips ``Account.save()``.
+    """
+    BalanceSnapshot.objects.bulk_create(
+        (
+            BalanceSnapshot(account=account, balance=account.balance, last_entry_id=0)
+            for account in accounts
+        ),
+        batch_size=batch_size,
+    )
+
+
+def record_adjustments(accounts):
+    """Snapshot the current balance of accounts whose balance was set directly.
+
+    A balance written outside the posting engine (an admin edit, funding an
+    account) has no ledger entry, so it is anchored at the latest entry of
+    the account: the derived balance carries on from it instead of undoing it.
+    """
+    accounts = list(accounts)
+    last_entry_ids = dict(
+        LedgerEntry.objects.filter(account__in=[account.id for account in accounts])
+        .order_by()
+        .values_list("account")
+        .annotate(last=Max("id"))
+    )
+    BalanceSnapshot.objects.bulk_create(
+        BalanceSnapshot(
+            account_id=account.id,
+            balance=account.balance,
+            last_entry_id=last_entry_ids.get(account.id, 0),
+        )
+        for account in accounts
+    )
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from banking.outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Turn outbox events into notifications, in batches. Runs until "
+        "interrupted unless --once is given. Several workers may run at once."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the outbox is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the outbox is empty.",
+        )
+
+    def handle(self, *args, **options):
+        processed = 0
+        while True:
+            claimed = process_outbox(options["batch_size"])
+            processed += claimed
+            if claimed:
+                continue
+            if options["once"]:
+                break
+            # Idle: drop connections that are broken or past CONN_MAX_AGE
+            close_old_connections()
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} events."))
@@ -0,0 +1,66 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from banking.provisioning import provision, read_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users, each with an account, from a CSV file (with username, "
+        "password, email and account_type columns) or a JSON list of objects "
+        "with those keys. Passwords are hashed in a pool of processes; the "
+        "rows that fail are reported and do not stop the others."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The file to read, or - for stdin.")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "json"],
+            help="Format of the file (default: from its extension, else csv).",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Processes hashing passwords (default: one per CPU).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("json" if path.endswith(".json") else "csv")
+        file = (
+            sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+        )
+        try:
+            if file_format == "json":
+                try:
+                    rows = json.load(file)
+                except ValueError as e:
+                    raise CommandError(f"Invalid JSON: {e}")
+                if not isinstance(rows, list):
+                    raise CommandError("Expected a JSON list of users.")
+            else:
+                # Streamed, only a chunk of rows is in memory at a time
+                rows = read_csv(file)
+            start = time.perf_counter()
+            outcome = provision(rows, options["processes"], options["chunk_size"])
+            elapsed = time.perf_counter() - start
+        finally:
+            if file is not sys.stdin:
+                file.close()
+
+        for error in outcome["errors"]:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        message = (
+            f"Created {len(outcome['created'])} users with their accounts in "
+            f"{elapsed:.1f}s, {len(outcome['errors'])} rows failed."
+        )
+        self.stdout.write(
+            self.style.WARNING(message)
+            if outcome["errors"]
+            else self.style.SUCCESS(message)
+        )
@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from banking.models import Notification
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the read notifications older than the retention window, one "
+        "chunk per transaction so writers are never blocked for long. Meant to "
+        "run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "NOTIFICATION_RETENTION_DAYS", 90),
+            help="Keep read notifications this many days (default: %(default)s).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between chunks.",
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        expired = Notification.objects.filter(
+            is_read=True, timestamp__lt=cutoff
+        ).order_by("timestamp")
+
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    expired.values_list("id", flat=True)[: options["chunk_size"]]
+                )
+                if not ids:
+                    break
+                # Transactions keep their rows, their notification links are
+                # set to null
+                _, counts = Notification.objects.filter(id__in=ids).delete()
+                deleted += counts.get(Notification._meta.label, 0)
+            if options["pause"]:
+                time.sleep(options["pause"])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {deleted} read notifications older than {cutoff:%Y-%m-%d}."
+            )
+        )
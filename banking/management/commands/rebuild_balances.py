@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from banking import read_cache
+from banking.ledger import record_adjustments, take_snapshots, with_derived_balance
+from banking.models import Account
+
+CENT = Decimal("0.01")
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify Account.balance against the ledger (or rebuild it from the "
+        "ledger with --fix), processing the accounts in parallel chunks."
+    )
+
+    def add_arguments(self, parser):
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report accounts whose balance does not match the ledger "
+            "(the default).",
+        )
+        mode.add_argument(
+            "--fix",
+            action="store_true",
+            help="Overwrite the balances that do not match the ledger with the "
+            "derived balance.",
+        )
+        parser.add_argument(
+            "--snapshot",
+            action="store_true",
+            help="Snapshot the derived balances after rebuilding them (with "
+            "--fix). snapshot_balances takes snapshots without --fix.",
+        )
+        parser.add_argument(
+            "--baseline",
+            action="store_true",
+            help=(
+                "Snapshot the current balance of accounts that have no snapshot "
+                "yet (accounts created before the ledger existed)."
+            ),
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        if options["baseline"]:
+            self.baseline(options["chunk_size"])
+
+        account_ids = list(Account.objects.order_by("id").values_list("id", flat=True))
+        chunk_size = options["chunk_size"]
+        chunks = [
+            account_ids[start : start + chunk_size]
+            for start in range(0, len(account_ids), chunk_size)
+        ]
+
+        verify = not options["fix"]
+
+        def process(chunk):
+            return self.process_chunk(chunk, verify, options["snapshot"])
+
+        workers = options["workers"]
+        if not verify and connection.vendor == "sqlite":
+            # SQLite allows a single writer, parallel rebuilds would only fail
+            # with "database is locked"
+            workers = 1
+
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self.in_worker(process), chunks))
+        else:
+            results = [process(chunk) for chunk in chunks]
+
+        mismatches = [mismatch for result in results for mismatch in result]
+        for account_id, balance, derived in mismatches:
+            self.stdout.write(
+                f"Account {account_id}: balance {balance}, ledger {derived}"
+            )
+
+        if verify:
+            if mismatches:
+                raise CommandError(
+                    f"{len(mismatches)} of {len(account_ids)} accounts do not match the ledger."
+                )
+            self.stdout.write(
+                self.style.SUCCESS(f"All {len(account_ids)} accounts match the ledger.")
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Rebuilt {len(mismatches)} of {len(account_ids)} account balances."
+                )
+            )
+
+    def in_worker(self, function):
+        # Worker threads open their own connection, close it when done
+        def run(chunk):
+            try:
+                return function(chunk)
+            finally:
+                connection.close()
+
+        return run
+
+    def process_chunk(self, account_ids, verify, snapshot):
+        with transaction.atomic():
+            accounts = with_derived_balance(
+                Account.objects.filter(id__in=account_ids)
+            ).only("id", "user", "balance")
+            if not verify:
+                accounts = accounts.select_for_update(of=("self",))
+
+            mismatches = []
+            changed = []
+            for account in accounts:
+                # SQLite sums decimals as floats, round back to cents
+                derived = account.derived_balance.quantize(CENT)
+                if account.balance != derived:
+                    mismatches.append((account.id, account.balance, derived))
+                    account.balance = derived
+                    changed.append(account)
+
+            if not verify:
+                Account.objects.bulk_update(changed, ["balance"])
+                read_cache.invalidate_accounts(changed)
+                if snapshot:
+                    take_snapshots(account_ids)
+        return mismatches
+
+    def baseline(self, chunk_size):
+        accounts = list(
+            Account.objects.filter(balance_snapshots__isnull=True).only("id", "balance")
+        )
+        for start in range(0, len(accounts), chunk_size):
+            record_adjustments(accounts[start : start + chunk_size])
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from banking.aggregates import daily_totals_from_transactions
+from banking.models import DailyTotal
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every daily total from the transactions, e.g. for "
+        "transactions posted before the totals existed. Run it while no "
+        "transactions are being posted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            totals = daily_totals_from_transactions()
+            DailyTotal.objects.all().delete()
+            DailyTotal.objects.bulk_create(totals, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(totals)} daily totals."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from banking.ledger import accounts_due_for_snapshot, take_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot the balances derived from the ledger of the accounts with at "
+        "least --min-entries ledger entries since their latest snapshot, so "
+        "reading a balance only sums the entries after it. Balances are not "
+        "changed. Meant to run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-entries",
+            type=int,
+            default=100,
+            help="Ledger entries since the latest snapshot that make an account "
+            "due (default: %(default)s).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["min_entries"] < 1:
+            raise CommandError("--min-entries must be at least 1.")
+        account_ids = list(
+            accounts_due_for_snapshot(options["min_entries"])
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        chunk_size = options["chunk_size"]
+        for start in range(0, len(account_ids), chunk_size):
+            # One transaction per chunk, so postings are never blocked for long
+            with transaction.atomic():
+                take_snapshots(account_ids[start : start + chunk_size])
+        self.stdout.write(
+            self.style.SUCCESS(f"Snapshotted {len(account_ids)} account balances.")
+        )
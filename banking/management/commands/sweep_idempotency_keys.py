@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from banking.idempotency import key_ttl
+from banking.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the expired Idempotency-Key responses, one chunk per "
+        "transaction. Meant to run periodically (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        expired = IdempotencyKey.objects.filter(
+            created_at__lte=timezone.now() - key_ttl()
+        ).order_by("created_at")
+
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(
+                    expired.values_list("id", flat=True)[: options["chunk_size"]]
+                )
+                if not ids:
+                    break
+                deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted} expired idempotency keys.")
+        )
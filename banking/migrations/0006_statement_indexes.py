@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("banking", "0005_notification_transaction_recipient_notification_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transaction",
+            name="recipient_notification",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="recipient_transactions",
+                to="banking.notification",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="sender_notification",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="sender_transactions",
+                to="banking.notification",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="transaction_type",
+            field=models.CharField(
+                choices=[
+                    ("withdraw", "Withdraw"),
+                    ("pay_bill", "Pay Bill"),
+                    ("transfer", "Transfer Money"),
+                ],
+                default="withdraw",
+                max_length=50,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                condition=models.Q(("is_read", False)),
+                fields=["user", "-timestamp"],
+                name="notification_unread_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["sender", "-timestamp", "-id"],
+                name="transaction_sender_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["recipient", "-timestamp", "-id"],
+                name="transaction_recipient_time_idx",
+            ),
+        ),
+    ]
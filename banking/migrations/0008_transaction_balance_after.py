@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("banking", "0007_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="recipient_balance_after",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="sender_balance_after",
+            field=models.DecimalField(
+                blank=True, decimal_places=2, max_digits=10, null=True
+            ),
+        ),
+    ]
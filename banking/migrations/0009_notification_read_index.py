@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("banking", "0008_transaction_balance_after"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                condition=models.Q(("is_read", True)),
+                fields=["timestamp"],
+                name="notification_read_idx",
+            ),
+        ),
+    ]
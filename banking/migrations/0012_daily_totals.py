@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("banking", "0011_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyTotal",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "transaction_type",
+                    models.CharField(
+                        choices=[
+                            ("withdraw", "Withdraw"),
+                            ("pay_bill", "Pay Bill"),
+                            ("transfer", "Transfer Money"),
+                        ],
+                        max_length=50,
+                    ),
+                ),
+                (
+                    "sent_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                ("sent_count", models.PositiveIntegerField(default=0)),
+                (
+                    "received_amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=16),
+                ),
+                ("received_count", models.PositiveIntegerField(default=0)),
+                (
+                    "account",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_totals",
+                        to="banking.account",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="dailytotal",
+            constraint=models.UniqueConstraint(
+                fields=("account", "day", "transaction_type"), name="daily_total_unique"
+            ),
+        ),
+    ]
@@ -1,6 +1,12 @@
-from django.db import models
+from django.db import models, transaction as db_transaction
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from bankly import routers
+
+from . import read_cache
 
 
 class Account(models.Model):
@@ -17,24 +23,83 @@ class Account(models.Model):
     )
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    def save(self, *args, **kwargs):
+        from .ledger import record_adjustments
+
+        created = not self.pk
+        update_fields = kwargs.get("update_fields")
+        with db_transaction.atomic():
+            adjusted = False
+            if not created and (update_fields is None or "balance" in update_fields):
+                stored = (
+                    Account.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list("balance", flat=True)
+                    .first()
+                )
+                adjusted = stored != self.balance
+            super().save(*args, **kwargs)
+            if created:
+                # Anchor the opening balance so it can be derived from the ledger
+                BalanceSnapshot.objects.create(
+                    account=self, balance=self.balance, last_entry_id=0
+                )
+            elif adjusted:
+                # A balance set directly (not by the posting engine) has no
+                # ledger entry, so it is anchored as an adjustment
+                record_adjustments([self])
+        read_cache.invalidate_accounts([self])
+        routers.pin([self.user_id])
+
 
 class Notification(models.Model):
+    class Meta:
+        indexes = [
+            # Serves the unread notification list without touching read rows
+            models.Index(
+                fields=["user", "-timestamp"],
+                condition=Q(is_read=False),
+                name="notification_unread_idx",
+            ),
+            # Lets the purge find old read notifications chunk by chunk
+            models.Index(
+                fields=["timestamp"],
+                condition=Q(is_read=True),
+                name="notification_read_idx",
+            ),
+        ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Set by the outbox worker, so a redelivered event cannot notify twice
+    key = models.CharField(
+        max_length=100, unique=True, null=True, blank=True, editable=False
+    )
 
     def __str__(self):
         return self.message
 
     def mark_as_read(self):
         self.is_read = True
-        self.save()
+        self.save(update_fields=["is_read"])
 
 
 class Transaction(models.Model):
     class Meta:
         ordering = ["-timestamp"]
+        indexes = [
+            # Each branch of the statement query is an ordered scan of one of these
+            models.Index(
+                fields=["sender", "-timestamp", "-id"],
+                name="transaction_sender_time_idx",
+            ),
+            models.Index(
+                fields=["recipient", "-timestamp", "-id"],
+                name="transaction_recipient_time_idx",
+            ),
+        ]
 
     WITHDRAW = "withdraw"
     PAY_BILL = "pay_bill"
@@ -62,6 +127,15 @@ class Transaction(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    # Balances right after the transaction was posted, stored so a statement
+    # page can show a running balance without recomputing it per row
+    sender_balance_after = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+    )
+    recipient_balance_after = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True
+    )
+
     sender_notification = models.ForeignKey(
         Notification,
         on_delete=models.SET_NULL,
@@ -77,56 +151,166 @@ class Transaction(models.Model):
         related_name="recipient_transactions",
     )
 
+    def balance_after(self, account_id):
+        """The balance of ``account_id`` (the sender or recipient) after this transaction."""
+        if account_id == self.sender_id:
+            return self.sender_balance_after
+        if account_id == self.recipient_id:
+            return self.recipient_balance_after
+        return None
+
     def save(self, *args, **kwargs):
-        if self.transaction_type == self.WITHDRAW and self.recipient is not None:
-            raise ValidationError(
-                "Recipient must be empty for 'withdraw' transactions."
-            )
-
-        if self.transaction_type == self.PAY_BILL and (
-            self.recipient is None or self.recipient.account_type != Account.COMPANY
-        ):
-            raise ValidationError(
-                "Recipient must be a company account for 'pay_bill' transactions."
-            )
-
-        if self.transaction_type == self.TRANSFER and (
-            self.recipient is None or self.recipient == ""
-        ):
-            raise ValidationError(
-                "Recipient must be specified for 'transfer' transactions."
-            )
-
-        if self.sender.balance - self.amount < 0:
-            raise ValidationError(
-                "Sender must have sufficient balance to perform the transaction."
-            )
-
-        if self.recipient is not None and self.sender == self.recipient:
-            raise ValidationError("Self transactions are not allowed")
+        if not self.pk:
+            # New transactions move money, so they go through the posting
+            # engine which locks the accounts and writes the row atomically.
+            from .posting import post_transaction
 
-        created = not self.pk
+            post_transaction(self, **kwargs)
+            return
 
-        if created:
-            sender_message = f"You sent {self.amount} EGP in a transaction."
-            sender_notification = Notification.objects.create(
-                user=self.sender.user, message=sender_message
-            )
-
-            self.sender_notification = sender_notification
-            if self.recipient:
-                recipient_message = f"You received {self.amount} EGP in a transaction."
-                recipient_notification = Notification.objects.create(
-                    user=self.recipient.user, message=recipient_message
-                )
+        from .posting import validate_transaction_rules
+
+        validate_transaction_rules(
+            self.transaction_type, self.amount, self.sender, self.recipient
+        )
+        super().save(*args, **kwargs)
+        read_cache.invalidate_accounts(
+            account for account in (self.sender, self.recipient) if account is not None
+        )
+
+
+class DailyTotal(models.Model):
+    """What an account sent and received in one day with one transaction type.
+
+    Kept up to date by the posting engine (see ``banking/aggregates.py``), so
+    account summaries cost one row per day instead of one per transaction.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account", "day", "transaction_type"],
+                name="daily_total_unique",
+            ),
+        ]
+
+    # The unique constraint already indexes the account
+    account = models.ForeignKey(
+        Account,
+        related_name="daily_totals",
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    day = models.DateField()
+    transaction_type = models.CharField(
+        max_length=50, choices=Transaction.TRANSACTION_TYPE_CHOICES
+    )
+    sent_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    received_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    received_count = models.PositiveIntegerField(default=0)
+
+
+class LedgerEntry(models.Model):
+    """One side of a posted transaction. Entries are append-only.
 
-                self.recipient_notification = recipient_notification
+    Every transaction writes a debit for the sender and a credit for the
+    recipient, so the entries of a transaction always sum to zero. A null
+    account is the world outside the bank (the other side of a withdrawal).
+    """
 
-            # Update the balances
-            self.sender.balance -= self.amount
-            self.sender.save()
-            if self.recipient:
-                self.recipient.balance += self.amount
-                self.recipient.save()
+    class Meta:
+        indexes = [
+            models.Index(fields=["account", "id"], name="ledger_account_idx"),
+        ]
+
+    DEBIT = "debit"
+    CREDIT = "credit"
+    ENTRY_TYPE_CHOICES = [
+        (DEBIT, "Debit"),
+        (CREDIT, "Credit"),
+    ]
+
+    account = models.ForeignKey(
+        Account,
+        related_name="ledger_entries",
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+    )
+    transaction = models.ForeignKey(
+        Transaction, related_name="ledger_entries", on_delete=models.CASCADE
+    )
+    entry_type = models.CharField(max_length=10, choices=ENTRY_TYPE_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    timestamp = models.DateTimeField(auto_now_add=True)
 
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValidationError("Ledger entries cannot be modified.")
         super().save(*args, **kwargs)
+
+
+class BalanceSnapshot(models.Model):
+    """The balance of an account after all its ledger entries up to ``last_entry_id``."""
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["account", "-last_entry_id"], name="snapshot_account_idx"
+            ),
+        ]
+
+    account = models.ForeignKey(
+        Account, related_name="balance_snapshots", on_delete=models.CASCADE
+    )
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    last_entry_id = models.BigIntegerField()
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+
+class OutboxEvent(models.Model):
+    """A side effect of a committed write, waiting for the outbox worker.
+
+    Events are written in the same database transaction as the change that
+    caused them and deleted once handled (see ``banking/outbox.py``).
+    """
+
+    TRANSACTION_POSTED = "transaction_posted"
+    TOPIC_CHOICES = [
+        (TRANSACTION_POSTED, "Transaction posted"),
+    ]
+
+    topic = models.CharField(max_length=50, choices=TOPIC_CHOICES)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Failed handling attempts, events that keep failing are left aside
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+
+class IdempotencyKey(models.Model):
+    """The response to a POST made with an ``Idempotency-Key`` header.
+
+    Replays of the request get this response back instead of being handled
+    again (see ``banking/idempotency.py``).
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "key"], name="idempotency_key_unique"
+            ),
+        ]
+        indexes = [
+            # Serves the sweep of expired keys
+            models.Index(fields=["created_at"], name="idempotency_key_created_idx"),
+        ]
+
+    # The unique constraint already indexes the user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    key = models.CharField(max_length=255)
+    # Hash of the request, a key cannot be reused for a different one
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
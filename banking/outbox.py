@@ -0,0 +1,171 @@
+"""Transactional outbox for the notifications of posted transactions.
+
+With ``NOTIFICATION_OUTBOX_SYNC`` off, posting a transaction only writes a
+compact ``OutboxEvent`` row in its database transaction. The
+``process_outbox`` command later turns batches of events into notifications
+and deletes the events. Delivery is at least once: an event can be handled
+again (a second worker on a database without ``SKIP LOCKED``, or a crash
+before the batch commits), so every notification carries a key made from its
+transaction and role, and existing keys are never written twice.
+
+With ``NOTIFICATION_OUTBOX_SYNC`` on (the default, used by the tests) the
+notifications are written while posting, as before.
+"""
+
+import logging
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+
+from .events import publish_notifications
+from .models import Notification, OutboxEvent, Transaction
+
+logger = logging.getLogger(__name__)
+
+# Events that failed this many times are left in the table for inspection
+MAX_ATTEMPTS = 5
+
+
+def notifications_are_deferred():
+    return not getattr(settings, "NOTIFICATION_OUTBOX_SYNC", True)
+
+
+def transaction_notifications(amount, sender_user_id, recipient_user_id):
+    """The ``(role, notification)`` pairs of a transaction, sender first."""
+    notifications = [
+        (
+            "sender",
+            Notification(
+                user_id=sender_user_id,
+                message=f"You sent {amount} EGP in a transaction.",
+            ),
+        )
+    ]
+    if recipient_user_id is not None:
+        notifications.append(
+            (
+                "recipient",
+                Notification(
+                    user_id=recipient_user_id,
+                    message=f"You received {amount} EGP in a transaction.",
+                ),
+            )
+        )
+    return notifications
+
+
+def notify(transactions):
+    """Write the notifications of transactions that are being posted.
+
+    Runs before the transaction rows are written, so they are saved with
+    their notification links.
+    """
+    notifications = []
+    for txn in transactions:
+        for role, notification in transaction_notifications(
+            txn.amount,
+            txn.sender.user_id,
+            txn.recipient.user_id if txn.recipient is not None else None,
+        ):
+            setattr(txn, f"{role}_notification", notification)
+            notifications.append(notification)
+    Notification.objects.bulk_create(notifications)
+    transaction.on_commit(partial(publish_notifications, notifications))
+
+
+def enqueue(transactions):
+    """Write one outbox event per posted transaction."""
+    OutboxEvent.objects.bulk_create(
+        OutboxEvent(
+            topic=OutboxEvent.TRANSACTION_POSTED,
+            payload={
+                "transaction": txn.id,
+                "amount": str(txn.amount),
+                "sender_user": txn.sender.user_id,
+                "recipient_user": (
+                    txn.recipient.user_id if txn.recipient is not None else None
+                ),
+            },
+        )
+        for txn in transactions
+    )
+
+
+def handle_transactions_posted(events):
+    """Create and link the notifications of a batch of posted transactions."""
+    specs = []
+    for event in events:
+        payload = event.payload
+        txn = Transaction(id=payload["transaction"])
+        for role, notification in transaction_notifications(
+            payload["amount"], payload["sender_user"], payload["recipient_user"]
+        ):
+            notification.key = f"transaction:{txn.id}:{role}"
+            specs.append((txn, role, notification))
+
+    existing = dict(
+        Notification.objects.filter(
+            key__in=[notification.key for _, _, notification in specs]
+        ).values_list("key", "id")
+    )
+    created = []
+    linked = {}
+    for txn, role, notification in specs:
+        if notification.key in existing:
+            setattr(txn, f"{role}_notification_id", existing[notification.key])
+        else:
+            setattr(txn, f"{role}_notification", notification)
+            created.append(notification)
+        linked[txn.id] = txn
+
+    Notification.objects.bulk_create(created)
+    Transaction.objects.bulk_update(
+        linked.values(), ["sender_notification", "recipient_notification"]
+    )
+    transaction.on_commit(partial(publish_notifications, created))
+
+
+HANDLERS = {
+    OutboxEvent.TRANSACTION_POSTED: handle_transactions_posted,
+}
+
+
+def handle(events):
+    by_topic = defaultdict(list)
+    for event in events:
+        by_topic[event.topic].append(event)
+    for topic, topic_events in by_topic.items():
+        HANDLERS[topic](topic_events)
+    OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+
+def process_outbox(batch_size=500):
+    """Handle the oldest pending events, returns how many were claimed.
+
+    The batch is handled in one go; if that fails, each event is retried on
+    its own so one bad event does not hold back the others.
+    """
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(attempts__lt=MAX_ATTEMPTS)
+            .order_by("id")[:batch_size]
+        )
+        if not events:
+            return 0
+        try:
+            with transaction.atomic():
+                handle(events)
+        except Exception:
+            for event in events:
+                try:
+                    with transaction.atomic():
+                        handle([event])
+                except Exception:
+                    logger.exception("Outbox event %d failed", event.id)
+                    OutboxEvent.objects.filter(id=event.id).update(
+                        attempts=event.attempts + 1
+                    )
+    return len(events)
@@ -1,11 +1,16 @@
 from rest_framework import permissions
 from .models import Account
 
+
 # The authenticated user must be the owner of the account in use
 class IsAccountOwner(permissions.BasePermission):
-    def has_permission(self, request, view):
+    def get_queryset(self, request, view):
         account_id = view.kwargs.get("account_id")
-        account_exists = Account.objects.filter(
-            id=account_id, user=request.user
-        ).exists()
-        return account_exists
+        return Account.objects.filter(id=account_id, user_id=request.user.id)
+
+    def has_permission(self, request, view):
+        return self.get_queryset(request, view).exists()
+
+    # Used by the async views
+    async def ahas_permission(self, request, view):
+        return await self.get_queryset(request, view).aexists()
@@ -0,0 +1,183 @@
+"""Posting engine that moves money between accounts.
+
+A transaction is posted inside a single database transaction: the accounts
+involved are locked in ascending id order (so two concurrent transfers between
+the same pair of accounts always acquire their locks in the same order and
+cannot deadlock), the sender is debited with a conditional
+``UPDATE ... SET balance = balance - X WHERE balance >= X`` and the
+notifications (or the outbox events that stand for them, see
+``banking/outbox.py``), the transaction row, its ledger entries and the daily
+totals of both accounts are written before the block commits.
+"""
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction as db_transaction
+from django.db.models import F
+
+from bankly import routers
+
+from . import outbox, read_cache
+from .aggregates import record_daily_totals
+from .ledger import ledger_entries_for
+from .models import Account, LedgerEntry, Transaction
+
+INSUFFICIENT_BALANCE_MESSAGE = (
+    "Sender must have sufficient balance to perform the transaction."
+)
+NON_POSITIVE_AMOUNT_MESSAGE = "Amount must be greater than zero."
+
+
+def validate_transaction_rules(transaction_type, amount, sender, recipient):
+    """Check the business rules of a transaction that do not depend on balances."""
+    # A negative amount would pass the balance check and move money backwards
+    if amount <= 0:
+        raise ValidationError(NON_POSITIVE_AMOUNT_MESSAGE)
+
+    if transaction_type == Transaction.WITHDRAW and recipient is not None:
+        raise ValidationError("Recipient must be empty for 'withdraw' transactions.")
+
+    if transaction_type == Transaction.PAY_BILL and (
+        recipient is None or recipient.account_type != Account.COMPANY
+    ):
+        raise ValidationError(
+            "Recipient must be a company account for 'pay_bill' transactions."
+        )
+
+    if transaction_type == Transaction.TRANSFER and recipient is None:
+        raise ValidationError(
+            "Recipient must be specified for 'transfer' transactions."
+        )
+
+    if recipient is not None and sender.id == recipient.id:
+        raise ValidationError("Self transactions are not allowed")
+
+
+def lock_accounts(account_ids):
+    """Lock the given accounts in ascending id order and return them by id."""
+    accounts = (
+        Account.objects.select_for_update()
+        .filter(id__in=set(account_ids))
+        .order_by("id")
+    )
+    return {account.id: account for account in accounts}
+
+
+def post_transaction(txn, **save_kwargs):
+    """Validate and post a new transaction, updating both balances atomically.
+
+    Raises ``ValidationError`` (and leaves the database untouched) when a
+    business rule is violated or the sender cannot cover the amount.
+    """
+    with db_transaction.atomic():
+        accounts = lock_accounts(
+            account_id
+            for account_id in (txn.sender_id, txn.recipient_id)
+            if account_id is not None
+        )
+        sender = accounts[txn.sender_id]
+        recipient = accounts.get(txn.recipient_id)
+        validate_transaction_rules(txn.transaction_type, txn.amount, sender, recipient)
+
+        debited = Account.objects.filter(id=sender.id, balance__gte=txn.amount).update(
+            balance=F("balance") - txn.amount
+        )
+        if not debited:
+            raise ValidationError(INSUFFICIENT_BALANCE_MESSAGE)
+        sender.balance -= txn.amount
+
+        if recipient is not None:
+            Account.objects.filter(id=recipient.id).update(
+                balance=F("balance") + txn.amount
+            )
+            recipient.balance += txn.amount
+
+        txn.sender = sender
+        txn.recipient = recipient
+        txn.sender_balance_after = sender.balance
+        txn.recipient_balance_after = recipient.balance if recipient else None
+        deferred = outbox.notifications_are_deferred()
+        if not deferred:
+            outbox.notify([txn])
+        # Transaction.save() routes new rows back here, so write the row with
+        # the plain model save.
+        models.Model.save(txn, **save_kwargs)
+        LedgerEntry.objects.bulk_create(ledger_entries_for(txn))
+        record_daily_totals([txn])
+        if deferred:
+            # The event refers to the transaction, so it is written last
+            outbox.enqueue([txn])
+        read_cache.invalidate_accounts(accounts.values())
+        routers.pin(account.user_id for account in accounts.values())
+
+    return txn
+
+
+def post_transactions(transactions, atomic=True):
+    """Post a batch of new transactions with a constant number of queries.
+
+    The accounts are fetched (and locked) with one query, every transaction is
+    checked against the running balances in order, and the balances,
+    notifications and transaction rows are written with bulk queries.
+
+    Returns a list aligned with ``transactions`` that holds either the posted
+    transaction or the ``ValidationError`` that rejected it. When ``atomic``
+    is true nothing is written unless every transaction is valid.
+    """
+    with db_transaction.atomic():
+        accounts = lock_accounts(
+            account_id
+            for txn in transactions
+            for account_id in (txn.sender_id, txn.recipient_id)
+            if account_id is not None
+        )
+
+        results = []
+        for txn in transactions:
+            sender = accounts.get(txn.sender_id)
+            recipient = accounts.get(txn.recipient_id)
+            try:
+                if sender is None:
+                    raise ValidationError("Sender account does not exist.")
+                validate_transaction_rules(
+                    txn.transaction_type, txn.amount, sender, recipient
+                )
+                if sender.balance < txn.amount:
+                    raise ValidationError(INSUFFICIENT_BALANCE_MESSAGE)
+            except ValidationError as e:
+                results.append(e)
+                continue
+
+            sender.balance -= txn.amount
+            txn.sender_balance_after = sender.balance
+            if recipient is not None:
+                recipient.balance += txn.amount
+                txn.recipient_balance_after = recipient.balance
+            txn.sender = sender
+            txn.recipient = recipient
+            results.append(txn)
+
+        posted = [result for result in results if isinstance(result, Transaction)]
+        if not posted or (atomic and len(posted) != len(results)):
+            return results
+
+        touched = {txn.sender_id for txn in posted} | {
+            txn.recipient_id for txn in posted if txn.recipient_id is not None
+        }
+        Account.objects.bulk_update(
+            [accounts[account_id] for account_id in sorted(touched)], ["balance"]
+        )
+
+        deferred = outbox.notifications_are_deferred()
+        if not deferred:
+            outbox.notify(posted)
+        Transaction.objects.bulk_create(posted)
+        LedgerEntry.objects.bulk_create(
+            entry for txn in posted for entry in ledger_entries_for(txn)
+        )
+        record_daily_totals(posted)
+        if deferred:
+            outbox.enqueue(posted)
+        read_cache.invalidate_accounts(accounts[account_id] for account_id in touched)
+        routers.pin(accounts[account_id].user_id for account_id in touched)
+
+    return results
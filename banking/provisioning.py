@@ -0,0 +1,220 @@
+"""Bulk creation of users, each with an account, for onboarding clients.
+
+Rows are ``{"username", "password", "email", "account_type"}`` dicts, read
+from JSON or CSV. They are handled ``chunk_size`` at a time: the chunk is
+validated (including against the usernames taken by earlier rows and in the
+database), its passwords are hashed in a pool of workers, and its users,
+accounts and opening balance snapshots are inserted with ``bulk_create()``
+in one transaction. Invalid rows are reported with their errors and do not
+stop the others.
+
+Hashing is what takes time (PBKDF2 costs hundreds of milliseconds of CPU per
+password), so every worker of the pool hashes its share of each chunk while
+this thread only validates and inserts. The ``provision_users`` command
+starts a pool of processes for its run. The endpoint shares one small pool
+of threads between its requests instead (``hashlib`` releases the GIL while
+it hashes), so a request never forks the server.
+"""
+
+import csv
+import io
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from bankly.metrics import registry
+from bankly.workers import setup_worker
+
+from .ledger import open_snapshots
+from .models import Account
+from .serializers import ProvisionRowSerializer
+
+
+class CSVParser(BaseParser):
+    """A CSV body with a header line, parsed into a list of row dicts.
+
+    Empty cells are left out of their row, so they get the defaults of the
+    missing fields.
+    """
+
+    media_type = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            text = stream.read().decode("utf-8-sig")
+            return list(read_csv(io.StringIO(text, newline="")))
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise ParseError(f"CSV parse error - {e}")
+
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        yield {key: value for key, value in row.items() if key and value}
+
+
+def hash_passwords(passwords):
+    # Entry point of the worker processes, which never touch the database
+    setup_worker()
+    return [make_password(password) for password in passwords]
+
+
+def hashing_processes():
+    return getattr(settings, "PROVISIONING_HASHING_PROCESSES", None) or os.cpu_count()
+
+
+HASHING_THREADS = getattr(settings, "PROVISIONING_HASHING_THREADS", 4)
+
+# The threads of the endpoint, started on first use
+threads = ThreadPoolExecutor(
+    max_workers=HASHING_THREADS, thread_name_prefix="provisioning-hashing"
+)
+
+
+class Provisioner:
+    """Provision rows chunk by chunk.
+
+    The passwords are hashed by the ``workers`` of ``executor`` when one is
+    given, which is left running. Otherwise a pool of ``processes`` (by
+    default ``PROVISIONING_HASHING_PROCESSES``, one per CPU) is kept for the
+    run; with 1 the passwords are hashed in this process.
+    """
+
+    def __init__(self, processes=None, chunk_size=1000, executor=None, workers=1):
+        self.executor = executor
+        self.owns_executor = executor is None
+        if self.owns_executor:
+            workers = processes or hashing_processes()
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # Usernames of the rows seen so far, which later rows cannot reuse
+        self.seen = set()
+        self.created = []
+        self.errors = []
+
+    def __enter__(self):
+        if self.owns_executor and self.workers > 1:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.owns_executor and self.executor is not None:
+            self.executor.shutdown()
+
+    def run(self, rows):
+        """Provision the ``rows`` (any iterable) and return the outcome:
+        ``{"created": [...], "errors": [...]}``, with the 1-based position of
+        every row in the input.
+        """
+        rows = enumerate(rows, start=1)
+        while chunk := list(itertools.islice(rows, self.chunk_size)):
+            self.provision_chunk(chunk)
+        self.errors.sort(key=lambda error: error["row"])
+        return {"created": self.created, "errors": self.errors}
+
+    def provision_chunk(self, chunk):
+        valid = []
+        for position, row in chunk:
+            serializer = ProvisionRowSerializer(data=row)
+            if not serializer.is_valid():
+                self.error(position, serializer.errors)
+                continue
+            username = serializer.validated_data["username"]
+            if username in self.seen:
+                self.error(position, {"username": ["Duplicate username in the input."]})
+                continue
+            self.seen.add(username)
+            valid.append((position, serializer.validated_data))
+
+        valid = self.drop_taken(valid)
+        if not valid:
+            return
+        hashes = self.hash([data["password"] for _, data in valid])
+        for (_, data), password in zip(valid, hashes):
+            data["password"] = password
+        try:
+            self.insert(valid)
+        except IntegrityError:
+            # A username was taken since drop_taken() checked, try again
+            # without the rows that now clash
+            self.insert(self.drop_taken(valid))
+
+    def drop_taken(self, valid):
+        taken = set(
+            User.objects.filter(
+                username__in=[data["username"] for _, data in valid]
+            ).values_list("username", flat=True)
+        )
+        kept = []
+        for position, data in valid:
+            if data["username"] in taken:
+                self.error(
+                    position,
+                    {"username": ["A user with that username already exists."]},
+                )
+            else:
+                kept.append((position, data))
+        return kept
+
+    def hash(self, passwords):
+        if self.executor is None:
+            return hash_passwords(passwords)
+        # One slice per worker, so each gets a single task
+        size = -(-len(passwords) // self.workers)
+        slices = [
+            passwords[start : start + size] for start in range(0, len(passwords), size)
+        ]
+        return list(
+            itertools.chain.from_iterable(self.executor.map(hash_passwords, slices))
+        )
+
+    def insert(self, valid):
+        if not valid:
+            return
+        users = [
+            User(
+                username=data["username"],
+                email=data["email"],
+                password=data["password"],
+            )
+            for _, data in valid
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            accounts = Account.objects.bulk_create(
+                Account(user=user, account_type=data["account_type"])
+                for user, (_, data) in zip(users, valid)
+            )
+            open_snapshots(accounts)
+        registry.increment("provisioned_users_total", len(users))
+        self.created += [
+            {
+                "row": position,
+                "user": user.id,
+                "username": user.username,
+                "account": account.id,
+            }
+            for (position, _), user, account in zip(valid, users, accounts)
+        ]
+
+    def error(self, position, errors):
+        registry.increment("provisioning_errors_total")
+        self.errors.append({"row": position, "errors": errors})
+
+
+def provision(rows, processes=None, chunk_size=1000):
+    """Provision ``rows`` with a ``Provisioner`` and return its outcome."""
+    with Provisioner(processes, chunk_size) as provisioner:
+        return provisioner.run(rows)
+
+
+def provision_in_threads(rows):
+    """``provision()`` with the passwords hashed by the shared ``threads``."""
+    with Provisioner(executor=threads, workers=HASHING_THREADS) as provisioner:
+        return provisioner.run(rows)
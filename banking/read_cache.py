@@ -0,0 +1,141 @@
+"""Versioned read-through cache for the account list and statement first pages.
+
+Every cached response belongs to a scope (the accounts of a user, or the
+statement of an account) that has a version counter in the cache. Entries are
+stored with the version that was current before their queries ran, and are
+only served while it still is, so invalidating a scope is a single ``incr``
+however many responses were cached for it. Writers bump the versions of the
+scopes they touch when they write and again once their transaction commits:
+a response read from the database in between is stored under a version that
+is already gone.
+
+The cache is the ``READ_CACHE_ALIAS`` entry of ``CACHES``, a local-memory LRU
+by default. With several worker processes it must be a shared backend (like
+Redis), or a worker would keep serving what another one invalidated. Setting
+``READ_CACHE_ALIAS`` to ``None`` turns the cache off.
+"""
+
+import hashlib
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from bankly.metrics import registry
+
+
+def get_cache():
+    alias = getattr(settings, "READ_CACHE_ALIAS", None)
+    return caches[alias] if alias else None
+
+
+def user_scope(user_id):
+    return f"user:{user_id}"
+
+
+def account_scope(account_id):
+    return f"account:{account_id}"
+
+
+def version_key(scope):
+    return f"version:{scope}"
+
+
+def new_version():
+    # A counter that was evicted restarts above every value it had before, so
+    # entries stored under the old counter can never match again
+    return time.time_ns()
+
+
+def bump(scopes):
+    cache = get_cache()
+    if cache is None:
+        return
+    for scope in scopes:
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            cache.add(version_key(scope), new_version(), timeout=None)
+
+
+def invalidate(scopes):
+    """Bump the versions of ``scopes`` now and once the transaction commits."""
+    scopes = set(scopes)
+    bump(scopes)
+    transaction.on_commit(partial(bump, scopes))
+
+
+def invalidate_accounts(accounts):
+    """Invalidate what is cached for ``accounts`` and the lists of their users."""
+    accounts = list(accounts)
+    invalidate(
+        [account_scope(account.id) for account in accounts]
+        + [user_scope(account.user_id) for account in accounts]
+    )
+
+
+class CachedRead:
+    """One cacheable response: ``get()`` it, or ``set()`` it after a miss.
+
+    ``name`` labels the ``<name>_cache_hits_total`` and
+    ``<name>_cache_misses_total`` metrics and ``variant`` tells apart the
+    responses of a scope (like the query string of a statement page).
+    """
+
+    def __init__(self, cache, name, scope, variant=""):
+        self.cache = cache
+        self.name = name
+        self.version_key = version_key(scope)
+        digest = hashlib.sha1(variant.encode()).hexdigest()
+        self.key = f"{name}:{scope}:{digest}"
+        self.version = None
+
+    def found(self, entries):
+        self.version = entries.get(self.version_key)
+        entry = entries.get(self.key)
+        if self.version is not None and entry is not None and entry[0] == self.version:
+            registry.increment(f"{self.name}_cache_hits_total")
+            return True, entry[1]
+        registry.increment(f"{self.name}_cache_misses_total")
+        return False, None
+
+    def get(self):
+        """``(True, data)`` on a hit, ``(False, None)`` on a miss."""
+        hit, data = self.found(self.cache.get_many([self.version_key, self.key]))
+        if self.version is None:
+            # The version must exist before the queries run, or a bump in
+            # between would go to a counter this entry does not see
+            self.cache.add(self.version_key, new_version(), timeout=None)
+            self.version = self.cache.get(self.version_key)
+        return hit, data
+
+    async def aget(self):
+        hit, data = self.found(await self.cache.aget_many([self.version_key, self.key]))
+        if self.version is None:
+            await self.cache.aadd(self.version_key, new_version(), timeout=None)
+            self.version = await self.cache.aget(self.version_key)
+        return hit, data
+
+    def set(self, data):
+        if self.version is not None:
+            self.cache.set(self.key, (self.version, data))
+
+    async def aset(self, data):
+        if self.version is not None:
+            await self.cache.aset(self.key, (self.version, data))
+
+
+def cached_read(name, scope, variant=""):
+    """A ``CachedRead``, or ``None`` when the cache is off."""
+    cache = get_cache()
+    if cache is None:
+        return None
+    return CachedRead(cache, name, scope, variant)
+
+
+def clear():
+    cache = get_cache()
+    if cache is not None:
+        cache.clear()
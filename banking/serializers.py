@@ -1,3 +1,6 @@
+from decimal import Decimal
+
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from rest_framework import serializers
 from rest_framework.exceptions import PermissionDenied
 from .models import Account, Transaction, Notification
@@ -15,14 +18,43 @@ class AccountRetrievalSerializer(serializers.ModelSerializer):
         fields = ["id", "user", "balance", "account_type"]
 
 
+class AccountField(serializers.PrimaryKeyRelatedField):
+    """Account reference that is resolved from ``context["accounts"]`` if given.
+
+    Batch requests load every referenced account with a single query and pass
+    them in the serializer context, so validating many items does not cost a
+    lookup per item.
+    """
+
+    def to_internal_value(self, data):
+        accounts = self.context.get("accounts")
+        if accounts is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            account = accounts.get(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if account is None:
+            self.fail("does_not_exist", pk_value=data)
+        return account
+
+
 class TransactionSerializer(serializers.ModelSerializer):
+    sender = AccountField(queryset=Account.objects.all())
+    recipient = AccountField(
+        queryset=Account.objects.all(), allow_null=True, required=False
+    )
+
     class Meta:
         model = Transaction
         fields = ["id", "transaction_type", "amount", "recipient", "sender"]
+        extra_kwargs = {"amount": {"min_value": Decimal("0.01")}}
 
     def validate_sender(self, value):
         user = self.context["request"].user
-        if value.user != user:
+        if value.user_id != user.id:
             raise PermissionDenied(
                 "Sender account does not belong to the authenticated user."
             )
@@ -39,9 +71,8 @@ class TransactionSerializer(serializers.ModelSerializer):
                 {"recipient": "Recipient must be empty for 'withdraw' transactions."}
             )
 
-        if (
-            transaction_type == Transaction.PAY_BILL
-            and recipient.account_type != Account.COMPANY
+        if transaction_type == Transaction.PAY_BILL and (
+            recipient is None or recipient.account_type != Account.COMPANY
         ):
             raise serializers.ValidationError(
                 {
@@ -70,7 +101,65 @@ class TransactionSerializer(serializers.ModelSerializer):
         return data
 
 
+class StatementSerializer(TransactionSerializer):
+    """A transaction as a line of the statement of ``context["account_id"]``."""
+
+    balance_after = serializers.SerializerMethodField()
+
+    class Meta(TransactionSerializer.Meta):
+        fields = TransactionSerializer.Meta.fields + ["timestamp", "balance_after"]
+
+    def get_balance_after(self, obj):
+        balance = obj.balance_after(self.context["account_id"])
+        return None if balance is None else f"{balance:.2f}"
+
+
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = "__all__"
+        exclude = ["key"]
+
+
+class MarkNotificationsReadSerializer(serializers.Serializer):
+    """The unread notifications of the user to mark as read.
+
+    Either a list of ``ids`` or a watermark: the notifications up to (and
+    including) ``up_to_id`` and/or created before ``until``.
+    """
+
+    max_ids = 1000
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+        allow_empty=False,
+        max_length=max_ids,
+    )
+    up_to_id = serializers.IntegerField(required=False)
+    until = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if not data:
+            raise serializers.ValidationError("Expected ids, up_to_id or until.")
+        if "ids" in data and len(data) > 1:
+            raise serializers.ValidationError(
+                "ids cannot be combined with up_to_id or until."
+            )
+        return data
+
+
+class ProvisionRowSerializer(serializers.Serializer):
+    """A user to provision with their account, see ``banking/provisioning.py``.
+
+    The username is only checked for its format here, the provisioner checks
+    that it is free for the whole batch with one query per chunk.
+    """
+
+    username = serializers.CharField(
+        max_length=150, validators=[UnicodeUsernameValidator()]
+    )
+    password = serializers.CharField()
+    email = serializers.EmailField(required=False, allow_blank=True, default="")
+    account_type = serializers.ChoiceField(
+        choices=Account.USER_TYPE_CHOICES, default=Account.INDIVIDUAL
+    )
@@ -0,0 +1,147 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+
+from .models import Transaction
+
+EXPORT_FIELDS = [
+    "id",
+    "timestamp",
+    "transaction_type",
+    "amount",
+    "sender",
+    "recipient",
+    "balance_after",
+]
+
+
+class StatementQuery:
+    """The transactions of one account, selected as a ``UNION ALL`` of two scans.
+
+    ``Q(sender=account) | Q(recipient=account)`` cannot be served by the
+    ``(sender, -timestamp)`` and ``(recipient, -timestamp)`` indexes, so the
+    sent and received transactions are selected separately and combined.
+    Filters are applied to both branches. When the result is sliced, each
+    branch is ordered and limited to the end of the slice on its own, so
+    every index scan stops early and only the rows that can make it into the
+    slice are merged, ordered and sliced again.
+
+    Only the part of the ``QuerySet`` API used by the statement views is
+    supported: ``filter()``, ``order_by()``, ``values_list()``, ``using()``,
+    ``count()``, slicing and (async) iteration. Self transactions are not
+    allowed, so a row can never appear in both branches.
+    """
+
+    model = Transaction
+    default_ordering = ("-timestamp", "-id")
+
+    def __init__(self, account_id):
+        self.sent = Transaction.objects.filter(sender_id=account_id).order_by()
+        self.received = Transaction.objects.filter(recipient_id=account_id).order_by()
+        self.ordering = self.default_ordering
+        self.fields = None
+
+    def _clone(self, **changes):
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__, **changes)
+        return clone
+
+    def filter(self, *args, **kwargs):
+        return self._clone(
+            sent=self.sent.filter(*args, **kwargs),
+            received=self.received.filter(*args, **kwargs),
+        )
+
+    def order_by(self, *fields):
+        return self._clone(ordering=fields or self.default_ordering)
+
+    def values_list(self, *fields):
+        return self._clone(fields=fields)
+
+    def using(self, alias):
+        return self._clone(
+            sent=self.sent.using(alias), received=self.received.using(alias)
+        )
+
+    def branch(self, queryset, limit):
+        if limit is not None:
+            queryset = queryset.order_by(*self.ordering)[:limit]
+            features = connections[queryset.db].features
+            if not features.supports_slicing_ordering_in_compound:
+                # SQLite can't order or limit the SELECTs of a compound
+                # statement, so the branch selects the rows whose ids an
+                # ordered and limited subquery returns
+                queryset = (
+                    self.model.objects.using(queryset.db)
+                    .filter(pk__in=queryset.values("pk"))
+                    .order_by()
+                )
+        if self.fields is not None:
+            queryset = queryset.values_list(*self.fields)
+        return queryset
+
+    def combined(self, limit=None):
+        """The ``UNION ALL`` of both branches, each limited to ``limit`` rows."""
+        return (
+            self.branch(self.sent, limit)
+            .union(self.branch(self.received, limit), all=True)
+            .order_by(*self.ordering)
+        )
+
+    def count(self):
+        return self.sent.count() + self.received.count()
+
+    def __getitem__(self, k):
+        limit = k.stop if isinstance(k, slice) else k + 1
+        return self.combined(limit)[k]
+
+    def __iter__(self):
+        return iter(self.combined())
+
+    def __aiter__(self):
+        return aiter(self.combined())
+
+
+class Echo:
+    """File-like object that hands back what is written, for ``csv.writer``."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(account_id, statement, chunk_size=2000):
+    """Yield the statement of ``account_id`` as tuples of ``EXPORT_FIELDS``.
+
+    Rows are fetched as tuples with a chunked iterator, so memory use does not
+    depend on the length of the statement.
+    """
+    rows = statement.values_list(
+        "id",
+        "timestamp",
+        "transaction_type",
+        "amount",
+        "sender_id",
+        "recipient_id",
+        "sender_balance_after",
+        "recipient_balance_after",
+    )
+    for row in rows.combined().iterator(chunk_size=chunk_size):
+        *fields, sender_balance_after, recipient_balance_after = row
+        yield (
+            *fields,
+            sender_balance_after if row[4] == account_id else recipient_balance_after,
+        )
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
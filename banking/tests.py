@@ -1,12 +1,40 @@
-from django.test import TestCase
-from django.urls import reverse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+import django.test
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.urls import resolve, reverse
 from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 from rest_framework import status
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
 from .models import Account, Transaction
 from .views import BankStatementListView, UnreadNotificationListView
-from .models import Notification
+from .async_views import AsyncBankStatementListView
+from .events import DatabaseBackend, Event, hub
+from .idempotency import cache as idempotency_cache
+from . import read_cache
+from .outbox import MAX_ATTEMPTS, process_outbox
+from .models import Notification, LedgerEntry, OutboxEvent, IdempotencyKey
+from .models import BalanceSnapshot, DailyTotal
+from .ledger import balance_at, take_snapshots, with_derived_balance
+from .posting import post_transaction, post_transactions
+from .statements import StatementQuery
+from bankly import routers
+from bankly.asgi import application
+from bankly.metrics import registry
 
 
 # Unit testing
@@ -49,6 +77,8 @@ class TestAccountCreation(TestCase):
 # Unit testing
 class TestAccountRetrieval(TestCase):
     def setUp(self):
+        # The user without accounts reuses the id of users cached by other tests
+        read_cache.clear()
         self.client = APIClient()
 
         self.user_with_no_accounts = User.objects.create_user(
@@ -174,6 +204,23 @@ class TestTransactionConstraintsAPI(TestCase):
             "Sender must have sufficient balance to perform the transaction.",
         )
 
+    # Unit testing
+    def test_transaction_with_non_positive_amount(self):
+        self.client.force_authenticate(user=self.sender)
+        for amount in ("-100", "0"):
+            data = {
+                "transaction_type": Transaction.TRANSFER,
+                "amount": amount,
+                "recipient": self.recipient_account.id,
+                "sender": self.sender_account.id,
+            }
+            response = self.client.post(reverse("transaction_create"), data)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("amount", response.data)
+        self.sender_account.refresh_from_db()
+        self.assertEqual(self.sender_account.balance, 100)
+        self.assertEqual(Transaction.objects.count(), 0)
+
     # Unit testing
     def test_transaction_with_unauthorized_sender(self):
         unauthorized_user = User.objects.create_user(
@@ -306,6 +353,23 @@ class TestTransactionConstraintsModel(TestCase):
         ):
             self.create_transaction(data)
 
+    # Unit testing
+    def test_transaction_with_non_positive_amount(self):
+        self.recipient_account.balance = 100
+        self.recipient_account.save()
+        data = {
+            "transaction_type": Transaction.TRANSFER,
+            "amount": -100,
+            "recipient": self.recipient_account,
+            "sender": self.sender_account,
+        }
+        with self.assertRaisesMessage(
+            ValidationError, "Amount must be greater than zero."
+        ):
+            self.create_transaction(data)
+        self.recipient_account.refresh_from_db()
+        self.assertEqual(self.recipient_account.balance, 100)
+
     # Unit testing
     def test_self_transaction(self):
         data = {
@@ -449,6 +513,16 @@ class NotificationTestCase(TestCase):
         notification.mark_as_read()
         self.assertTrue(notification.is_read)
 
+    def test_mark_as_read_only_writes_is_read(self):
+        notification = Notification.objects.create(
+            user=self.user, message="Test notification"
+        )
+        notification.message = "Changed in memory"
+        notification.mark_as_read()
+        notification.refresh_from_db()
+        self.assertTrue(notification.is_read)
+        self.assertEqual(notification.message, "Test notification")
+
     def test_notification_str_representation(self):
         notification = Notification.objects.create(
             user=self.user, message="Test notification"
@@ -516,3 +590,1728 @@ class TransactionTestCase(TestCase):
         self.assertEqual(
             self.account1.balance, 500
         )  # Account1 balance decreased by 500
+
+
+# Unit testing
+class TransactionPostingTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="user1", password="testpassword1"
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="testpassword2"
+        )
+
+        self.account1 = Account.objects.create(user=self.user1, balance=100)
+        self.account2 = Account.objects.create(user=self.user2, balance=0)
+
+    def test_posting_links_notifications(self):
+        transaction = post_transaction(
+            Transaction(
+                sender=self.account1,
+                recipient=self.account2,
+                transaction_type=Transaction.TRANSFER,
+                amount=40,
+            )
+        )
+        self.assertEqual(transaction.sender_notification.user, self.user1)
+        self.assertEqual(transaction.recipient_notification.user, self.user2)
+        self.assertEqual(transaction.sender.balance, 60)
+        self.assertEqual(transaction.recipient.balance, 40)
+
+    def test_stale_balance_is_rejected(self):
+        # Another request spent the money after this instance was loaded
+        Account.objects.filter(id=self.account1.id).update(balance=10)
+        with self.assertRaisesMessage(
+            ValidationError,
+            "Sender must have sufficient balance to perform the transaction.",
+        ):
+            post_transaction(
+                Transaction(
+                    sender=self.account1,
+                    recipient=self.account2,
+                    transaction_type=Transaction.TRANSFER,
+                    amount=50,
+                )
+            )
+
+        self.account1.refresh_from_db()
+        self.account2.refresh_from_db()
+        self.assertEqual(self.account1.balance, 10)
+        self.assertEqual(self.account2.balance, 0)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.assertEqual(Notification.objects.count(), 0)
+
+
+# Integration testing
+class TransactionBatchAPITestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.company = User.objects.create_user(
+            "company", "company@example.com", "testpassword123"
+        )
+        self.employee1 = User.objects.create_user(
+            "employee1", "employee1@example.com", "testpassword123"
+        )
+        self.employee2 = User.objects.create_user(
+            "employee2", "employee2@example.com", "testpassword123"
+        )
+
+        self.company_account = Account.objects.create(
+            user=self.company, account_type=Account.COMPANY, balance=100
+        )
+        self.employee1_account = Account.objects.create(user=self.employee1)
+        self.employee2_account = Account.objects.create(user=self.employee2)
+        self.client.force_authenticate(user=self.company)
+
+    def payroll(self, amount1, amount2):
+        return [
+            {
+                "transaction_type": Transaction.TRANSFER,
+                "amount": amount1,
+                "sender": self.company_account.id,
+                "recipient": self.employee1_account.id,
+            },
+            {
+                "transaction_type": Transaction.TRANSFER,
+                "amount": amount2,
+                "sender": self.company_account.id,
+                "recipient": self.employee2_account.id,
+            },
+        ]
+
+    def test_atomic_batch(self):
+        response = self.client.post(
+            reverse("transaction_batch_create"),
+            {"transactions": self.payroll(60, 40)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 2)
+        self.company_account.refresh_from_db()
+        self.employee2_account.refresh_from_db()
+        self.assertEqual(self.company_account.balance, 0)
+        self.assertEqual(self.employee2_account.balance, 40)
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 4)
+
+    def test_atomic_batch_with_insufficient_balance(self):
+        # Each item is affordable on its own but not both together
+        response = self.client.post(
+            reverse("transaction_batch_create"),
+            {"transactions": self.payroll(60, 50)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(
+            response.data[1]["non_field_errors"][0],
+            "Sender must have sufficient balance to perform the transaction.",
+        )
+        self.company_account.refresh_from_db()
+        self.assertEqual(self.company_account.balance, 100)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_batch_with_non_positive_amount(self):
+        response = self.client.post(
+            reverse("transaction_batch_create"),
+            {"transactions": self.payroll(60, "-50")},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("amount", response.data[1])
+
+        # The posting engine rejects the item too, and the batch with it
+        transactions = [
+            Transaction(
+                sender=self.company_account,
+                recipient=recipient,
+                transaction_type=Transaction.TRANSFER,
+                amount=amount,
+            )
+            for recipient, amount in (
+                (self.employee1_account, 60),
+                (self.employee2_account, -50),
+            )
+        ]
+        results = post_transactions(transactions)
+        self.assertIsInstance(results[0], Transaction)
+        self.assertEqual(results[1].messages, ["Amount must be greater than zero."])
+
+        self.company_account.refresh_from_db()
+        self.employee2_account.refresh_from_db()
+        self.assertEqual(self.company_account.balance, 100)
+        self.assertEqual(self.employee2_account.balance, 0)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_per_item_batch(self):
+        transactions = self.payroll(60, 50)
+        transactions.append({"transaction_type": Transaction.TRANSFER, "amount": 1})
+        response = self.client.post(
+            reverse("transaction_batch_create"),
+            {"transactions": transactions, "atomic": False},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data[0]["status"], status.HTTP_201_CREATED)
+        self.assertEqual(response.data[0]["data"]["amount"], "60.00")
+        self.assertEqual(response.data[1]["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[2]["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertTrue("sender" in response.data[2]["errors"])
+        self.company_account.refresh_from_db()
+        self.assertEqual(self.company_account.balance, 40)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_batch_with_unauthorized_sender(self):
+        transactions = self.payroll(10, 10)
+        transactions[1]["sender"] = self.employee1_account.id
+        transactions[1]["recipient"] = self.company_account.id
+        response = self.client.post(
+            reverse("transaction_batch_create"),
+            {"transactions": transactions},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_batch_query_count_does_not_grow(self):
+        # Including the single upsert of the daily totals
+        with self.assertNumQueries(9):
+            self.client.post(
+                reverse("transaction_batch_create"),
+                {"transactions": self.payroll(1, 1) * 10},
+                format="json",
+            )
+
+
+# Integration testing
+class StatementPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user1 = User.objects.create_user(
+            username="user1", password="testpassword1"
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="testpassword2"
+        )
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(
+            user=self.user2, account_type=Account.COMPANY, balance=1000
+        )
+
+        for amount in range(1, 6):
+            Transaction.objects.create(
+                sender=self.account1,
+                recipient=self.account2,
+                transaction_type=Transaction.TRANSFER,
+                amount=amount,
+            )
+        Transaction.objects.create(
+            sender=self.account1,
+            recipient=self.account2,
+            transaction_type=Transaction.PAY_BILL,
+            amount=6,
+        )
+        self.client.force_authenticate(user=self.user1)
+
+    def test_walk_pages_with_cursor(self):
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account1.id})
+        response = self.client.get(url, {"page_size": 4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        amounts = [row["amount"] for row in response.data["results"]]
+        self.assertEqual(amounts, ["6.00", "5.00", "4.00", "3.00"])
+
+        response = self.client.get(response.data["next"])
+        amounts = [row["amount"] for row in response.data["results"]]
+        self.assertEqual(amounts, ["2.00", "1.00"])
+        self.assertIsNone(response.data["next"])
+
+    def test_unpaginated_by_default(self):
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account1.id})
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 6)
+
+    def test_invalid_cursor(self):
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account1.id})
+        response = self.client.get(url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_filters(self):
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account1.id})
+        response = self.client.get(url, {"transaction_type": Transaction.PAY_BILL})
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["amount"], "6.00")
+
+        response = self.client.get(url, {"until": "2000-01-01"})
+        self.assertEqual(len(response.data), 0)
+        response = self.client.get(url, {"since": "2000-01-01T00:00:00Z"})
+        self.assertEqual(len(response.data), 6)
+
+        response = self.client.get(url, {"since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"transaction_type": "refund"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paginate_notifications(self):
+        response = self.client.get(reverse("unread_notifications"), {"page_size": 5})
+        self.assertEqual(len(response.data["results"]), 5)
+        self.assertEqual(
+            response.data["results"][0]["message"],
+            "You sent 6 EGP in a transaction.",
+        )
+        response = self.client.get(response.data["next"])
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["next"])
+
+
+# Unit testing
+class StatementQueryTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="user1", password="testpassword1"
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="testpassword2"
+        )
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(user=self.user2, balance=1000)
+
+        for sender, recipient in [
+            (self.account1, self.account2),
+            (self.account2, self.account1),
+            (self.account1, None),
+        ]:
+            Transaction.objects.create(
+                sender=sender,
+                recipient=recipient,
+                transaction_type=(
+                    Transaction.TRANSFER if recipient else Transaction.WITHDRAW
+                ),
+                amount=10,
+            )
+
+    def test_sent_and_received_are_combined(self):
+        statement = StatementQuery(self.account1.id)
+        self.assertEqual(statement.count(), 3)
+        self.assertEqual(
+            [transaction.id for transaction in statement],
+            list(
+                Transaction.objects.order_by("-timestamp", "-id").values_list(
+                    "id", flat=True
+                )
+            ),
+        )
+        self.assertEqual(len(statement.filter(recipient__isnull=True)[:10]), 1)
+
+    def test_branches_use_indexes(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Query plan assertions are written for SQLite")
+        sql, params = StatementQuery(self.account1.id)[:50].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("transaction_sender_time_idx", plan)
+        self.assertIn("transaction_recipient_time_idx", plan)
+        # Each branch stops at the end of the slice
+        self.assertEqual(sql.count("LIMIT 50"), 3)
+
+    def test_slices_of_branches(self):
+        statement = StatementQuery(self.account1.id)
+        ids = list(
+            Transaction.objects.order_by("-timestamp", "-id").values_list(
+                "id", flat=True
+            )
+        )
+        self.assertEqual([transaction.id for transaction in statement[:2]], ids[:2])
+        self.assertEqual([transaction.id for transaction in statement[1:3]], ids[1:3])
+        self.assertEqual(statement[2].id, ids[2])
+        rows = statement.values_list("id", "timestamp")[:2]
+        self.assertEqual([pk for pk, _ in rows], ids[:2])
+
+
+# Unit testing and Integration testing
+class LedgerTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="user1", password="testpassword1"
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="testpassword2"
+        )
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(user=self.user2, balance=0)
+
+    def transfer(self, amount):
+        return Transaction.objects.create(
+            sender=self.account1,
+            recipient=self.account2,
+            transaction_type=Transaction.TRANSFER,
+            amount=amount,
+        )
+
+    def test_entries_balance_out(self):
+        transaction = self.transfer(100)
+        entries = transaction.ledger_entries.order_by("id")
+        self.assertEqual(
+            [(entry.account_id, entry.entry_type) for entry in entries],
+            [
+                (self.account1.id, LedgerEntry.DEBIT),
+                (self.account2.id, LedgerEntry.CREDIT),
+            ],
+        )
+        with self.assertRaises(ValidationError):
+            entries[0].save()
+
+    def test_derived_balance_matches(self):
+        self.transfer(100)
+        self.transfer(50)
+        accounts = with_derived_balance(Account.objects.order_by("id"))
+        self.assertEqual([account.derived_balance for account in accounts], [850, 150])
+
+    def test_balance_at(self):
+        self.transfer(100)
+        middle = timezone.now()
+        take_snapshots([self.account1.id])
+        self.transfer(50)
+        self.assertEqual(balance_at(self.account1, middle), 900)
+        self.assertEqual(balance_at(self.account1, timezone.now()), 850)
+
+    def test_rebuild_balances_command(self):
+        self.transfer(100)
+        Account.objects.filter(id=self.account1.id).update(balance=5)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_balances", "--verify", stdout=StringIO())
+
+        # Verifying is the default, it never writes
+        with self.assertRaises(CommandError):
+            call_command("rebuild_balances", stdout=StringIO())
+        self.account1.refresh_from_db()
+        self.assertEqual(self.account1.balance, 5)
+
+        call_command("rebuild_balances", "--fix", "--workers", "1", stdout=StringIO())
+        self.account1.refresh_from_db()
+        self.assertEqual(self.account1.balance, 900)
+        call_command("rebuild_balances", "--verify", stdout=StringIO())
+
+    def test_snapshot_balances_command(self):
+        for _ in range(3):
+            self.transfer(100)
+        Account.objects.filter(id=self.account1.id).update(balance=5)
+
+        call_command("snapshot_balances", "--min-entries", "3", stdout=StringIO())
+        # Balances are never written, only snapshotted from the ledger
+        self.account1.refresh_from_db()
+        self.assertEqual(self.account1.balance, 5)
+        Account.objects.filter(id=self.account1.id).update(balance=700)
+        for account, balance in ((self.account1, 700), (self.account2, 300)):
+            snapshot = account.balance_snapshots.order_by("-id").first()
+            self.assertEqual(snapshot.balance, balance)
+            self.assertEqual(
+                snapshot.last_entry_id,
+                account.ledger_entries.order_by("-id").first().id,
+            )
+
+        # Nothing was posted since, so no account is due
+        snapshots = BalanceSnapshot.objects.count()
+        call_command("snapshot_balances", "--min-entries", "1", stdout=StringIO())
+        self.transfer(100)
+        call_command("snapshot_balances", "--min-entries", "2", stdout=StringIO())
+        self.assertEqual(BalanceSnapshot.objects.count(), snapshots)
+        self.assertEqual(balance_at(self.account2, timezone.now()), 400)
+
+    def test_balance_set_with_save_is_an_adjustment(self):
+        # Funding an account directly, like the admin does
+        self.account2.balance = 1000
+        self.account2.save()
+        self.transfer(100)
+        self.assertEqual(
+            self.account2.balance_snapshots.order_by("-id").first().balance, 1000
+        )
+
+        call_command("rebuild_balances", stdout=StringIO())
+        call_command("rebuild_balances", "--fix", "--workers", "1", stdout=StringIO())
+        self.account2.refresh_from_db()
+        self.assertEqual(self.account2.balance, 1100)
+
+        # Saving without changing the balance takes no snapshot
+        snapshots = self.account2.balance_snapshots.count()
+        self.account2.account_type = Account.COMPANY
+        self.account2.save()
+        self.assertEqual(self.account2.balance_snapshots.count(), snapshots)
+
+
+class SeedBankCommandTestCase(TestCase):
+    def seed(self, *args):
+        call_command(
+            "seed_bank",
+            "--users",
+            "10",
+            "--accounts",
+            "20",
+            "--transactions",
+            "300",
+            "--company-ratio",
+            "0.2",
+            *args,
+            stdout=StringIO(),
+        )
+
+    def test_seeded_data_is_consistent(self):
+        self.seed("--shards", "2", "--chunk-size", "100")
+
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Account.objects.count(), 20)
+        self.assertGreater(Transaction.objects.count(), 250)
+        self.assertFalse(Account.objects.filter(balance__lt=0).exists())
+        self.assertEqual(LedgerEntry.objects.count(), 2 * Transaction.objects.count())
+        self.assertEqual(
+            sum(DailyTotal.objects.values_list("sent_count", flat=True)),
+            Transaction.objects.count(),
+        )
+        self.assertFalse(
+            Transaction.objects.filter(
+                transaction_type=Transaction.PAY_BILL,
+                recipient__account_type=Account.INDIVIDUAL,
+            ).exists()
+        )
+        call_command("rebuild_balances", "--verify", stdout=StringIO())
+
+        # The running balance of the latest transaction is the current balance
+        account = Account.objects.order_by("-balance").first()
+        latest = StatementQuery(account.id)[0]
+        self.assertEqual(latest.balance_after(account.id), account.balance)
+        self.assertEqual(
+            Notification.objects.filter(user=account.user).count(),
+            Transaction.objects.filter(sender__user=account.user).count()
+            + Transaction.objects.filter(recipient__user=account.user).count(),
+        )
+
+        # New rows get ids after the ones the seeder wrote itself
+        last_id = Notification.objects.order_by("-id").values_list("id", flat=True)[0]
+        notification = Notification.objects.create(user=account.user, message="New")
+        self.assertGreater(notification.id, last_id)
+
+    def test_seeding_is_deterministic(self):
+        def amounts():
+            return list(
+                Transaction.objects.order_by("id").values_list(
+                    "transaction_type", "amount"
+                )
+            )
+
+        self.seed("--seed", "7")
+        first = amounts()
+        Transaction.objects.all().delete()
+        self.seed("--seed", "7", "--prefix", "again")
+        self.assertEqual(amounts(), first)
+
+        with self.assertRaises(CommandError):
+            self.seed("--prefix", "again")
+
+
+# Integration testing
+class StatementBalanceAfterTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user1 = User.objects.create_user(
+            username="user1", password="testpassword1"
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="testpassword2"
+        )
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(user=self.user2, balance=2000)
+
+        Transaction.objects.create(
+            sender=self.account1,
+            recipient=self.account2,
+            transaction_type=Transaction.TRANSFER,
+            amount=200,
+        )
+        Transaction.objects.create(
+            sender=self.account2,
+            recipient=self.account1,
+            transaction_type=Transaction.TRANSFER,
+            amount=300,
+        )
+        Transaction.objects.create(
+            sender=self.account1,
+            transaction_type=Transaction.WITHDRAW,
+            amount=150,
+        )
+
+    def test_running_balance(self):
+        self.client.force_authenticate(user=self.user1)
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account1.id})
+        response = self.client.get(url)
+        self.assertEqual(
+            [row["balance_after"] for row in response.data],
+            ["950.00", "1100.00", "800.00"],
+        )
+
+        self.client.force_authenticate(user=self.user2)
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account2.id})
+        response = self.client.get(url)
+        self.assertEqual(
+            [row["balance_after"] for row in response.data], ["1900.00", "2200.00"]
+        )
+
+    def test_statement_page_is_one_query(self):
+        view = BankStatementListView.as_view()
+        request = APIRequestFactory().get(
+            f"/accounts/{self.account1.id}/statements/", {"page_size": 2}
+        )
+        force_authenticate(request, user=self.user1)
+        # One query for the ownership check and one for the page
+        with self.assertNumQueries(2):
+            response = view(request, account_id=self.account1.id)
+        self.assertEqual(response.data["results"][0]["balance_after"], "950.00")
+
+
+# Integration testing
+class StatementExportTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+        self.user1 = User.objects.create_user(
+            username="user1", password="testpassword1"
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="testpassword2"
+        )
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(user=self.user2, balance=2000)
+
+        Transaction.objects.create(
+            sender=self.account1,
+            recipient=self.account2,
+            transaction_type=Transaction.TRANSFER,
+            amount=200,
+        )
+        Transaction.objects.create(
+            sender=self.account2,
+            recipient=self.account1,
+            transaction_type=Transaction.TRANSFER,
+            amount=300,
+        )
+        self.client.force_authenticate(user=self.user1)
+
+    def export(self, export_format, **params):
+        url = reverse(
+            "bank_statement_export",
+            kwargs={"account_id": self.account1.id, "export_format": export_format},
+        )
+        return self.client.get(url, params)
+
+    def test_csv_export(self):
+        response = self.export("csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0],
+            "id,timestamp,transaction_type,amount,sender,recipient,balance_after",
+        )
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith(",200.00,1,2,800.00"))
+        self.assertTrue(lines[2].endswith(",300.00,2,1,1100.00"))
+
+    def test_ndjson_export(self):
+        response = self.export("ndjson")
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual([row["amount"] for row in rows], ["200.00", "300.00"])
+        self.assertEqual(rows[1]["balance_after"], "1100.00")
+
+    def test_export_filters_and_formats(self):
+        response = self.export("ndjson", until="2000-01-01")
+        self.assertEqual(b"".join(response.streaming_content), b"")
+        self.assertEqual(self.export("xml").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_export_of_another_users_account(self):
+        self.client.force_authenticate(user=self.user2)
+        self.assertEqual(self.export("csv").status_code, status.HTTP_403_FORBIDDEN)
+
+
+# Integration testing
+@override_settings(ROOT_URLCONF="bankly.asgi_urls")
+class AsyncReadViewsTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="user1", password="testpassword1"
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="testpassword2"
+        )
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(user=self.user2, balance=1000)
+        for amount in (100, 200, 300):
+            Transaction.objects.create(
+                sender=self.account1,
+                recipient=self.account2,
+                transaction_type=Transaction.TRANSFER,
+                amount=amount,
+            )
+        self.client = AsyncClient()
+        self.headers = {"authorization": f"Bearer {AccessToken.for_user(self.user1)}"}
+
+    def get(self, url, data=None, headers=None):
+        return self.client.get(url, data, headers=headers or self.headers)
+
+    def test_views_are_async(self):
+        self.assertTrue(AsyncBankStatementListView.view_is_async)
+
+    def test_async_views_are_only_routed_under_asgi(self):
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account1.id})
+        self.assertIs(resolve(url).func.view_class, AsyncBankStatementListView)
+        self.assertIs(
+            resolve(url, urlconf="bankly.urls").func.view_class, BankStatementListView
+        )
+        self.assertEqual(application.request_class.urlconf, "bankly.asgi_urls")
+
+    async def test_account_list(self):
+        response = await self.get(reverse("account_list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            json.loads(response.content),
+            [
+                {
+                    "id": self.account1.id,
+                    "user": self.user1.id,
+                    "balance": "400.00",
+                    "account_type": Account.INDIVIDUAL,
+                }
+            ],
+        )
+
+    async def test_statement_pages(self):
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account1.id})
+        response = await self.get(url, {"page_size": 2})
+        page = json.loads(response.content)
+        self.assertEqual(
+            [row["balance_after"] for row in page["results"]], ["400.00", "700.00"]
+        )
+
+        response = await self.get(page["next"])
+        page = json.loads(response.content)
+        self.assertEqual([row["amount"] for row in page["results"]], ["100.00"])
+        self.assertIsNone(page["next"])
+
+        response = await self.get(url, {"since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_unread_notifications(self):
+        response = await self.get(reverse("unread_notifications"))
+        self.assertEqual(
+            [row["message"] for row in json.loads(response.content)],
+            [f"You sent {amount} EGP in a transaction." for amount in (100, 200, 300)],
+        )
+
+    async def test_authentication_and_permissions(self):
+        url = reverse("bank_statement_list", kwargs={"account_id": self.account2.id})
+        response = await self.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = await self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = await self.get(
+            reverse("account_list"), headers={"authorization": "Bearer not-a-token"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(json.loads(response.content)["code"], "token_not_valid")
+
+
+# Integration testing
+# Committed rows, for the thread of the backend (this module has its own
+# TransactionTestCase)
+@override_settings(NOTIFICATION_POLL_SECONDS=0.01)
+class DatabaseEventBackendTestCase(django.test.TransactionTestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user("user1", password="testpassword1")
+        self.user2 = User.objects.create_user("user2", password="testpassword2")
+        self.backend = DatabaseBackend(hub)
+
+    def tearDown(self):
+        hub.subscriptions.clear()
+        # The poller stops once no stream is open
+        thread = self.backend.thread
+        if thread is not None:
+            thread.join(timeout=5)
+        self.assertIsNone(self.backend.thread)
+
+    async def test_notifications_of_other_processes_are_delivered(self):
+        subscription = self.backend.subscribe(self.user1.id)
+        # Written without publishing them, like by another worker
+        notification = await Notification.objects.acreate(
+            user=self.user1, message="Hello"
+        )
+        await Notification.objects.acreate(user=self.user2, message="Not yours")
+
+        event = await subscription.get(5)
+        self.assertEqual(event.id, notification.id)
+        self.assertEqual(json.loads(event.data)["message"], "Hello")
+        # Read again within the look back, but delivered once
+        with self.assertRaises(asyncio.TimeoutError):
+            await subscription.get(0.2)
+        subscription.close()
+
+    @override_settings(NOTIFICATION_OUTBOX_SYNC=False)
+    async def test_outbox_notifications_reach_the_streams(self):
+        # As deployed: the notifications are written by process_outbox
+        subscription = self.backend.subscribe(self.user2.id)
+
+        def post_and_process():
+            sender = Account.objects.create(user=self.user1, balance=100)
+            recipient = Account.objects.create(user=self.user2)
+            Transaction.objects.create(
+                sender=sender,
+                recipient=recipient,
+                transaction_type=Transaction.TRANSFER,
+                amount=40,
+            )
+            self.assertFalse(Notification.objects.exists())
+            process_outbox()
+
+        await sync_to_async(post_and_process)()
+        event = await subscription.get(5)
+        self.assertEqual(
+            json.loads(event.data)["message"], "You received 40 EGP in a transaction."
+        )
+        subscription.close()
+
+
+# Integration testing
+class NotificationStreamTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(
+            username="user1", password="testpassword1"
+        )
+        self.user2 = User.objects.create_user(
+            username="user2", password="testpassword2"
+        )
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(user=self.user2, balance=1000)
+        self.client = AsyncClient()
+        self.url = reverse("notification_stream")
+
+    def tearDown(self):
+        # The test client does not close the streams left open
+        hub.subscriptions.clear()
+
+    def headers(self, user, **extra):
+        return {"authorization": f"Bearer {AccessToken.for_user(user)}", **extra}
+
+    async def open_stream(self, user, **headers):
+        response = await self.client.get(
+            self.url, headers=self.headers(user, **headers)
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        return response.streaming_content
+
+    async def next_chunk(self, stream):
+        return (await asyncio.wait_for(anext(stream), timeout=5)).decode()
+
+    async def next_notification(self, stream):
+        chunk = await self.next_chunk(stream)
+        return json.loads(chunk.split("data: ", 1)[1])
+
+    def transfer(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Transaction.objects.create(
+                sender=self.account1,
+                recipient=self.account2,
+                transaction_type=Transaction.TRANSFER,
+                amount=amount,
+            )
+
+    async def test_new_notifications_are_pushed(self):
+        sender_stream = await self.open_stream(self.user1)
+        recipient_stream = await self.open_stream(self.user2)
+
+        txn = await sync_to_async(self.transfer)(100)
+
+        notification = await self.next_notification(sender_stream)
+        self.assertEqual(notification["id"], txn.sender_notification_id)
+        self.assertEqual(notification["user"], self.user1.id)
+        self.assertEqual(notification["message"], "You sent 100 EGP in a transaction.")
+        notification = await self.next_notification(recipient_stream)
+        self.assertEqual(notification["id"], txn.recipient_notification_id)
+
+    async def test_missed_notifications_are_replayed(self):
+        first = await sync_to_async(self.transfer)(100)
+        second = await sync_to_async(self.transfer)(200)
+
+        stream = await self.open_stream(
+            self.user1, **{"last-event-id": str(first.sender_notification_id)}
+        )
+        chunk = await self.next_chunk(stream)
+        self.assertTrue(chunk.startswith(f"id: {second.sender_notification_id}\n"))
+        self.assertIn("You sent 200 EGP", chunk)
+
+        response = await self.client.get(
+            self.url, {"last_event_id": "latest"}, headers=self.headers(self.user1)
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_events_the_client_has_seen_are_skipped(self):
+        stream = await self.open_stream(self.user1, last_event_id="5")
+        for event_id in (5, 6):
+            hub.deliver(self.user1.id, Event(event_id, json.dumps({"id": event_id})))
+        self.assertEqual(await self.next_notification(stream), {"id": 6})
+
+    @override_settings(
+        NOTIFICATION_STREAM_HEARTBEAT_SECONDS=0.01,
+        NOTIFICATION_STREAM_MAX_SECONDS=0.1,
+    )
+    async def test_heartbeats_and_end_of_stream(self):
+        stream = await self.open_stream(self.user1)
+        chunks = [chunk.decode() async for chunk in stream]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(set(chunks), {": keepalive\n\n"})
+        self.assertEqual(hub.subscriptions, {})
+
+    @override_settings(NOTIFICATION_STREAM_QUEUE_SIZE=1)
+    async def test_slow_client_stream_is_ended(self):
+        stream = await self.open_stream(self.user1)
+        for event_id in (1, 2, 3):
+            hub.deliver(self.user1.id, Event(event_id, json.dumps({"id": event_id})))
+        await asyncio.sleep(0)
+
+        self.assertEqual(await self.next_notification(stream), {"id": 1})
+        with self.assertRaises(StopAsyncIteration):
+            await self.next_chunk(stream)
+
+    def test_wsgi_requests_are_long_polled(self):
+        first = self.transfer(100)
+        second = self.transfer(200)
+        client = Client(headers=self.headers(self.user1))
+
+        response = client.get(self.url, {"last_event_id": 0})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(
+            [
+                event.split("\n", 1)[0]
+                for event in response.content.decode().split("\n\n")
+            ],
+            [
+                f"id: {first.sender_notification_id}",
+                f"id: {second.sender_notification_id}",
+                "",
+            ],
+        )
+
+        # Without missed notifications the poll waits for the next one
+        def deliver():
+            while self.user1.id not in hub.subscriptions:
+                time.sleep(0.01)
+            hub.deliver(self.user1.id, Event(99, json.dumps({"id": 99})))
+
+        thread = threading.Thread(target=deliver)
+        thread.start()
+        response = client.get(
+            self.url, {"last_event_id": second.sender_notification_id}
+        )
+        thread.join()
+        self.assertEqual(
+            response.content.decode(),
+            'id: 99\nevent: notification\ndata: {"id": 99}\n\n',
+        )
+
+        with override_settings(NOTIFICATION_LONG_POLL_SECONDS=0.05):
+            response = client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(hub.subscriptions, {})
+
+    async def test_authentication_is_required(self):
+        response = await self.client.get(
+            self.url, headers={"accept": "text/event-stream"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_rolled_back_notifications_are_not_published(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertRaises(ZeroDivisionError):
+                with transaction.atomic():
+                    Transaction.objects.create(
+                        sender=self.account1,
+                        recipient=self.account2,
+                        transaction_type=Transaction.TRANSFER,
+                        amount=100,
+                    )
+                    1 / 0
+        self.assertEqual(callbacks, [])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.transfer(100)
+        # The notifications are published and the read cache is invalidated
+        self.assertEqual(len(callbacks), 2)
+
+
+# Integration testing
+class NotificationMarkReadTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="user1", password="password1")
+        self.other_user = User.objects.create_user(
+            username="user2", password="password2"
+        )
+        self.notifications = [
+            Notification.objects.create(user=self.user, message=f"Message {index}")
+            for index in range(5)
+        ]
+        self.other_notification = Notification.objects.create(
+            user=self.other_user, message="Not yours"
+        )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("notifications_mark_read")
+
+    def unread_ids(self):
+        return list(
+            Notification.objects.filter(is_read=False)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+    def test_mark_ids(self):
+        ids = [
+            self.notifications[1].id,
+            self.notifications[3].id,
+            self.other_notification.id,
+        ]
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, {"ids": ids}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"marked": 2})
+        self.assertEqual(
+            self.unread_ids(),
+            [
+                self.notifications[0].id,
+                self.notifications[2].id,
+                self.notifications[4].id,
+                self.other_notification.id,
+            ],
+        )
+
+    def test_mark_up_to_watermark(self):
+        response = self.client.post(
+            self.url, {"up_to_id": self.notifications[2].id}, format="json"
+        )
+        self.assertEqual(response.data, {"marked": 3})
+        self.assertEqual(
+            self.unread_ids(),
+            [
+                self.notifications[3].id,
+                self.notifications[4].id,
+                self.other_notification.id,
+            ],
+        )
+
+        # Already read notifications are not counted again
+        response = self.client.post(
+            self.url, {"up_to_id": self.notifications[2].id}, format="json"
+        )
+        self.assertEqual(response.data, {"marked": 0})
+
+    def test_mark_until(self):
+        Notification.objects.filter(id=self.notifications[0].id).update(
+            timestamp=timezone.now() - timedelta(days=2)
+        )
+        until = (timezone.now() - timedelta(days=1)).isoformat()
+        response = self.client.post(self.url, {"until": until}, format="json")
+        self.assertEqual(response.data, {"marked": 1})
+        self.assertNotIn(self.notifications[0].id, self.unread_ids())
+
+    def test_invalid_requests(self):
+        for data in (
+            {},
+            {"ids": []},
+            {"ids": [self.notifications[0].id], "up_to_id": 1},
+            {"ids": list(range(1001))},
+        ):
+            with self.subTest(data=data):
+                response = self.client.post(self.url, data, format="json")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(self.unread_ids()), 6)
+
+
+class PurgeNotificationsCommandTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="user1")
+        recipient = User.objects.create(username="user2")
+        account = Account.objects.create(user=user, balance=1000)
+        Account.objects.create(user=recipient, account_type=Account.COMPANY)
+        self.txn = Transaction.objects.create(
+            sender=account,
+            recipient=Account.objects.get(user=recipient),
+            transaction_type=Transaction.PAY_BILL,
+            amount=100,
+        )
+        old = timezone.now() - timedelta(days=100)
+        Notification.objects.update(timestamp=old)
+        Notification.objects.filter(id=self.txn.sender_notification_id).update(
+            is_read=True
+        )
+        self.old_unread = self.txn.recipient_notification_id
+        self.old_read = [
+            Notification.objects.create(user=user, message=f"Old {index}").id
+            for index in range(3)
+        ]
+        Notification.objects.filter(id__in=self.old_read).update(
+            is_read=True, timestamp=old
+        )
+        self.recent_read = Notification.objects.create(
+            user=user, message="Recent", is_read=True
+        ).id
+
+    def test_purge_old_read_notifications(self):
+        out = StringIO()
+        call_command("purge_notifications", "--chunk-size", "2", stdout=out)
+
+        self.assertIn("Deleted 4 read notifications", out.getvalue())
+        self.assertEqual(
+            set(Notification.objects.values_list("id", flat=True)),
+            {self.old_unread, self.recent_read},
+        )
+        self.txn.refresh_from_db()
+        self.assertIsNone(self.txn.sender_notification_id)
+        self.assertEqual(self.txn.recipient_notification_id, self.old_unread)
+
+    def test_retention_window(self):
+        call_command("purge_notifications", "--days", "365", stdout=StringIO())
+        self.assertEqual(Notification.objects.count(), 6)
+
+
+@override_settings(NOTIFICATION_OUTBOX_SYNC=False)
+class NotificationOutboxTestCase(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create(username="user1")
+        self.user2 = User.objects.create(username="user2")
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(user=self.user2, balance=1000)
+
+    def transfer(self, amount=100):
+        return Transaction(
+            sender=self.account1,
+            recipient=self.account2,
+            transaction_type=Transaction.TRANSFER,
+            amount=amount,
+        )
+
+    def messages(self):
+        return list(Notification.objects.order_by("id").values_list("user", "message"))
+
+    def test_posting_writes_an_event(self):
+        txn = self.transfer()
+        txn.save()
+        self.assertFalse(Notification.objects.exists())
+        self.assertIsNone(txn.sender_notification_id)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.payload["transaction"], txn.id)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(process_outbox(), 1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            self.messages(),
+            [
+                (self.user1.id, "You sent 100 EGP in a transaction."),
+                (self.user2.id, "You received 100 EGP in a transaction."),
+            ],
+        )
+        txn.refresh_from_db()
+        self.assertEqual(txn.sender_notification.user, self.user1)
+        self.assertEqual(txn.recipient_notification.user, self.user2)
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_events_are_handled_in_batches(self):
+        post_transactions([self.transfer(amount) for amount in (10, 20, 30)])
+        self.assertEqual(OutboxEvent.objects.count(), 3)
+
+        # Claim, look up the keys, insert, link and delete, plus savepoints
+        with self.assertNumQueries(9):
+            self.assertEqual(process_outbox(batch_size=2), 2)
+        self.assertEqual(process_outbox(batch_size=2), 1)
+        self.assertEqual(process_outbox(batch_size=2), 0)
+        self.assertEqual(Notification.objects.count(), 6)
+        self.assertFalse(
+            Transaction.objects.filter(sender_notification__isnull=True).exists()
+        )
+
+    def test_redelivered_event_is_idempotent(self):
+        self.transfer().save()
+        payload = OutboxEvent.objects.get().payload
+        process_outbox()
+        OutboxEvent.objects.create(
+            topic=OutboxEvent.TRANSACTION_POSTED, payload=payload
+        )
+
+        self.assertEqual(process_outbox(), 1)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertFalse(OutboxEvent.objects.exists())
+        txn = Transaction.objects.get()
+        self.assertEqual(
+            set(Notification.objects.values_list("id", flat=True)),
+            {txn.sender_notification_id, txn.recipient_notification_id},
+        )
+
+    def test_failing_event_does_not_block_the_others(self):
+        bad = OutboxEvent.objects.create(
+            topic=OutboxEvent.TRANSACTION_POSTED, payload={}
+        )
+        self.transfer().save()
+
+        with self.assertLogs("banking.outbox", level="ERROR"):
+            self.assertEqual(process_outbox(), 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        bad.refresh_from_db()
+        self.assertEqual(bad.attempts, 1)
+
+        OutboxEvent.objects.filter(id=bad.id).update(attempts=MAX_ATTEMPTS)
+        self.assertEqual(process_outbox(), 0)
+
+    def test_command(self):
+        post_transactions([self.transfer(amount) for amount in (10, 20, 30)])
+        out = StringIO()
+        call_command("process_outbox", "--once", "--batch-size", "2", stdout=out)
+        self.assertIn("Processed 3 events.", out.getvalue())
+        self.assertEqual(Notification.objects.count(), 6)
+
+
+# Integration testing
+class IdempotencyKeyTestCase(TestCase):
+    def setUp(self):
+        idempotency_cache.clear()
+        self.client = APIClient()
+        self.user1 = User.objects.create(username="user1")
+        self.user2 = User.objects.create(username="user2")
+        self.account1 = Account.objects.create(user=self.user1, balance=1000)
+        self.account2 = Account.objects.create(user=self.user2, balance=1000)
+        self.client.force_authenticate(user=self.user1)
+
+    def transfer(self, key, amount=100, url="transaction_create", data=None):
+        return self.client.post(
+            reverse(url),
+            data
+            or {
+                "transaction_type": Transaction.TRANSFER,
+                "amount": amount,
+                "sender": self.account1.id,
+                "recipient": self.account2.id,
+            },
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replay_returns_the_stored_response(self):
+        first = self.transfer("key-1")
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn("Idempotent-Replayed", first)
+
+        # Replays are neither validated nor posted again
+        Account.objects.filter(id=self.account1.id).update(balance=0)
+        replay = self.transfer("key-1")
+        self.assertEqual(replay.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(replay.content), json.loads(first.content))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_cached_replay_does_not_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.transfer("key-1")
+        with self.assertNumQueries(0):
+            response = self.transfer("key-1")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_key_reused_for_another_request(self):
+        self.transfer("key-1")
+        response = self.transfer("key-1", amount=200)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        self.transfer("key-1")
+        self.client.force_authenticate(user=self.user2)
+        response = self.transfer(
+            "key-1",
+            data={
+                "transaction_type": Transaction.TRANSFER,
+                "amount": 100,
+                "sender": self.account2.id,
+                "recipient": self.account1.id,
+            },
+        )
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_failed_requests_can_be_retried(self):
+        response = self.transfer("key-1", amount=5000)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        Account.objects.filter(id=self.account1.id).update(balance=10000)
+        response = self.transfer("key-1", amount=5000)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.transfer("x" * 256)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_endpoint(self):
+        data = {
+            "transactions": [
+                {
+                    "transaction_type": Transaction.TRANSFER,
+                    "amount": amount,
+                    "sender": self.account1.id,
+                    "recipient": self.account2.id,
+                }
+                for amount in (10, 20)
+            ]
+        }
+        first = self.transfer("batch-1", url="transaction_batch_create", data=data)
+        replay = self.transfer("batch-1", url="transaction_batch_create", data=data)
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(json.loads(replay.content), json.loads(first.content))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_expired_keys(self):
+        self.transfer("key-1")
+        self.transfer("key-2", amount=200)
+        IdempotencyKey.objects.filter(key="key-1").update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        idempotency_cache.clear()
+
+        response = self.transfer("key-1")
+        self.assertNotIn("Idempotent-Replayed", response)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command("sweep_idempotency_keys", "--chunk-size", "1", stdout=out)
+        self.assertIn("Deleted 2 expired idempotency keys.", out.getvalue())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+# Integration testing
+class AccountSummaryTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username="user1")
+        self.other_user = User.objects.create(username="user2")
+        self.company = User.objects.create(username="company")
+        self.account = Account.objects.create(user=self.user, balance=1000)
+        self.other_account = Account.objects.create(user=self.other_user, balance=1000)
+        self.company_account = Account.objects.create(
+            user=self.company, account_type=Account.COMPANY
+        )
+        self.client.force_authenticate(user=self.user)
+
+    def post(self, sender, recipient, transaction_type, amount):
+        return Transaction.objects.create(
+            sender=sender,
+            recipient=recipient,
+            transaction_type=transaction_type,
+            amount=amount,
+        )
+
+    def summary(self, account=None):
+        return self.client.get(
+            reverse(
+                "account_summary", kwargs={"account_id": (account or self.account).id}
+            )
+        )
+
+    def test_daily_totals_follow_postings(self):
+        self.post(self.account, self.other_account, Transaction.TRANSFER, 100)
+        post_transactions(
+            [
+                Transaction(
+                    sender=self.account,
+                    recipient=self.other_account,
+                    transaction_type=Transaction.TRANSFER,
+                    amount=amount,
+                )
+                for amount in (10, 20)
+            ]
+        )
+        total = DailyTotal.objects.get(
+            account=self.account, transaction_type=Transaction.TRANSFER
+        )
+        self.assertEqual((total.sent_amount, total.sent_count), (130, 3))
+        self.assertEqual((total.received_amount, total.received_count), (0, 0))
+        total = DailyTotal.objects.get(account=self.other_account)
+        self.assertEqual((total.received_amount, total.received_count), (130, 3))
+
+        DailyTotal.objects.all().delete()
+        call_command("rebuild_daily_totals", stdout=StringIO())
+        total = DailyTotal.objects.get(account=self.other_account)
+        self.assertEqual((total.received_amount, total.received_count), (130, 3))
+
+    def test_summary(self):
+        self.post(self.account, self.other_account, Transaction.TRANSFER, 100)
+        self.post(self.account, self.other_account, Transaction.TRANSFER, 50)
+        self.post(self.account, None, Transaction.WITHDRAW, 30)
+        self.post(self.account, self.company_account, Transaction.PAY_BILL, 20)
+        self.post(self.other_account, self.account, Transaction.TRANSFER, 5)
+        # Last year's totals only count for all time
+        DailyTotal.objects.filter(
+            account=self.account, transaction_type=Transaction.WITHDRAW
+        ).update(day=timezone.localdate() - timedelta(days=366))
+
+        with self.assertNumQueries(2):
+            response = self.summary()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["all_time"],
+            {
+                "sent": {"amount": "150.00", "count": 2},
+                "received": {"amount": "5.00", "count": 1},
+                "withdrawn": {"amount": "30.00", "count": 1},
+                "bills_paid": {"amount": "20.00", "count": 1},
+            },
+        )
+        self.assertEqual(
+            response.data["this_month"]["withdrawn"], {"amount": "0.00", "count": 0}
+        )
+        self.assertEqual(
+            response.data["this_month"]["sent"], {"amount": "150.00", "count": 2}
+        )
+
+        response = self.summary(self.company_account)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+# Integration testing
+class ReadCacheTestCase(TestCase):
+    def setUp(self):
+        read_cache.clear()
+        registry.reset()
+        self.client = APIClient()
+        self.user = User.objects.create(username="user1")
+        self.other_user = User.objects.create(username="user2")
+        self.account = Account.objects.create(user=self.user, balance=1000)
+        self.other_account = Account.objects.create(user=self.other_user, balance=1000)
+        self.client.force_authenticate(user=self.user)
+        self.statement_url = reverse(
+            "bank_statement_list", kwargs={"account_id": self.account.id}
+        )
+
+    def transfer(self, amount, sender=None, recipient=None):
+        return Transaction.objects.create(
+            sender=sender or self.account,
+            recipient=recipient or self.other_account,
+            transaction_type=Transaction.TRANSFER,
+            amount=amount,
+        )
+
+    def balances(self):
+        return [row["balance"] for row in self.client.get(reverse("account_list")).data]
+
+    def test_account_list_is_cached_until_a_posting(self):
+        self.assertEqual(self.balances(), ["1000.00"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.balances(), ["1000.00"])
+
+        # Both ends of the transfer see it, the batch engine too
+        self.transfer(100, sender=self.other_account, recipient=self.account)
+        self.assertEqual(self.balances(), ["1100.00"])
+        post_transactions(
+            [
+                Transaction(
+                    sender=self.account,
+                    recipient=self.other_account,
+                    transaction_type=Transaction.TRANSFER,
+                    amount=10,
+                )
+            ]
+        )
+        self.assertEqual(self.balances(), ["1090.00"])
+
+        Account.objects.create(user=self.user)
+        self.assertEqual(self.balances(), ["1090.00", "0.00"])
+        self.assertIn("bankly_account_list_cache_hits_total 1\n", registry.render())
+        self.assertIn("bankly_account_list_cache_misses_total 4\n", registry.render())
+
+    def test_statement_first_pages_are_cached(self):
+        self.transfer(100)
+        response = self.client.get(self.statement_url, {"page_size": 1})
+        self.assertEqual(
+            [row["amount"] for row in response.data["results"]], ["100.00"]
+        )
+        with self.assertNumQueries(1):
+            # Only the permission check
+            cached = self.client.get(self.statement_url, {"page_size": 1})
+        self.assertEqual(cached.data, response.data)
+
+        self.transfer(50)
+        response = self.client.get(self.statement_url, {"page_size": 1})
+        self.assertEqual([row["amount"] for row in response.data["results"]], ["50.00"])
+
+        # Later pages and the full statement are not cached
+        self.client.get(response.data["next"])
+        self.client.get(self.statement_url)
+        self.assertIn("bankly_statement_cache_hits_total 1\n", registry.render())
+        self.assertIn("bankly_statement_cache_misses_total 2\n", registry.render())
+
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.get(self.statement_url, {"page_size": 1})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_entry_read_before_an_invalidation_is_not_served(self):
+        scope = read_cache.user_scope(self.user.id)
+        cached = read_cache.cached_read("test", scope)
+        self.assertEqual(cached.get(), (False, None))
+        # A posting commits while the response is built from the old rows
+        read_cache.invalidate([scope])
+        cached.set("stale")
+        self.assertEqual(read_cache.cached_read("test", scope).get(), (False, None))
+
+        cached = read_cache.cached_read("test", scope)
+        cached.get()
+        cached.set("fresh")
+        self.assertEqual(read_cache.cached_read("test", scope).get(), (True, "fresh"))
+
+        # An evicted version restarts above the one the entry was stored with
+        read_cache.get_cache().delete(read_cache.version_key(scope))
+        self.assertEqual(read_cache.cached_read("test", scope).get(), (False, None))
+
+    @override_settings(ROOT_URLCONF="bankly.asgi_urls")
+    async def test_async_views_are_cached(self):
+        client = AsyncClient()
+        headers = {"authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        first = await client.get(reverse("account_list"), headers=headers)
+        second = await client.get(reverse("account_list"), headers=headers)
+        self.assertEqual(json.loads(second.content), json.loads(first.content))
+        self.assertIn("bankly_account_list_cache_hits_total 1\n", registry.render())
+
+    @override_settings(READ_CACHE_ALIAS=None)
+    def test_cache_can_be_turned_off(self):
+        self.assertEqual(self.balances(), ["1000.00"])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.balances(), ["1000.00"])
+        self.assertNotIn("account_list_cache", registry.render())
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class AccountProvisionTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user("admin", password="x", is_staff=True)
+        self.client.force_authenticate(user=self.admin)
+        registry.reset()
+
+    def test_rows_are_created_and_errors_reported(self):
+        rows = [
+            {"username": "alice", "password": "alicepassword"},
+            {
+                "username": "acme",
+                "password": "acmepassword",
+                "email": "acme@example.com",
+                "account_type": Account.COMPANY,
+            },
+            {"username": "alice", "password": "again"},
+            {"username": "admin", "password": "taken"},
+            {"username": "bob", "account_type": "savings"},
+            "not a row",
+        ]
+        response = self.client.post(reverse("account_provision"), rows, format="json")
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+
+        created = response.data["created"]
+        self.assertEqual([row["row"] for row in created], [1, 2])
+        acme = User.objects.get(username="acme")
+        self.assertEqual(created[1]["user"], acme.id)
+        self.assertEqual(acme.email, "acme@example.com")
+        self.assertTrue(acme.check_password("acmepassword"))
+        account = Account.objects.get(user=acme)
+        self.assertEqual(created[1]["account"], account.id)
+        self.assertEqual(account.account_type, Account.COMPANY)
+        self.assertEqual(account.balance_snapshots.count(), 1)
+
+        errors = {error["row"]: error["errors"] for error in response.data["errors"]}
+        self.assertEqual(sorted(errors), [3, 4, 5, 6])
+        self.assertIn("Duplicate", errors[3]["username"][0])
+        self.assertIn("already exists", errors[4]["username"][0])
+        self.assertEqual(sorted(errors[5]), ["account_type", "password"])
+        self.assertIn("non_field_errors", errors[6])
+        self.assertFalse(User.objects.filter(username="bob").exists())
+        self.assertIn("bankly_provisioned_users_total 2\n", registry.render())
+
+    def test_csv_upload(self):
+        body = (
+            "username,password,email,account_type\n"
+            "carol,carolpassword,,\n"
+            "dave,davepassword,dave@example.com,company\n"
+        )
+        response = self.client.post(
+            reverse("account_provision"), body, content_type="text/csv"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["errors"], [])
+        self.assertEqual(
+            list(
+                Account.objects.filter(user__username__in=["carol", "dave"])
+                .order_by("user__username")
+                .values_list("account_type", flat=True)
+            ),
+            [Account.INDIVIDUAL, Account.COMPANY],
+        )
+
+    @override_settings(PROVISIONING_MAX_ROWS=2)
+    def test_request_limits(self):
+        url = reverse("account_provision")
+        rows = [{"username": f"user{i}", "password": "password"} for i in range(3)]
+        response = self.client.post(url, {"users": rows}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {"users": []}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(user=User.objects.create_user("customer"))
+        response = self.client.post(url, rows[:1], format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(User.objects.filter(username="user0").exists())
+
+    def test_requests_hash_in_the_shared_threads(self):
+        rows = [{"username": f"user{i}", "password": f"pass{i}"} for i in range(9)]
+        with mock.patch("banking.provisioning.ProcessPoolExecutor") as processes:
+            response = self.client.post(
+                reverse("account_provision"), rows, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        processes.assert_not_called()
+        self.assertTrue(User.objects.get(username="user8").check_password("pass8"))
+
+    def test_command_hashes_in_processes(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            file.write("username,password\n")
+            for index in range(25):
+                file.write(f"user{index},password{index}\n")
+            file.write("user3,duplicate\n")
+        self.addCleanup(os.remove, file.name)
+
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            "provision_users",
+            file.name,
+            "--processes",
+            "2",
+            "--chunk-size",
+            "10",
+            stdout=stdout,
+            stderr=stderr,
+        )
+        self.assertIn("Created 25 users", stdout.getvalue())
+        self.assertIn("Row 26:", stderr.getvalue())
+        self.assertTrue(
+            User.objects.get(username="user17").check_password("password17")
+        )
+        self.assertEqual(Account.objects.filter(user__username="user24").count(), 1)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTestCase(TestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        read_cache.clear()
+        routers.get_pin_cache().clear()
+        self.user = User.objects.create_user(username="owner")
+        self.other = User.objects.create_user(username="other")
+        self.account = Account.objects.create(user=self.user, balance=1000)
+        self.other_account = Account.objects.create(user=self.other)
+        # The replica stands for one that has not caught up with the users'
+        # later writes
+        User.objects.using("replica").bulk_create(
+            [User(id=self.user.id, username="owner")]
+        )
+        Account.objects.using("replica").bulk_create(
+            [Account(id=self.account.id, user_id=self.user.id, balance=1000)]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.statement_url = reverse(
+            "bank_statement_list", kwargs={"account_id": self.account.id}
+        )
+
+    def balances(self):
+        return [row["balance"] for row in self.client.get(reverse("account_list")).data]
+
+    def transfer(self):
+        return self.client.post(
+            reverse("transaction_create"),
+            {
+                "transaction_type": Transaction.TRANSFER,
+                "amount": 100,
+                "sender": self.account.id,
+                "recipient": self.other_account.id,
+            },
+        )
+
+    def test_list_views_read_from_the_replica(self):
+        # Committed on the primary without going through the pinning commit
+        Transaction.objects.create(
+            sender=self.account,
+            recipient=self.other_account,
+            transaction_type=Transaction.TRANSFER,
+            amount=100,
+        )
+        self.assertEqual(self.balances(), ["1000.00"])
+        self.assertEqual(self.client.get(self.statement_url).data, [])
+        self.assertEqual(self.client.get(reverse("unread_notifications")).data, [])
+
+        request = APIRequestFactory().get(self.statement_url)
+        force_authenticate(request, user=self.user)
+        response = BankStatementListView.as_view()(request, account_id=self.account.id)
+        self.assertEqual(response.data, [])
+
+        # Everything else reads from the primary
+        response = self.client.get(
+            reverse("account_summary", kwargs={"account_id": self.account.id})
+        )
+        self.assertEqual(response.data["all_time"]["sent"]["count"], 1)
+
+    def test_writers_read_from_the_primary_until_their_pin_expires(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.transfer()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.balances(), ["900.00"])
+        self.assertEqual(len(self.client.get(self.statement_url).data), 1)
+        self.assertEqual(len(self.client.get(reverse("unread_notifications")).data), 1)
+
+        # The recipient was written too
+        self.client.force_authenticate(user=self.other)
+        self.assertEqual(self.balances(), ["100.00"])
+
+        routers.get_pin_cache().clear()
+        read_cache.clear()
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.balances(), ["1000.00"])
+
+    def test_writes_go_to_the_primary(self):
+        stale = Account.objects.using("replica").get(id=self.account.id)
+        stale.account_type = Account.COMPANY
+        stale.save()
+        self.assertEqual(
+            Account.objects.get(id=self.account.id).account_type, Account.COMPANY
+        )
+        self.assertEqual(
+            Account.objects.using("replica").get(id=self.account.id).account_type,
+            Account.INDIVIDUAL,
+        )
+
+        with override_settings(DATABASE_REPLICAS=[]):
+            with self.captureOnCommitCallbacks() as callbacks:
+                routers.pin([self.user.id])
+        self.assertEqual(callbacks, [])
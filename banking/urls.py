@@ -13,31 +13,64 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+
 from django.urls import path
 from .views import (
     AccountCreateView,
     AccountListView,
+    AccountProvisionView,
     TransactionCreateView,
+    TransactionBatchCreateView,
     BankStatementListView,
+    BankStatementExportView,
+    AccountSummaryView,
     UnreadNotificationListView,
+    NotificationMarkReadView,
 )
+from .async_views import NotificationStreamView
 
 urlpatterns = [
     path("create/", AccountCreateView.as_view(), name="account_create"),
+    path("provision/", AccountProvisionView.as_view(), name="account_provision"),
     path("", AccountListView.as_view(), name="account_list"),
     path(
         "transactions/create/",
         TransactionCreateView.as_view(),
         name="transaction_create",
     ),
+    path(
+        "transactions/batch/",
+        TransactionBatchCreateView.as_view(),
+        name="transaction_batch_create",
+    ),
     path(
         "<int:account_id>/statements/",
         BankStatementListView.as_view(),
         name="bank_statement_list",
     ),
+    path(
+        "<int:account_id>/statements/export.<str:export_format>",
+        BankStatementExportView.as_view(),
+        name="bank_statement_export",
+    ),
+    path(
+        "<int:account_id>/summary/",
+        AccountSummaryView.as_view(),
+        name="account_summary",
+    ),
     path(
         "notifications/unread/",
         UnreadNotificationListView.as_view(),
         name="unread_notifications",
     ),
+    path(
+        "notifications/read/",
+        NotificationMarkReadView.as_view(),
+        name="notifications_mark_read",
+    ),
+    path(
+        "notifications/stream/",
+        NotificationStreamView.as_view(),
+        name="notification_stream",
+    ),
 ]
@@ -1,14 +1,124 @@
-from django.db.models import Q
-from rest_framework.generics import CreateAPIView, ListAPIView
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.generics import CreateAPIView, GenericAPIView, ListAPIView
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from authentication.permissions import IsAdminUser
+from bankly import routers
 from .models import Account, Transaction, Notification
 from .serializers import (
     AccountSerializer,
     AccountRetrievalSerializer,
     TransactionSerializer,
+    StatementSerializer,
     NotificationSerializer,
+    MarkNotificationsReadSerializer,
 )
+from . import read_cache
+from .aggregates import account_summary
+from .idempotency import IdempotentMixin
+from .pagination import KeysetPagination
 from .permissions import IsAccountOwner
+from .posting import post_transaction, post_transactions
+from .provisioning import CSVParser, provision_in_threads
+from .statements import StatementQuery, export_rows, stream_csv, stream_ndjson
+
+
+def parse_time_bound(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            date = parse_date(value)
+            if date is not None:
+                parsed = datetime.combine(date, time.min)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: "Expected an ISO 8601 date or datetime."})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_by_time_range(queryset, params):
+    """Apply the ``since`` (inclusive) and ``until`` (exclusive) query params."""
+    since = parse_time_bound(params, "since")
+    until = parse_time_bound(params, "until")
+    if since is not None:
+        queryset = queryset.filter(timestamp__gte=since)
+    if until is not None:
+        queryset = queryset.filter(timestamp__lt=until)
+    return queryset
+
+
+def statement_queryset(account_id, params):
+    """The statement of an account, filtered by the query params."""
+    queryset = filter_by_time_range(StatementQuery(account_id), params)
+    transaction_type = params.get("transaction_type")
+    if transaction_type:
+        if transaction_type not in dict(Transaction.TRANSACTION_TYPE_CHOICES):
+            raise ValidationError(
+                {"transaction_type": f"'{transaction_type}' is not a valid choice."}
+            )
+        queryset = queryset.filter(transaction_type=transaction_type)
+    return queryset
+
+
+def unread_notifications_queryset(user, params):
+    queryset = Notification.objects.filter(user_id=user.id, is_read=False).order_by(
+        "timestamp", "id"
+    )
+    return filter_by_time_range(queryset, params)
+
+
+class CachedListMixin:
+    """Serve ``list()`` through the read cache (see ``banking/read_cache.py``).
+
+    ``get_cached_read()`` returns the ``CachedRead`` of the request, or
+    ``None`` to query the database as usual.
+    """
+
+    def get_cached_read(self):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        cached = self.get_cached_read()
+        if cached is None:
+            return super().list(request, *args, **kwargs)
+        hit, data = cached.get()
+        if hit:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        cached.set(response.data)
+        return response
+
+
+class ReplicaReadMixin:
+    """Run the queries of the listed queryset on a read replica, unless the
+    user is pinned to the primary (see ``bankly/routers.py``).
+    """
+
+    read_alias = None
+
+    def get_read_alias(self):
+        if self.read_alias is None:
+            self.read_alias = routers.read_alias(self.request.user.id)
+        return self.read_alias
+
+    def filter_queryset(self, queryset):
+        return super().filter_queryset(queryset).using(self.get_read_alias())
 
 
 class AccountCreateView(CreateAPIView):
@@ -17,39 +127,272 @@ class AccountCreateView(CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        serializer.save(user_id=self.request.user.id)
+
+
+class AccountProvisionView(APIView):
+    """Create many users, each with an account, for admins.
+
+    The body is a JSON list of ``{"username", "password", "email",
+    "account_type"}`` objects (or ``{"users": [...]}``), or a ``text/csv``
+    file with those columns. Valid rows are created even if others fail: the
+    response lists the ``created`` users and the ``errors`` of the other
+    rows, by their 1-based position in the input, and is a 207 if any row
+    failed. Requests take at most ``PROVISIONING_MAX_ROWS`` rows and hash
+    their passwords in the threads shared by the requests, larger imports go
+    through the ``provision_users`` command.
+    """
+
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, CSVParser]
+
+    def post(self, request):
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = rows.get("users")
+        if not isinstance(rows, list) or not rows:
+            raise ValidationError({"users": "Expected a non-empty list of users."})
+        max_rows = getattr(settings, "PROVISIONING_MAX_ROWS", 1000)
+        if len(rows) > max_rows:
+            raise ValidationError(
+                {"users": f"A request may contain at most {max_rows} users."}
+            )
+        outcome = provision_in_threads(rows)
+        return Response(
+            outcome,
+            status=(
+                status.HTTP_207_MULTI_STATUS
+                if outcome["errors"]
+                else status.HTTP_201_CREATED
+            ),
+        )
 
 
-class AccountListView(ListAPIView):
+class AccountListView(ReplicaReadMixin, CachedListMixin, ListAPIView):
     serializer_class = AccountRetrievalSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Account.objects.filter(user=self.request.user)
+        return Account.objects.filter(user_id=self.request.user.id)
+
+    def get_cached_read(self):
+        return read_cache.cached_read(
+            "account_list", read_cache.user_scope(self.request.user.id)
+        )
 
 
-class TransactionCreateView(CreateAPIView):
+class TransactionCreateView(IdempotentMixin, CreateAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
 
+    def perform_create(self, serializer):
+        # The serializer checks the balance it read, but a concurrent transfer
+        # may have spent it since; the posting engine has the final word.
+        try:
+            serializer.instance = post_transaction(
+                Transaction(**serializer.validated_data)
+            )
+        except DjangoValidationError as e:
+            raise ValidationError(e.messages)
+
+
+class TransactionBatchCreateView(IdempotentMixin, GenericAPIView):
+    """Create many transactions in one request.
+
+    The body is ``{"transactions": [...], "atomic": true}``. In atomic mode
+    (the default) either every transaction is posted or none is and the
+    errors are returned per item. With ``"atomic": false`` the valid
+    transactions are posted and a 207 response reports the outcome of each
+    item. Like single transactions, batches honor the ``Idempotency-Key``
+    header.
+    """
 
-class BankStatementListView(ListAPIView):
     serializer_class = TransactionSerializer
+    permission_classes = [IsAuthenticated]
+    max_batch_size = 1000
+
+    def get_items(self):
+        data = self.request.data
+        items = data.get("transactions") if hasattr(data, "get") else None
+        if not isinstance(items, list) or not items:
+            raise ValidationError(
+                {"transactions": "Expected a non-empty list of transactions."}
+            )
+        if len(items) > self.max_batch_size:
+            raise ValidationError(
+                {
+                    "transactions": f"A batch may contain at most {self.max_batch_size} transactions."
+                }
+            )
+        return items
+
+    def load_accounts(self, items):
+        account_ids = set()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            for key in ("sender", "recipient"):
+                try:
+                    account_ids.add(int(item.get(key)))
+                except (TypeError, ValueError):
+                    pass
+        return Account.objects.in_bulk(account_ids)
+
+    def create(self, request, *args, **kwargs):
+        items = self.get_items()
+        context = self.get_serializer_context()
+        context["accounts"] = self.load_accounts(items)
+        if request.data.get("atomic", True) in (False, "false", "0"):
+            return self.post_per_item(items, context)
+        return self.post_atomic(items, context)
+
+    def post_atomic(self, items, context):
+        serializer = self.get_serializer_class()(data=items, many=True, context=context)
+        serializer.is_valid(raise_exception=True)
+        results = post_transactions(
+            [Transaction(**data) for data in serializer.validated_data]
+        )
+        errors = [
+            (
+                {"non_field_errors": result.messages}
+                if isinstance(result, DjangoValidationError)
+                else {}
+            )
+            for result in results
+        ]
+        if any(errors):
+            raise ValidationError(errors)
+        serializer.instance = results
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def post_per_item(self, items, context):
+        serializer_class = self.get_serializer_class()
+        outcomes = [None] * len(items)
+        pending = []
+        for index, item in enumerate(items):
+            serializer = serializer_class(data=item, context=context)
+            try:
+                serializer.is_valid(raise_exception=True)
+            except APIException as e:
+                outcomes[index] = {"status": e.status_code, "errors": e.detail}
+                continue
+            pending.append((index, Transaction(**serializer.validated_data)))
+
+        results = post_transactions([txn for _, txn in pending], atomic=False)
+        for (index, _), result in zip(pending, results):
+            if isinstance(result, DjangoValidationError):
+                outcomes[index] = {
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "errors": {"non_field_errors": result.messages},
+                }
+            else:
+                outcomes[index] = {
+                    "status": status.HTTP_201_CREATED,
+                    "data": serializer_class(result, context=context).data,
+                }
+        return Response(outcomes, status=status.HTTP_207_MULTI_STATUS)
+
+
+class BankStatementListView(ReplicaReadMixin, CachedListMixin, ListAPIView):
+    serializer_class = StatementSerializer
     permission_classes = [IsAuthenticated, IsAccountOwner]
+    pagination_class = KeysetPagination
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["account_id"] = self.kwargs.get("account_id")
+        return context
 
     def get_queryset(self):
-        account_id = self.kwargs["account_id"]
-        queryset = Transaction.objects.filter(
-            Q(sender__id=account_id) | Q(recipient__id=account_id)
+        return statement_queryset(self.kwargs["account_id"], self.request.query_params)
+
+    def get_cached_read(self):
+        # Only first pages, the full statement is too big to keep
+        params = self.request.query_params
+        if (
+            self.paginator.cursor_query_param in params
+            or self.paginator.page_size_query_param not in params
+        ):
+            return None
+        return read_cache.cached_read(
+            "statement",
+            read_cache.account_scope(self.kwargs["account_id"]),
+            # The next link is absolute
+            self.request.build_absolute_uri(),
+        )
+
+
+class AccountSummaryView(APIView):
+    """What an account sent, received, withdrew and paid in bills, with counts,
+    for the current month and all time.
+    """
+
+    permission_classes = [IsAuthenticated, IsAccountOwner]
+
+    def get(self, request, account_id):
+        return Response(account_summary(account_id))
+
+
+class BankStatementExportView(APIView):
+    """Stream the full statement of an account, oldest first, as CSV or NDJSON.
+
+    Accepts the ``since`` and ``until`` filters of the statement list.
+    """
+
+    permission_classes = [IsAuthenticated, IsAccountOwner]
+    formats = {
+        "csv": (stream_csv, "text/csv"),
+        "ndjson": (stream_ndjson, "application/x-ndjson"),
+    }
+
+    def get(self, request, account_id, export_format):
+        if export_format not in self.formats:
+            raise Http404
+        stream, content_type = self.formats[export_format]
+        statement = filter_by_time_range(
+            StatementQuery(account_id), request.query_params
+        ).order_by("timestamp", "id")
+        response = StreamingHttpResponse(
+            stream(export_rows(account_id, statement)), content_type=content_type
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="statement-{account_id}.{export_format}"'
         )
-        return queryset
+        return response
 
 
-class UnreadNotificationListView(ListAPIView):
+class UnreadNotificationListView(ReplicaReadMixin, ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        user = self.request.user
-        queryset = Notification.objects.filter(user=user, is_read=False)
-        return queryset
+        return unread_notifications_queryset(
+            self.request.user, self.request.query_params
+        )
+
+
+class NotificationMarkReadView(GenericAPIView):
+    """Mark unread notifications of the user as read with a single UPDATE.
+
+    Returns how many notifications were marked.
+    """
+
+    serializer_class = MarkNotificationsReadSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        queryset = Notification.objects.filter(user_id=request.user.id, is_read=False)
+        if "ids" in data:
+            queryset = queryset.filter(id__in=data["ids"])
+        if "up_to_id" in data:
+            queryset = queryset.filter(id__lte=data["up_to_id"])
+        if "until" in data:
+            queryset = queryset.filter(timestamp__lt=data["until"])
+        marked = queryset.update(is_read=True)
+        routers.pin([request.user.id])
+        return Response({"marked": marked})
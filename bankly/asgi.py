@@ -9,8 +9,21 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bankly.settings")
 
-application = get_asgi_application()
+
+class BanklyASGIRequest(ASGIRequest):
+    # Serve the endpoints that have one with their native async views
+    urlconf = "bankly.asgi_urls"
+
+
+class BanklyASGIHandler(ASGIHandler):
+    request_class = BanklyASGIRequest
+
+
+# What get_asgi_application() does, with the request class above
+django.setup(set_prefix=False)
+application = BanklyASGIHandler()
@@ -0,0 +1,26 @@
+"""The URL configuration of ``bankly/urls.py`` with the routes of the
+``asgi_urls.py`` of the apps, used by the requests of ``bankly/asgi.py``.
+"""
+
+from django.urls import include, path
+
+import authentication.urls
+import banking.urls
+
+from . import urls
+
+ASGI_URLS = [
+    (authentication.urls, "authentication.asgi_urls"),
+    (banking.urls, "banking.asgi_urls"),
+]
+
+
+def asgi_route(route):
+    for app_urls, asgi_urls in ASGI_URLS:
+        # include() keeps the module it was given
+        if getattr(route, "urlconf_name", None) is app_urls:
+            return path(str(route.pattern), include(asgi_urls))
+    return route
+
+
+urlpatterns = [asgi_route(route) for route in urls.urlpatterns]
@@ -0,0 +1,122 @@
+"""Dispatch DRF views with ``await`` instead of in a thread.
+
+DRF views are synchronous, so under ASGI Django runs each of them in a
+thread. ``AsyncAPIViewMixin`` makes a DRF view a native async view, which
+only pays off under ASGI: the apps route their async views in their
+``asgi_urls.py``, mounted by ``bankly/asgi_urls.py``.
+"""
+
+from inspect import isawaitable
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+def detach(response):
+    """Hand Django a plain ``HttpResponse`` with the content already rendered.
+
+    Django renders template responses (which DRF responses are) in a worker
+    thread, so the rendering is done here, in the event loop, instead. The
+    ``data`` of the DRF response is kept. Other responses (like streams) are
+    returned as they are.
+    """
+    if not isinstance(response, Response):
+        return response
+    response.render()
+    plain = HttpResponse(
+        response.content, status=response.status_code, headers=response.headers
+    )
+    plain.data = response.data
+    return plain
+
+
+class AsyncAPIViewMixin:
+    """Dispatch a DRF view with ``await`` instead of in a thread.
+
+    Authenticators are awaited with their ``aauthenticate`` method when they
+    have one and run in a thread otherwise. Permissions are awaited with
+    ``ahas_permission`` when they have one; the others (like
+    ``IsAuthenticated``) must not query the database. Responses are always
+    JSON, the browsable API needs the sync views.
+    """
+
+    renderer_classes = [JSONRenderer]
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return detach(self.response)
+
+    async def ainitial(self, request, *args, **kwargs):
+        # APIView.initial() with the authentication and permissions awaited
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        await self.acheck_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(
+                        request
+                    )
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
+
+    async def acheck_permissions(self, request):
+        for permission in self.get_permissions():
+            if hasattr(permission, "ahas_permission"):
+                allowed = await permission.ahas_permission(request, self)
+            else:
+                allowed = permission.has_permission(request, self)
+            if not allowed:
+                self.permission_denied(
+                    request,
+                    message=getattr(permission, "message", None),
+                    code=getattr(permission, "code", None),
+                )
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(
+            queryset, self.request, view=self
+        )
@@ -1,3 +1,70 @@
+import os
+
 from .settings import *
+from .postgresql import databases_from_env
+from .sqlite import PRODUCTION_OPTIONS as SQLITE_PRODUCTION_OPTIONS
 
 ALLOWED_HOSTS = ["admin.bankly.mu-stafa.com"]
+
+# PostgreSQL when POSTGRES_DB is set (needs the psycopg package, see
+# bankly/postgresql/__init__.py for the variables), with the list views
+# reading from the replicas of POSTGRES_REPLICA_HOSTS (see bankly/routers.py).
+# With replicas, READ_CACHE_URL must be set too so every worker sees the pins
+# that send a user's reads to the primary after their writes.
+#
+# Otherwise SQLite with write-ahead logging, IMMEDIATE write transactions and
+# tuned pragmas (see bankly/sqlite/__init__.py). Connections are kept for 10
+# minutes instead of being opened for every request, and checked before reuse.
+if os.environ.get("POSTGRES_DB"):
+    DATABASES = databases_from_env(os.environ)
+    DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "bankly.sqlite",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "CONN_MAX_AGE": 600,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": SQLITE_PRODUCTION_OPTIONS,
+        }
+    }
+
+# Notifications are created by the process_outbox worker, and reach the
+# notification streams of the web workers through the database.
+NOTIFICATION_OUTBOX_SYNC = False
+NOTIFICATION_EVENTS_BACKEND = "banking.events.DatabaseBackend"
+
+# The proxies in front of the workers (nginx by default), whose entries of
+# X-Forwarded-For are trusted for the client IP of the login throttle
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    "NUM_PROXIES": int(os.environ.get("NUM_PROXIES", 1)),
+}
+
+# The clients authenticate with tokens
+API_BASIC_AUTHENTICATION = False
+
+# New passwords (and old ones, on their next login) are hashed with scrypt
+PASSWORD_HASHERS = [
+    "authentication.hashers.ScryptPasswordHasher",
+    *(
+        hasher
+        for hasher in PASSWORD_HASHERS
+        if not hasher.endswith(".ScryptPasswordHasher")
+    ),
+]
+
+# The workers share the read cache through Redis when READ_CACHE_URL is set
+# (e.g. redis://127.0.0.1:6379/1, needs the redis package). A local-memory
+# cache per worker would miss the invalidations of the other workers, so the
+# cache is off otherwise.
+if os.environ.get("READ_CACHE_URL"):
+    CACHES["reads"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["READ_CACHE_URL"],
+        "TIMEOUT": 300,
+    }
+    # The replica pins of a user must be seen by every worker
+    REPLICA_PIN_CACHE_ALIAS = "reads"
+else:
+    READ_CACHE_ALIAS = None
@@ -0,0 +1,215 @@
+"""Non-blocking logging for the performance log.
+
+Request threads only put records on a bounded queue. A background thread
+drains the queue in batches, formats each record as one JSON line and writes
+the whole batch with a single flush to a file that rotates by size and age.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from .metrics import registry
+
+# Attributes every LogRecord has; anything else was passed with ``extra=``
+RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON lines, starting with the level.
+
+    Starting every line with ``{"level": "<LEVEL>"`` lets the log viewer
+    split entries with ``LOG_VIEWER_PATTERNS``.
+    """
+
+    def format(self, record):
+        entry = {
+            "level": record.levelname,
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RotatingBatchFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file handler that writes records in batches.
+
+    The file is rotated when it would grow past ``max_bytes`` or when it is
+    older than ``interval`` seconds, whichever comes first. Rotated files get
+    the usual ``.1``, ``.2``... suffixes.
+    """
+
+    def __init__(
+        self, filename, max_bytes=0, backup_count=0, interval=0, encoding=None
+    ):
+        super().__init__(
+            filename,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding=encoding,
+            delay=True,
+        )
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+
+    def _open(self):
+        # A fresh checkout has no logs directory
+        os.makedirs(os.path.dirname(os.path.abspath(self.baseFilename)), exist_ok=True)
+        return super()._open()
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+    def rollover_due(self, size):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return self.maxBytes > 0 and self.stream.tell() + size >= self.maxBytes
+
+    def emit_batch(self, records):
+        self.acquire()
+        try:
+            for record in records:
+                try:
+                    message = self.format(record) + self.terminator
+                    if self.stream is None:
+                        self.stream = self._open()
+                    if self.rollover_due(len(message)):
+                        self.doRollover()
+                        if self.stream is None:
+                            self.stream = self._open()
+                    self.stream.write(message)
+                except Exception:
+                    self.handleError(record)
+            self.flush()
+        finally:
+            self.release()
+
+
+class BatchingListener:
+    """Drain a queue on a daemon thread and hand the records over in batches."""
+
+    def __init__(self, queue, handler, batch_size=100, flush_interval=1.0):
+        self.queue = queue
+        self.handler = handler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="performance-log-writer", daemon=True
+        )
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            stop = record is None
+            if not stop:
+                batch.append(record)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                else:
+                    batch.append(record)
+            if batch:
+                self.handler.emit_batch(batch)
+            if stop:
+                return
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+
+class QueuedFileHandler(logging.Handler):
+    """Queue records for a ``RotatingBatchFileHandler`` running on its own thread.
+
+    This is the ``QueueHandler``/``QueueListener`` pattern with a bounded queue
+    and batched writes. It does not subclass ``QueueHandler`` because
+    ``dictConfig`` configures those specially on newer Pythons. Records are
+    dropped (and counted in the ``log_records_dropped_total`` metric) instead
+    of blocking the request when the queue is full.
+    """
+
+    def __init__(
+        self,
+        filename,
+        max_bytes=10 * 1024 * 1024,
+        backup_count=10,
+        interval=24 * 60 * 60,
+        batch_size=100,
+        flush_interval=1.0,
+        queue_size=10000,
+    ):
+        super().__init__()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.target = RotatingBatchFileHandler(
+            filename,
+            max_bytes=max_bytes,
+            backup_count=backup_count,
+            interval=interval,
+        )
+        self.writer = BatchingListener(
+            self.queue,
+            self.target,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+        )
+        self.writer.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the writer thread, not on the request thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            formatter = self.target.formatter or logging.Formatter()
+            record.exc_text = formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            registry.increment("log_records_dropped_total")
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.writer.stop()
+        self.target.close()
+        super().close()
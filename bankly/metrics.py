@@ -0,0 +1,198 @@
+"""In-memory request metrics, exposed in the Prometheus text format.
+
+Queries are counted with ``connection.execute_wrapper`` instead of
+``connection.queries``, so the numbers are available without ``DEBUG``.
+"""
+
+import bisect
+import re
+import threading
+import time
+from collections import Counter
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# Placeholder lists such as IN (%s, %s, %s) collapse to one shape
+PLACEHOLDER_LIST = re.compile(r"\(\s*%s(?:\s*,\s*%s)*\s*\)")
+
+
+def query_shape(sql):
+    """The SQL of a query with the length of placeholder lists erased."""
+    return PLACEHOLDER_LIST.sub("(...)", sql)
+
+
+class QueryCounter:
+    """``execute_wrapper`` that counts the queries and the time spent in them.
+
+    With ``track_shapes`` it also counts how often each query shape ran, which
+    is how repeated (N+1) queries are spotted.
+    """
+
+    def __init__(self, track_shapes=False):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter() if track_shapes else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            if self.shapes is not None and not sql.startswith(
+                ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+            ):
+                self.shapes[query_shape(sql)] += 1
+
+    def repeated_shapes(self, threshold):
+        """The query shapes that ran at least ``threshold`` times."""
+        if self.shapes is None:
+            return []
+        return [
+            (shape, count)
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # One extra slot for the +Inf bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the bucket that holds it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.queries = 0
+        self.db_time = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+        self.counters = {}
+
+    def observe_request(self, method, route, status, duration, queries, db_time):
+        key = (method, route, status)
+        with self.lock:
+            metrics = self.routes.get(key)
+            if metrics is None:
+                metrics = self.routes[key] = RouteMetrics()
+            metrics.latency.observe(duration)
+            metrics.queries += queries
+            metrics.db_time += db_time
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+            self.counters.clear()
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self.lock:
+            routes = sorted(self.routes.items())
+            counters = sorted(self.counters.items())
+
+        lines = [
+            "# HELP bankly_request_duration_seconds Request latency.",
+            "# TYPE bankly_request_duration_seconds histogram",
+        ]
+        for (method, route, status), metrics in routes:
+            labels = f'method="{method}",route="{route}",status="{status}"'
+            cumulative = 0
+            for bound, bucket_count in zip(
+                (*LATENCY_BUCKETS, "+Inf"), metrics.latency.counts
+            ):
+                cumulative += bucket_count
+                lines.append(
+                    f'bankly_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f"bankly_request_duration_seconds_sum{{{labels}}} {metrics.latency.sum}"
+            )
+            lines.append(
+                f"bankly_request_duration_seconds_count{{{labels}}} {metrics.latency.count}"
+            )
+
+        lines += [
+            "# HELP bankly_request_latency_seconds Request latency quantiles.",
+            "# TYPE bankly_request_latency_seconds gauge",
+        ]
+        for (method, route, status), metrics in routes:
+            labels = f'method="{method}",route="{route}",status="{status}"'
+            for q in QUANTILES:
+                lines.append(
+                    f'bankly_request_latency_seconds{{{labels},quantile="{q}"}} '
+                    f"{metrics.latency.quantile(q):.6f}"
+                )
+
+        lines += [
+            "# HELP bankly_db_queries_total Database queries run by requests.",
+            "# TYPE bankly_db_queries_total counter",
+        ]
+        for (method, route, status), metrics in routes:
+            labels = f'method="{method}",route="{route}",status="{status}"'
+            lines.append(f"bankly_db_queries_total{{{labels}}} {metrics.queries}")
+
+        lines += [
+            "# HELP bankly_db_seconds_total Time requests spent in the database.",
+            "# TYPE bankly_db_seconds_total counter",
+        ]
+        for (method, route, status), metrics in routes:
+            labels = f'method="{method}",route="{route}",status="{status}"'
+            lines.append(f"bankly_db_seconds_total{{{labels}}} {metrics.db_time:.6f}")
+
+        for name, value in counters:
+            lines.append(f"# TYPE bankly_{name} counter")
+            lines.append(f"bankly_{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -1,39 +1,136 @@
+import contextvars
+import itertools
 import logging
 import time
 
-from django.db import connection, reset_queries
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .metrics import QueryCounter, registry
 
 custom_logger = logging.getLogger("custom_logger")
 
+# The QueryCounter of the request being handled. Concurrent ASGI requests run
+# their queries on the connections of one shared thread, so the counter comes
+# from the context of the query (which sync_to_async() carries over to that
+# thread) rather than from the connection.
+current_counter = contextvars.ContextVar("current_counter", default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_query_counting():
+    """Add ``count_query`` to the connections of this thread, once."""
+    for connection in connections.all():
+        if count_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(count_query)
+
+
+def route_of(request):
+    # The route pattern (not the path) keeps the number of label values bounded
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else "unmatched"
+
 
 class CustomMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            # Under ASGI the request is handled without a hop to a thread
+            markcoroutinefunction(self)
+        self.sample_rate = max(1, getattr(settings, "PERFORMANCE_LOG_SAMPLE_RATE", 1))
+        self.slow_request_seconds = getattr(
+            settings, "PERFORMANCE_LOG_SLOW_REQUEST_SECONDS", 1.0
+        )
+        self.request_counter = itertools.count()
+        # In DEBUG, warn about requests that repeat the same query shape
+        self.repeated_query_threshold = (
+            getattr(settings, "REPEATED_QUERY_WARNING_THRESHOLD", 5)
+            if settings.DEBUG
+            else None
+        )
 
     def __call__(self, request):
-        reset_queries()
+        if self.async_mode:
+            return self.__acall__(request)
 
-        # Get beginning stats
-        start_queries = len(connection.queries)
+        install_query_counting()
+        counter = QueryCounter(track_shapes=self.repeated_query_threshold is not None)
         start_time = time.perf_counter()
 
-        # Process the request
-        response = self.get_response(request)
+        # Process the request while counting the queries of every connection
+        token = current_counter.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
 
-        # Get ending stats
-        end_time = time.perf_counter()
-        end_queries = len(connection.queries)
+        self.record(request, response, counter, time.perf_counter() - start_time)
+        return response
 
-        # Calculate stats
-        total_time = end_time - start_time
-        total_queries = end_queries - start_queries
+    async def __acall__(self, request):
+        counter = QueryCounter(track_shapes=self.repeated_query_threshold is not None)
+        start_time = time.perf_counter()
 
-        # Log the results
-        # logger = logging.getLogger("debug")
-        custom_logger.debug(
-            f"Request: {request.method} {request.path} Number of Queries: {total_queries} Total time: {(total_time):.2f}s"
-        )
-        # custom_logger.debug(f"")
-        # custom_logger.debug(f"")
+        # The async ORM runs the queries of a request in the thread of its sync
+        # context, so that is where the connections need the wrapper
+        await sync_to_async(install_query_counting)()
+        token = current_counter.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
 
+        self.record(request, response, counter, time.perf_counter() - start_time)
         return response
+
+    def record(self, request, response, counter, total_time):
+        registry.observe_request(
+            request.method,
+            route_of(request),
+            response.status_code,
+            total_time,
+            counter.count,
+            counter.duration,
+        )
+        if self.should_log(total_time):
+            custom_logger.debug(
+                "Request: %s %s Number of Queries: %d Total time: %.2fs",
+                request.method,
+                request.path,
+                counter.count,
+                total_time,
+                extra={
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "queries": counter.count,
+                    "db_time": round(counter.duration, 6),
+                    "duration": round(total_time, 6),
+                },
+            )
+
+        if self.repeated_query_threshold is not None:
+            for shape, count in counter.repeated_shapes(self.repeated_query_threshold):
+                custom_logger.warning(
+                    "Possible N+1: %s %s ran %d identical queries: %s",
+                    request.method,
+                    request.path,
+                    count,
+                    shape,
+                )
+
+    def should_log(self, total_time):
+        # Slow requests are always logged, the others are sampled
+        sampled = next(self.request_counter) % self.sample_rate == 0
+        return sampled or total_time >= self.slow_request_seconds
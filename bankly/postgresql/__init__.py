@@ -0,0 +1,66 @@
+"""PostgreSQL backend with connection pools, ``ENGINE = "bankly.postgresql"``.
+
+Django 4.2 opens a connection per request, or keeps one per worker thread
+with ``CONN_MAX_AGE``. With ``OPTIONS["pool"]`` (``True`` or the arguments
+of ``psycopg_pool.ConnectionPool``, like ``{"min_size": 4, "max_size":
+16}``) every worker process instead keeps a pool per database alias, and a
+request checks a connection out of it and hands it back when it ends.
+Pools need psycopg 3 with ``psycopg_pool`` and ``CONN_MAX_AGE = 0``.
+
+``databases_from_env()`` builds ``DATABASES`` from ``POSTGRES_*`` variables,
+``bankly/deploy.py`` uses it when ``POSTGRES_DB`` is set:
+
+- ``POSTGRES_DB``, ``POSTGRES_USER``, ``POSTGRES_PASSWORD``,
+  ``POSTGRES_HOST`` (``localhost``) and ``POSTGRES_PORT`` (``5432``): the
+  primary.
+- ``POSTGRES_REPLICA_HOSTS``: comma-separated ``host[:port]`` of read
+  replicas (same database and credentials), as ``replica_1``,
+  ``replica_2``... The test runner uses the primary in their place.
+- ``POSTGRES_POOL_SIZE``: connections of each pool, 0 (the default) for
+  persistent connections kept ``POSTGRES_CONN_MAX_AGE`` seconds (600)
+  instead. ``POSTGRES_POOL_TIMEOUT``: seconds a request waits for a
+  connection (10).
+- ``POSTGRES_PGBOUNCER=1``: connect through PgBouncer in transaction mode,
+  which does not support server-side cursors.
+"""
+
+
+def databases_from_env(environ):
+    """``DATABASES`` for the primary and the replicas from the environment."""
+    pool_size = int(environ.get("POSTGRES_POOL_SIZE", 0))
+    default_port = environ.get("POSTGRES_PORT", "5432")
+
+    def database(host, port):
+        options = {}
+        if pool_size:
+            options["pool"] = {
+                "min_size": pool_size,
+                "max_size": pool_size,
+                "timeout": float(environ.get("POSTGRES_POOL_TIMEOUT", 10)),
+            }
+        return {
+            "ENGINE": "bankly.postgresql",
+            "NAME": environ["POSTGRES_DB"],
+            "USER": environ.get("POSTGRES_USER", ""),
+            "PASSWORD": environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": host,
+            "PORT": port or default_port,
+            "CONN_MAX_AGE": (
+                0 if pool_size else int(environ.get("POSTGRES_CONN_MAX_AGE", 600))
+            ),
+            "CONN_HEALTH_CHECKS": True,
+            "DISABLE_SERVER_SIDE_CURSORS": environ.get("POSTGRES_PGBOUNCER") == "1",
+            "OPTIONS": options,
+        }
+
+    databases = {
+        "default": database(environ.get("POSTGRES_HOST", "localhost"), default_port)
+    }
+    replica_hosts = environ.get("POSTGRES_REPLICA_HOSTS", "")
+    for index, address in enumerate(filter(None, replica_hosts.split(",")), start=1):
+        host, _, port = address.strip().partition(":")
+        databases[f"replica_{index}"] = {
+            **database(host, port),
+            "TEST": {"MIRROR": "default"},
+        }
+    return databases
@@ -0,0 +1,74 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.utils.asyncio import async_unsafe
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Django's PostgreSQL backend with the ``pool`` option, see
+    ``bankly/postgresql/__init__.py``.
+    """
+
+    # The pools of this process, by alias
+    _connection_pools = {}
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict["OPTIONS"].get("pool")
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+        if self.alias not in self._connection_pools:
+            if not base.is_psycopg3:
+                raise ImproperlyConfigured("Connection pools need psycopg 3.")
+            if self.settings_dict["CONN_MAX_AGE"] != 0:
+                raise ImproperlyConfigured(
+                    "Connection pools do not support persistent connections, "
+                    "set CONN_MAX_AGE to 0."
+                )
+            from psycopg_pool import ConnectionPool
+
+            pool = ConnectionPool(
+                kwargs=self.get_connection_params(),
+                open=False,
+                check=(
+                    ConnectionPool.check_connection
+                    if self.settings_dict["CONN_HEALTH_CHECKS"]
+                    else None
+                ),
+                **({} if pool_options is True else pool_options),
+            )
+            self._connection_pools.setdefault(self.alias, pool)
+        return self._connection_pools[self.alias]
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # An option of this backend rather than of psycopg.connect()
+        params.pop("pool", None)
+        return params
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        # Opened by the first connection of the process
+        pool.open()
+        connection = pool.getconn()
+        # What super() does to the connections it opens
+        isolation_level = self.settings_dict["OPTIONS"].get("isolation_level")
+        if isolation_level is None:
+            self.isolation_level = base.IsolationLevel.READ_COMMITTED
+        else:
+            self.isolation_level = base.IsolationLevel(isolation_level)
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    @async_unsafe
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Rolls back what is left open and keeps the connection for the
+            # next request
+            self.pool.putconn(self.connection)
+        self.connection = None
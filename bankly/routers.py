@@ -0,0 +1,97 @@
+"""Primary/replica routing with read-your-writes stickiness.
+
+``DATABASE_REPLICAS`` lists the aliases of ``DATABASES`` that are read-only
+replicas of ``default``. Every write goes to the primary, and so does every
+read except the queries of the list views that opt in (with
+``ReplicaReadMixin`` in ``banking/views.py``): those run on a random replica.
+
+Replicas lag behind the primary, so a user whose accounts or notifications
+were just written is pinned to the primary for ``REPLICA_PIN_SECONDS``
+after the write commits: they see their own transfers, new accounts and
+read notifications right away, and a stale page is never stored in the read
+cache under the version that followed the write. Pins are kept in the
+``REPLICA_PIN_CACHE_ALIAS`` cache, which must be shared by the workers (like
+Redis) when there are several of them.
+"""
+
+import random
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+def get_pin_cache():
+    return caches[getattr(settings, "REPLICA_PIN_CACHE_ALIAS", "default")]
+
+
+def pin_key(user_id):
+    return f"replica-pin:{user_id}"
+
+
+def set_pins(user_ids):
+    get_pin_cache().set_many(
+        {pin_key(user_id): True for user_id in user_ids},
+        timeout=getattr(settings, "REPLICA_PIN_SECONDS", 10),
+    )
+
+
+def pin(user_ids):
+    """Send the reads of these users to the primary for a while, counted
+    from the commit of the current transaction.
+    """
+    if not replicas():
+        return
+    transaction.on_commit(partial(set_pins, set(user_ids)))
+
+
+def choose(pinned):
+    aliases = replicas()
+    if pinned or not aliases:
+        return DEFAULT_DB_ALIAS
+    return random.choice(aliases)
+
+
+def read_alias(user_id):
+    """The alias the replica reads of a user go to."""
+    if not replicas():
+        return DEFAULT_DB_ALIAS
+    return choose(get_pin_cache().get(pin_key(user_id)) is not None)
+
+
+async def aread_alias(user_id):
+    if not replicas():
+        return DEFAULT_DB_ALIAS
+    return choose(await get_pin_cache().aget(pin_key(user_id)) is not None)
+
+
+class PrimaryReplicaRouter:
+    """Keep writes and migrations off the replicas.
+
+    Reads are left to Django: queries go to ``default`` unless a view picks
+    a replica with ``using()``, and related objects are fetched from the
+    database of the instance they hang off.
+    """
+
+    def db_for_read(self, model, **hints):
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
@@ -13,10 +13,14 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# True under `python manage.py test`
+TESTING = sys.argv[1:2] == ["test"]
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
@@ -90,11 +94,26 @@ TEMPLATES = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.BasicAuthentication",
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
-    ]
+        "authentication.authentication.JWTAuthentication",
+        "authentication.authentication.BasicAuthentication",
+    ],
+    # Client IPs (for the login throttle) are taken from REMOTE_ADDR, not from
+    # X-Forwarded-For, which any client can set. Behind proxies, this is the
+    # number of them that append to X-Forwarded-For (see bankly/deploy.py).
+    "NUM_PROXIES": 0,
 }
 
+# Basic authentication hashes the password on every request
+API_BASIC_AUTHENTICATION = True
+# Build request.user from the JWT claims instead of querying the User row.
+# Deactivations and password changes then only apply once the access tokens
+# expire, so ACCESS_TOKEN_LIFETIME should be short when this is on. Views
+# that need the full model load it with authentication.authentication.load_user,
+# which caches it for JWT_USER_CACHE_SECONDS.
+JWT_TOKEN_USER = False
+JWT_USER_CACHE_SECONDS = 30
+JWT_USER_CACHE_SIZE = 10000
+
 WSGI_APPLICATION = "bankly.wsgi.application"
 
 
@@ -105,8 +124,21 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+    },
 }
+if TESTING:
+    # A separate test database that plays a lagging read replica in the
+    # routing tests, created only for the tests that use it. Deployments
+    # configure their replicas in bankly/deploy.py.
+    DATABASES["replica"] = {"ENGINE": "django.db.backends.sqlite3"}
+
+# The aliases of DATABASES that are read replicas of "default" (see
+# bankly/routers.py). Users are pinned to the primary for
+# REPLICA_PIN_SECONDS after their writes, in the REPLICA_PIN_CACHE_ALIAS cache.
+DATABASE_ROUTERS = ["bankly.routers.PrimaryReplicaRouter"]
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_CACHE_ALIAS = "default"
 
 
 # Password validation
@@ -127,6 +159,38 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The first hasher hashes new passwords, the others verify older hashes,
+# which are replaced on the next login (see authentication/hashers.py).
+# Scrypt is much cheaper than Django's 600k PBKDF2 iterations for the same
+# resistance to offline attacks; Argon2 needs the argon2-cffi package.
+PASSWORD_HASHERS = [
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "authentication.hashers.ScryptPasswordHasher",
+    "authentication.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+PASSWORD_SCRYPT_PARAMS = {"work_factor": 2**14, "block_size": 8, "parallelism": 1}
+PASSWORD_ARGON2_PARAMS = {"time_cost": 2, "memory_cost": 65536, "parallelism": 2}
+
+# At most this many logins hash passwords at once, and logins are turned away
+# with a 503 when this many are already waiting or hashing
+LOGIN_HASHING_THREADS = 4
+LOGIN_HASHING_QUEUE = 64
+# Token buckets of the login attempts: (burst, tokens per second) per
+# username and per client IP. CacheTokenBuckets shares them between the
+# workers through LOGIN_THROTTLE_CACHE_ALIAS.
+LOGIN_THROTTLE_BACKEND = "authentication.throttling.LocalTokenBuckets"
+LOGIN_THROTTLE_CACHE_ALIAS = "default"
+LOGIN_THROTTLE_RATES = {"username": (10, 0.2), "ip": (100, 5.0)}
+
+# The provision_users command hashes passwords in this many processes (None:
+# one per CPU), the endpoint in this many threads shared by its requests. The
+# endpoint takes at most PROVISIONING_MAX_ROWS users per request, the command
+# has no limit.
+PROVISIONING_HASHING_PROCESSES = None
+PROVISIONING_HASHING_THREADS = 4
+PROVISIONING_MAX_ROWS = 1000
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=360),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=360),
@@ -142,6 +206,7 @@ SIMPLE_JWT = {
     "USER_ID_CLAIM": "user_id",
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
+    "TOKEN_OBTAIN_SERIALIZER": "authentication.serializers.TokenObtainPairSerializer",
 }
 
 
@@ -168,16 +233,23 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 # Logging
+# The performance log is written by a background thread (see bankly/log_pipeline.py)
+# as JSON lines, rotated by size and age.
 
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "handlers": {
         "file": {
-            "class": "logging.FileHandler",
+            "class": "bankly.log_pipeline.QueuedFileHandler",
             "filename": os.path.join(BASE_DIR, os.path.join("logs", "performance.log")),
+            "max_bytes": 10 * 1024 * 1024,
+            "backup_count": 10,
+            "interval": 24 * 60 * 60,
+            "batch_size": 100,
+            "flush_interval": 1.0,
             "level": "DEBUG",
-            "formatter": "verbose",
+            "formatter": "json",
         },
     },
     "loggers": {
@@ -192,9 +264,65 @@ LOGGING = {
             "format": "[{levelname}] {asctime}: {message}",
             "style": "{",
         },
+        "json": {
+            "()": "bankly.log_pipeline.JsonFormatter",
+        },
     },
 }
 
+if TESTING:
+    # Test runs would fill the performance log with their own requests
+    LOGGING["handlers"]["file"] = {"class": "logging.NullHandler"}
+
+# Log 1 in N requests to the performance log, and every request slower than
+# PERFORMANCE_LOG_SLOW_REQUEST_SECONDS
+PERFORMANCE_LOG_SAMPLE_RATE = 1
+PERFORMANCE_LOG_SLOW_REQUEST_SECONDS = 1.0
+# With DEBUG on, warn when a request runs the same query shape this many times
+REPEATED_QUERY_WARNING_THRESHOLD = 5
+
+# Notification streams (see banking/events.py). The in-process backend only
+# reaches the streams of its own worker, banking.events.DatabaseBackend those
+# of every worker: each one with open streams reads the new notifications
+# every NOTIFICATION_POLL_SECONDS.
+NOTIFICATION_EVENTS_BACKEND = "banking.events.InProcessBackend"
+NOTIFICATION_POLL_SECONDS = 1
+NOTIFICATION_POLL_LOOKBACK_SECONDS = 10
+NOTIFICATION_STREAM_HEARTBEAT_SECONDS = 15
+NOTIFICATION_STREAM_MAX_SECONDS = 300
+# Requests that are not served over ASGI get a long poll of this length instead
+NOTIFICATION_LONG_POLL_SECONDS = 20
+# Events queued for a slow client before its stream is ended
+NOTIFICATION_STREAM_QUEUE_SIZE = 100
+# Write notifications while posting transactions. When off, posting only
+# writes outbox events and `python manage.py process_outbox` creates the
+# notifications (see banking/outbox.py).
+NOTIFICATION_OUTBOX_SYNC = True
+# Read notifications older than this are deleted by purge_notifications
+NOTIFICATION_RETENTION_DAYS = 90
+
+# Responses stored for Idempotency-Key replays expire after this many hours
+# (sweep them with sweep_idempotency_keys); the most recent ones are also
+# cached in memory by every process
+IDEMPOTENCY_KEY_TTL_HOURS = 24
+IDEMPOTENCY_CACHE_SIZE = 10000
+
+# Read-through cache of the account lists and statement first pages (see
+# banking/read_cache.py). Every worker must see the invalidations of the
+# others, so a local-memory cache only suits a single process; deployments
+# with more point READ_CACHE_ALIAS at a shared backend, or set it to None.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "reads": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "reads",
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+READ_CACHE_ALIAS = "reads"
 
 LOG_VIEWER_FILES = ["performance"]
 LOG_VIEWER_FILES_PATTERN = "*.log*"
@@ -204,7 +332,10 @@ LOG_VIEWER_MAX_READ_LINES = 1000  # total log lines will be read
 LOG_VIEWER_FILE_LIST_MAX_ITEMS_PER_PAGE = (
     25  # Max log files loaded in Datatable per page
 )
-LOG_VIEWER_PATTERNS = ["[INFO]", "[DEBUG]", "[WARNING]", "[ERROR]", "[CRITICAL]"]
+LOG_VIEWER_PATTERNS = [
+    f'{{"level": "{level}"'
+    for level in ["INFO", "DEBUG", "WARNING", "ERROR", "CRITICAL"]
+]
 LOG_VIEWER_EXCLUDE_TEXT_PATTERN = (
     None  # String regex expression to exclude the log from line
 )
@@ -0,0 +1,49 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.db.backends.sqlite3 import base
+from django.utils.functional import cached_property
+
+TRANSACTION_MODES = {"DEFERRED", "IMMEDIATE", "EXCLUSIVE"}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Django's SQLite backend with the ``pragmas`` and ``transaction_mode``
+    options, see ``bankly/sqlite/__init__.py``.
+    """
+
+    @cached_property
+    def pragmas(self):
+        return self.settings_dict["OPTIONS"].get("pragmas", {})
+
+    @cached_property
+    def transaction_mode(self):
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode must be one of {', '.join(sorted(TRANSACTION_MODES))}."
+            )
+        return mode and mode.upper()
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Options of this backend rather than of sqlite3.connect()
+        params.pop("pragmas", None)
+        params.pop("transaction_mode", None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    with connection.cursor() as cursor:
+        for name, value in connection.pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+connection_created.connect(
+    apply_pragmas, sender=DatabaseWrapper, dispatch_uid="bankly.sqlite.pragmas"
+)
@@ -0,0 +1,37 @@
+"""Test helpers that guard against N+1 query regressions."""
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountRegressionMixin:
+    """Mixin for Django test cases that fails when queries grow with the data.
+
+    ``assertConstantQueries`` builds a fixture at each size in
+    ``query_count_sizes`` (inside a transaction that is rolled back), runs the
+    code under test against it and fails unless the number of queries is the
+    same at every size.
+    """
+
+    query_count_sizes = (1, 10, 100)
+
+    def count_queries(self, function):
+        with CaptureQueriesContext(connection) as context:
+            function()
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, build_fixture, run, sizes=None, msg=None):
+        counts = {}
+        for size in sizes or self.query_count_sizes:
+            with transaction.atomic():
+                fixture = build_fixture(size)
+                counts[size] = self.count_queries(lambda: run(fixture))
+                transaction.set_rollback(True)
+
+        if len(set(counts.values())) > 1:
+            self.fail(
+                self._formatMessage(
+                    msg, f"Query count grows with the data size: {counts}"
+                )
+            )
+        return counts
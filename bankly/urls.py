@@ -18,6 +18,7 @@ from django.urls import path, include, re_path
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from .views import MetricsView
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -50,4 +51,5 @@ urlpatterns = [
     path("api/authentication/", include("authentication.urls")),
     path("api/accounts/", include("banking.urls")),
     path("logs/", include("log_viewer.urls")),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
@@ -0,0 +1,17 @@
+from django.http import HttpResponse
+from rest_framework.views import APIView
+
+from authentication.permissions import IsAdminUser
+
+from .metrics import registry
+
+
+class MetricsView(APIView):
+    """Request metrics in the Prometheus text format, for admins only."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -0,0 +1,14 @@
+"""Helpers for the worker processes of the management commands."""
+
+import django
+from django.apps import apps
+
+
+def setup_worker():
+    """Set Django up in a worker process, once.
+
+    Forked workers inherit the setup of their parent, spawned ones (the
+    default on macOS and Windows) start without it.
+    """
+    if not apps.ready:
+        django.setup()
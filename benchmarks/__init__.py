@@ -0,0 +1,4 @@
+"""Micro-benchmarks of the serializer, permission, posting and view hot paths.
+
+Run ``python -m benchmarks --help`` for the options.
+"""
@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import sys
+
+# The reference results, committed, and the results recorded on this machine
+# by --save-baseline, which are not (rates only compare on the same machine)
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+LOCAL_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.local.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the hot paths at several dataset sizes and compare "
+        "the results with a stored baseline.",
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10,100,1000",
+        help="comma-separated dataset sizes (accounts, transactions and notifications)",
+    )
+    parser.add_argument(
+        "-k",
+        "--filter",
+        action="append",
+        help="only run the cases whose name contains this text (repeatable)",
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.2,
+        help="minimum seconds per timing round",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument(
+        "--baseline",
+        help="baseline file (default: the one saved on this machine, else the "
+        "committed reference, whose rates are then not compared)",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.3,
+        help="fail when a rate drops (or peak memory grows) by more than this fraction",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store the results as the baseline of this machine instead of comparing",
+    )
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bankly.settings")
+    import django
+
+    django.setup()
+    from django.test.utils import (
+        setup_databases,
+        setup_test_environment,
+        teardown_databases,
+        teardown_test_environment,
+    )
+
+    from . import cases
+    from .runner import compare, run_suite
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    # Run against a throwaway test database, like the test suite
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False, aliases={"default"})
+    try:
+        results = run_suite(cases, sizes, args.min_time, args.repeat, args.filter)
+    finally:
+        teardown_databases(databases, verbosity=0)
+        teardown_test_environment()
+
+    for key, result in results.items():
+        print(
+            f"{key:<48} {result['ops_per_sec']:>12.2f} ops/s "
+            f"{result['peak_bytes']:>10} B peak {result['retained_bytes']:>8} B retained"
+        )
+    report = {"sizes": sizes, "results": results}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+
+    if args.save_baseline:
+        with open(args.baseline or LOCAL_BASELINE, "w") as file:
+            json.dump(report, file, indent=2)
+            file.write("\n")
+        return
+
+    path = args.baseline
+    if path is None:
+        path = LOCAL_BASELINE if os.path.exists(LOCAL_BASELINE) else BASELINE
+    if not os.path.exists(path):
+        print(f"No baseline at {path}, nothing to compare.")
+        return
+    # The committed reference was recorded on another machine
+    rates = path != BASELINE
+    if not rates:
+        print(
+            f"Comparing the peak memory only with {path}, run with --save-baseline "
+            "to record the rates of this machine."
+        )
+
+    with open(path) as file:
+        baseline = json.load(file)["results"]
+    regressions = compare(baseline, results, args.threshold, rates)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
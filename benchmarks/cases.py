@@ -0,0 +1,267 @@
+"""The benchmarked hot paths and the fixture they run against.
+
+Each entry of ``CASES`` takes the fixture and returns the function to time.
+View cases go through ``APIRequestFactory`` and render the response, so they
+cover authentication, permissions, validation, queries and rendering, but not
+the middleware. Async views run through ``async_to_sync``, the way the
+benchmark loop would await them.
+"""
+
+import itertools
+from decimal import Decimal
+from types import SimpleNamespace
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
+
+from authentication.throttling import get_buckets
+from authentication.views import (
+    AsyncTokenObtainPairView,
+    RegisterView,
+    TokenObtainPairView,
+)
+from banking.async_views import NotificationStreamView
+from banking.models import Account, Transaction
+from banking.permissions import IsAccountOwner
+from banking.posting import post_transactions
+from banking.serializers import AccountRetrievalSerializer, TransactionSerializer
+from banking.views import (
+    AccountCreateView,
+    AccountListView,
+    AccountProvisionView,
+    AccountSummaryView,
+    BankStatementExportView,
+    BankStatementListView,
+    NotificationMarkReadView,
+    TransactionBatchCreateView,
+    TransactionCreateView,
+    UnreadNotificationListView,
+)
+
+PASSWORD = "benchmark-password"
+BALANCE = Decimal("10000000")
+
+factory = APIRequestFactory()
+usernames = (f"benchmark-{index}" for index in itertools.count())
+
+
+def build_fixture(size):
+    """An owner with ``size`` accounts, transactions and unread notifications,
+    and an admin.
+    """
+    owner = User.objects.create_user(username=next(usernames), password=PASSWORD)
+    other = User.objects.create_user(username=next(usernames), password=PASSWORD)
+    accounts = Account.objects.bulk_create(
+        Account(user=owner, balance=BALANCE) for _ in range(size)
+    )
+    company = Account.objects.create(
+        user=other, account_type=Account.COMPANY, balance=BALANCE
+    )
+    post_transactions(
+        [
+            Transaction(
+                sender=accounts[0],
+                recipient=company,
+                transaction_type=Transaction.TRANSFER,
+                amount=Decimal("1.00"),
+            )
+            for _ in range(size)
+        ]
+    )
+    # The owner's unread notifications come from transfers it receives
+    post_transactions(
+        [
+            Transaction(
+                sender=company,
+                recipient=accounts[0],
+                transaction_type=Transaction.TRANSFER,
+                amount=Decimal("1.00"),
+            )
+            for _ in range(size)
+        ]
+    )
+    return SimpleNamespace(
+        owner=owner,
+        admin=User.objects.create_user(username=next(usernames), is_staff=True),
+        account=Account.objects.get(id=accounts[0].id),
+        accounts=list(Account.objects.filter(user=owner)),
+        company=company,
+        refresh=str(RefreshToken.for_user(owner)),
+    )
+
+
+def request_for(user, method="get", path="/", data=None):
+    request = getattr(factory, method)(path, data, format="json")
+    if user is not None:
+        force_authenticate(request, user=user)
+    return request
+
+
+def view_case(view_class, method="get", data=None, user="owner", **kwargs):
+    """A case that sends a request to ``view_class`` and renders the response.
+
+    ``data`` and the URL ``kwargs`` are callables of the fixture. The request
+    is authenticated as the ``user`` attribute of the fixture, if any.
+    """
+    view = view_class.as_view()
+    if view_class.view_is_async:
+        view = async_to_sync(view)
+
+    def case(fixture):
+        url_kwargs = {name: value(fixture) for name, value in kwargs.items()}
+
+        def run():
+            request = request_for(
+                getattr(fixture, user) if user else None,
+                method,
+                data=data(fixture) if data else None,
+            )
+            response = view(request, **url_kwargs)
+            if response.streaming:
+                return b"".join(response.streaming_content)
+            # Async views hand back their responses already rendered
+            if not hasattr(response, "render"):
+                return response.content
+            return response.render()
+
+        return run
+
+    return case
+
+
+def login_case(view_class):
+    """A token view case that starts every login with full throttle buckets,
+    so the rate limit is checked but never hit.
+    """
+    case = view_case(
+        view_class,
+        "post",
+        data=lambda fixture: {"username": fixture.owner.username, "password": PASSWORD},
+        user=None,
+    )
+
+    def login(fixture):
+        run = case(fixture)
+
+        def run_with_full_buckets():
+            get_buckets().clear()
+            return run()
+
+        return run_with_full_buckets
+
+    return login
+
+
+def provision_rows(fixture):
+    return [
+        {
+            "username": next(usernames),
+            "password": PASSWORD,
+            "account_type": "individual",
+        }
+        for _ in range(10)
+    ]
+
+
+def transfer(fixture):
+    return {
+        "transaction_type": Transaction.TRANSFER,
+        "amount": "1.00",
+        "sender": fixture.account.id,
+        "recipient": fixture.company.id,
+    }
+
+
+def serializer_validate(fixture):
+    serializer = TransactionSerializer(
+        context={"request": SimpleNamespace(user=fixture.owner)}
+    )
+    data = {
+        "transaction_type": Transaction.TRANSFER,
+        "amount": Decimal("1.00"),
+        "sender": fixture.account,
+        "recipient": fixture.company,
+    }
+    return lambda: serializer.validate(data)
+
+
+def permission_check(fixture):
+    permission = IsAccountOwner()
+    request = SimpleNamespace(user=fixture.owner)
+    view = SimpleNamespace(kwargs={"account_id": fixture.account.id})
+    return lambda: permission.has_permission(request, view)
+
+
+def transaction_save(fixture):
+    def run():
+        Transaction(
+            sender=fixture.account,
+            recipient=fixture.company,
+            transaction_type=Transaction.TRANSFER,
+            amount=Decimal("1.00"),
+        ).save()
+
+    return run
+
+
+def account_list_serializer(fixture):
+    return lambda: AccountRetrievalSerializer(fixture.accounts, many=True).data
+
+
+CASES = {
+    "TransactionSerializer.validate": serializer_validate,
+    "IsAccountOwner.has_permission": permission_check,
+    "Transaction.save": transaction_save,
+    "AccountRetrievalSerializer(many=True)": account_list_serializer,
+    "view:account_create": view_case(
+        AccountCreateView, "post", data=lambda fixture: {"account_type": "individual"}
+    ),
+    "view:account_list": view_case(AccountListView),
+    "view:transaction_create": view_case(TransactionCreateView, "post", data=transfer),
+    "view:transaction_batch_create": view_case(
+        TransactionBatchCreateView,
+        "post",
+        data=lambda fixture: {"transactions": [transfer(fixture)] * 10},
+    ),
+    "view:bank_statement_list": view_case(
+        BankStatementListView, account_id=lambda fixture: fixture.account.id
+    ),
+    "view:bank_statement_export": view_case(
+        BankStatementExportView,
+        account_id=lambda fixture: fixture.account.id,
+        export_format=lambda fixture: "csv",
+    ),
+    "view:account_summary": view_case(
+        AccountSummaryView, account_id=lambda fixture: fixture.account.id
+    ),
+    "view:unread_notifications": view_case(UnreadNotificationListView),
+    # After the first request, the UPDATE finds nothing left to mark
+    "view:notifications_mark_read": view_case(
+        NotificationMarkReadView, "post", data=lambda fixture: {"up_to_id": 2**31}
+    ),
+    # Answered as a long poll with the missed notifications, which returns
+    # right away
+    "view:notification_stream": view_case(
+        NotificationStreamView, data=lambda fixture: {"last_event_id": 0}
+    ),
+    "view:account_provision": view_case(
+        AccountProvisionView, "post", data=provision_rows, user="admin"
+    ),
+    "view:register": view_case(
+        RegisterView,
+        "post",
+        data=lambda fixture: {"username": next(usernames), "password": PASSWORD},
+        user=None,
+    ),
+    "view:token_obtain_pair": login_case(TokenObtainPairView),
+    "view:token_obtain_pair(async)": login_case(AsyncTokenObtainPairView),
+    "view:token_refresh": view_case(
+        TokenRefreshView,
+        "post",
+        data=lambda fixture: {"refresh": fixture.refresh},
+        user=None,
+    ),
+}
@@ -0,0 +1,209 @@
+"""Transfer throughput of concurrent writers on SQLite, per database profile.
+
+Every profile runs in a fresh process against its own temporary database
+file. Threads stand in for the request workers: each posts transfers with
+``post_transaction()`` between random accounts, and opens or reuses its
+connection around every transfer the way a request does (with
+``close_old_connections()``). Transfers that fail with "database is locked"
+are counted apart from the ones that succeed.
+
+Run ``python -m benchmarks.concurrency --help`` for the options.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+from bankly.sqlite import PRODUCTION_OPTIONS
+from loadtest.stats import summarize
+
+PROFILES = {
+    # What bankly/settings.py runs with: a connection per request, deferred
+    # transactions and the default journal
+    "stock": {"ENGINE": "django.db.backends.sqlite3"},
+    # What bankly/deploy.py runs with
+    "production": {
+        "ENGINE": "bankly.sqlite",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": PRODUCTION_OPTIONS,
+    },
+}
+
+
+def setup(profile, path):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bankly.settings")
+    from django.conf import settings
+
+    settings.DATABASES = {"default": {**PROFILES[profile], "NAME": path}}
+    import django
+
+    django.setup()
+
+
+def create_accounts(count):
+    from django.contrib.auth.models import User
+
+    from banking.models import Account
+
+    user = User.objects.create_user(username="concurrency")
+    return [
+        Account.objects.create(user=user, balance=Decimal("1000000")).id
+        for _ in range(count)
+    ]
+
+
+def post_transfers(account_ids, deadline, seed, results):
+    from django.db import OperationalError, close_old_connections, connection
+
+    from banking.models import Transaction
+    from banking.posting import post_transaction
+
+    rng = random.Random(seed)
+    latencies = []
+    locked = errors = 0
+    while time.perf_counter() < deadline:
+        sender, recipient = rng.sample(account_ids, 2)
+        close_old_connections()
+        start = time.perf_counter()
+        try:
+            post_transaction(
+                Transaction(
+                    sender_id=sender,
+                    recipient_id=recipient,
+                    transaction_type=Transaction.TRANSFER,
+                    amount=Decimal("1.00"),
+                )
+            )
+            latencies.append(time.perf_counter() - start)
+        except OperationalError as e:
+            if "locked" in str(e):
+                locked += 1
+            else:
+                errors += 1
+        finally:
+            close_old_connections()
+    connection.close()
+    results.append((latencies, locked, errors))
+
+
+def run_profile(profile, threads, duration, accounts, seed):
+    """Run the transfers of one profile, in this process."""
+    with tempfile.TemporaryDirectory() as directory:
+        setup(profile, os.path.join(directory, "concurrency.sqlite3"))
+        from django.core.management import call_command
+        from django.db import connection
+
+        call_command("migrate", verbosity=0)
+        account_ids = create_accounts(accounts)
+        connection.close()
+
+        results = []
+        deadline = time.perf_counter() + duration
+        workers = [
+            threading.Thread(
+                target=post_transfers,
+                args=(account_ids, deadline, f"{seed}:{index}", results),
+            )
+            for index in range(threads)
+        ]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(
+        latency for worker_latencies, _, _ in results for latency in worker_latencies
+    )
+    locked = sum(result[1] for result in results)
+    errors = sum(result[2] for result in results)
+    return {
+        "profile": profile,
+        "transfers": len(latencies),
+        "locked": locked,
+        "errors": errors,
+        **summarize(latencies, len(latencies), 0, elapsed),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.concurrency",
+        description="Post transfers from concurrent threads against SQLite with "
+        "each database profile and compare the throughput.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="append",
+        choices=sorted(PROFILES),
+        help="only run this profile (repeatable, default: all)",
+    )
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument(
+        "--duration", type=float, default=10, help="seconds of transfers per profile"
+    )
+    parser.add_argument(
+        "--accounts",
+        type=int,
+        default=20,
+        help="the transfers go between this many accounts",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    # Runs a single profile and prints its result, in the child processes
+    parser.add_argument("--run-profile", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    options = [
+        f"--threads={args.threads}",
+        f"--duration={args.duration}",
+        f"--accounts={args.accounts}",
+        f"--seed={args.seed}",
+    ]
+    if args.run_profile:
+        result = run_profile(
+            args.run_profile, args.threads, args.duration, args.accounts, args.seed
+        )
+        print(json.dumps(result))
+        return
+
+    results = []
+    for profile in args.profile or list(PROFILES):
+        # Django is set up once per process, with the DATABASES of a profile
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.concurrency",
+                f"--run-profile={profile}",
+                *options,
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        ).stdout
+        results.append(json.loads(output.splitlines()[-1]))
+
+    for result in results:
+        print(
+            f"{result['profile']:<12} {result['throughput_rps']:>10.2f} transfers/s "
+            f"{result['locked']:>6} locked {result['errors']:>4} errors "
+            f"p50 {result['p50_ms']} ms p99 {result['p99_ms']} ms"
+        )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"config": vars(args), "results": results}, file, indent=2)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Timing, allocation tracking and baseline comparison for the benchmarks."""
+
+import gc
+import time
+import tracemalloc
+
+from django.db import transaction
+
+# Peak memory differences below this many bytes are noise, not regressions
+MIN_MEMORY_DELTA = 1024
+
+
+def ops_per_second(function, min_time, repeat):
+    """The best rate of ``repeat`` rounds that each run for at least ``min_time``."""
+    number = 1
+    while True:
+        elapsed = run_timed(function, number)
+        if elapsed >= min_time:
+            break
+        # Aim a little past min_time so the next round is usually the last
+        number = max(number * 2, int(number * min_time * 1.2 / max(elapsed, 1e-9)))
+
+    best = number / elapsed
+    for _ in range(repeat - 1):
+        best = max(best, number / run_timed(function, number))
+    return best
+
+
+def run_timed(function, number):
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        return time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def allocations(function, number=10):
+    """Peak traced memory of one call and the memory retained per call, in bytes."""
+    function()  # Warm up caches so they are not counted as allocations
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        peak = 0
+        for _ in range(number):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            function()
+            _, call_peak = tracemalloc.get_traced_memory()
+            peak = max(peak, call_peak - before)
+        # Reference cycles are not garbage until the collector has run
+        gc.collect()
+        end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, max(0, end - start) // number
+
+
+def run_suite(cases, sizes, min_time=0.2, repeat=3, selected=None):
+    """Run every case at every dataset size and return the results by key.
+
+    The fixture of each size is built inside a transaction that is rolled
+    back afterwards, and so is every case, so the rows a case writes do not
+    change the dataset of the next one.
+    """
+    results = {}
+    for size in sizes:
+        with transaction.atomic():
+            fixture = cases.build_fixture(size)
+            for name, factory in cases.CASES.items():
+                if selected and not any(part in name for part in selected):
+                    continue
+                with transaction.atomic():
+                    function = factory(fixture)
+                    peak, retained = allocations(function)
+                    results[f"{name}[{size}]"] = {
+                        "ops_per_sec": round(
+                            ops_per_second(function, min_time, repeat), 2
+                        ),
+                        "peak_bytes": peak,
+                        "retained_bytes": retained,
+                    }
+                    transaction.set_rollback(True)
+            transaction.set_rollback(True)
+    return results
+
+
+def compare(baseline, current, threshold, rates=True):
+    """The regressions of ``current`` against ``baseline``, as messages.
+
+    A benchmark regresses when its rate drops, or its peak memory grows, by
+    more than ``threshold`` (a fraction). Rates depend on the machine, so
+    they are only compared with ``rates`` (when the baseline was recorded on
+    this one).
+    """
+    regressions = []
+    for key, result in current.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if rates and result["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{key}: {result['ops_per_sec']} ops/s, baseline {before['ops_per_sec']} ops/s"
+            )
+        if result["peak_bytes"] > max(
+            before["peak_bytes"] * (1 + threshold),
+            before["peak_bytes"] + MIN_MEMORY_DELTA,
+        ):
+            regressions.append(
+                f"{key}: peak {result['peak_bytes']} bytes, baseline {before['peak_bytes']} bytes"
+            )
+    return regressions
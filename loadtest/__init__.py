@@ -0,0 +1,4 @@
+"""Load-testing harness for the Bankly API.
+
+Run ``python -m loadtest --help`` against a local server for the options.
+"""
@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from .client import HttpClient
+from .scenarios import DEFAULT_MIX, Budget, UserPool, VirtualUser, parse_mix
+from .stats import Stats, compare, load_report
+
+
+def fund_accounts(account_ids, amount):
+    """Set the balance of the load-test accounts directly in the database.
+
+    There is no deposit endpoint, so this needs the settings (and database)
+    of the server under test. The balances are saved like an admin edit, so
+    they are recorded as ledger adjustments and leave the read cache fresh.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bankly.settings")
+    import django
+
+    django.setup()
+    from banking.models import Account
+
+    for account in Account.objects.filter(id__in=account_ids):
+        account.balance = amount
+        account.save(update_fields=["balance"])
+
+
+async def run(args):
+    setup_stats = Stats()
+    stats = Stats()
+    pool = UserPool()
+    run_id = args.run_id or f"{args.seed}-{int(time.time())}"
+    users = [
+        VirtualUser(
+            index,
+            HttpClient(args.base_url, timeout=args.timeout),
+            setup_stats,
+            pool,
+            args.seed,
+            run_id,
+        )
+        for index in range(args.users)
+    ]
+
+    setup_start = time.perf_counter()
+    ready = await asyncio.gather(*(user.setup() for user in users))
+    setup_elapsed = time.perf_counter() - setup_start
+    users = [user for user, ok in zip(users, ready) if ok]
+    if not users:
+        sys.exit("None of the virtual users could be set up.")
+    if args.fund_amount:
+        await asyncio.to_thread(fund_accounts, pool.account_ids(), args.fund_amount)
+
+    for user in users:
+        user.stats = stats
+    loop = asyncio.get_running_loop()
+    budget = Budget(loop.time, requests=args.requests, duration=args.duration)
+    start = time.perf_counter()
+    # Each user draws from its own seeded generator, independent of timing
+    await asyncio.gather(*(user.run(args.mix, budget) for user in users))
+    elapsed = time.perf_counter() - start
+
+    for user in users:
+        await user.client.close()
+
+    # Setup requests are reported on their own, apart from the scenario mix
+    report = stats.report(
+        elapsed,
+        {
+            "base_url": args.base_url,
+            "users": args.users,
+            "duration": args.duration,
+            "requests": args.requests,
+            "seed": args.seed,
+            "mix": args.mix,
+            "funded": bool(args.fund_amount),
+        },
+    )
+    report["setup"] = setup_stats.report(setup_elapsed, None)["steps"]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m loadtest",
+        description="Replay a weighted mix of API scenarios and report latency "
+        "percentiles, throughput and error rates as JSON.",
+    )
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=10, help="virtual users")
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--duration", type=float, help="seconds to run for")
+    limit.add_argument("--requests", type=int, help="total scenario requests")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="scenario weights, e.g. transfer=3,statement=4,notifications=2,accounts=1",
+    )
+    parser.add_argument(
+        "--fund-amount",
+        help="set the balance of every load-test account through the ORM, "
+        "so transfers can succeed",
+    )
+    parser.add_argument("--run-id", help="suffix of the load-test usernames")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="a previous JSON report to compare with")
+    args = parser.parse_args(argv)
+    if args.duration is None and args.requests is None:
+        args.requests = 1000
+
+    report = asyncio.run(run(args))
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        for line in compare(load_report(args.compare), report):
+            print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
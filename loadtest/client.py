@@ -0,0 +1,133 @@
+"""A small asyncio HTTP/1.1 client with keep-alive, built on the standard library."""
+
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+# Requests that can be sent again when a reused connection turns out closed
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class HttpError(Exception):
+    pass
+
+
+class Response:
+    def __init__(self, status, headers, body, elapsed):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.elapsed = elapsed
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+class HttpClient:
+    """One keep-alive connection to the server, reopened whenever it is closed.
+
+    Each virtual user owns a client, so requests on it are sequential.
+    """
+
+    def __init__(self, base_url, timeout=30.0):
+        parts = urlsplit(base_url)
+        if parts.scheme != "http":
+            raise ValueError("Only plain http:// servers are supported.")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, json_body=None, headers=None):
+        body = b"" if json_body is None else json.dumps(json_body).encode()
+        lines = [
+            f"{method} {self.prefix}{path} HTTP/1.1",
+            f"Host: {self.host}:{self.port}",
+            "Connection: keep-alive",
+            "Accept: application/json",
+            f"Content-Length: {len(body)}",
+        ]
+        if json_body is not None:
+            lines.append("Content-Type: application/json")
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+        # A POST the server may have processed is only resent when it carries
+        # an Idempotency-Key, so a transfer is never posted twice
+        retry = method in IDEMPOTENT_METHODS or "Idempotency-Key" in (headers or {})
+
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._send(payload, retry), self.timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            await self.close()
+            raise HttpError(f"{method} {path}: {e!r}") from e
+        response.elapsed = time.perf_counter() - start
+        return response
+
+    async def _send(self, payload, retry):
+        if self.reader is not None and self.reader.at_eof():
+            # The server closed the idle connection since the last response
+            await self.close()
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        self.writer.write(payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            if not retry:
+                raise ConnectionResetError("Connection closed without a response")
+            # The server closed an idle keep-alive connection, retry once
+            await self.close()
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+            self.writer.write(payload)
+            await self.writer.drain()
+            status_line = await self.reader.readline()
+        version, status, _ = status_line.decode("latin-1").split(" ", 2)
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = await self._read_chunked()
+        elif "content-length" in headers:
+            body = await self.reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await self.reader.read()
+            await self.close()
+
+        if version == "HTTP/1.0" or headers.get("connection", "").lower() == "close":
+            await self.close()
+        return Response(int(status), headers, body, 0.0)
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return b"".join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
@@ -0,0 +1,210 @@
+"""Virtual users and the weighted mix of scenarios they replay.
+
+Every virtual user registers, obtains a JWT pair and opens an account, then
+keeps picking a scenario from the mix until the run is over. The choices are
+made with a ``random.Random`` seeded from the run seed and the user's index,
+so two runs with the same seed replay the same sequence of requests.
+"""
+
+import random
+
+from .client import HttpError
+
+DEFAULT_MIX = {
+    "transfer": 3,
+    "statement": 4,
+    "notifications": 2,
+    "accounts": 1,
+}
+
+
+def parse_mix(value):
+    """Parse ``transfer=3,statement=4`` into a mix dictionary."""
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown scenario {name!r}.")
+        mix[name] = int(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("At least one scenario needs a positive weight.")
+    return mix
+
+
+class Budget:
+    """Stops the run after a number of requests or at a deadline."""
+
+    def __init__(self, loop_time, requests=None, duration=None):
+        self.loop_time = loop_time
+        self.remaining = requests
+        self.deadline = loop_time() + duration if duration else None
+
+    def take(self):
+        if self.deadline is not None and self.loop_time() >= self.deadline:
+            return False
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+        return True
+
+
+class UserPool:
+    """The virtual users that are set up, used to pick transfer recipients."""
+
+    def __init__(self):
+        self.users = []
+
+    def add(self, user):
+        self.users.append(user)
+
+    def account_ids(self):
+        return [user.account_id for user in self.users if user.account_id]
+
+    def other_account(self, user):
+        accounts = [
+            other.account_id
+            for other in self.users
+            if other is not user and other.account_id
+        ]
+        return user.rng.choice(accounts) if accounts else None
+
+
+class VirtualUser:
+    """A user replaying scenarios over its own keep-alive connection.
+
+    The JWT pair is refreshed when the server answers ``401``, and the user
+    logs in again when the refresh token has expired as well.
+    """
+
+    def __init__(self, index, client, stats, pool, seed, run_id):
+        self.index = index
+        self.client = client
+        self.stats = stats
+        self.pool = pool
+        self.rng = random.Random(f"{seed}:{index}")
+        self.username = f"loadtest-{run_id}-{index}"
+        self.password = f"pw-{run_id}-{index}"
+        self.access = None
+        self.refresh = None
+        self.account_id = None
+        self.transfers = 0
+
+    async def call(
+        self, step, method, path, json_body=None, expected=(200,), headers=None
+    ):
+        """Send a request and record it; returns the response or ``None``."""
+        headers = dict(headers or {})
+        if self.access is not None:
+            headers["Authorization"] = f"Bearer {self.access}"
+        try:
+            response = await self.client.request(method, path, json_body, headers)
+            if response.status == 401 and self.access is not None:
+                await self.renew_token()
+                headers["Authorization"] = f"Bearer {self.access}"
+                response = await self.client.request(method, path, json_body, headers)
+        except HttpError:
+            self.stats.record_failure(step)
+            return None
+        ok = response.status in expected
+        self.stats.record(step, response.status, response.elapsed, ok)
+        return response if ok else None
+
+    async def login(self):
+        self.access = None
+        response = await self.call(
+            "token",
+            "POST",
+            "/api/authentication/token/",
+            {"username": self.username, "password": self.password},
+        )
+        if response is not None:
+            tokens = response.json()
+            self.access, self.refresh = tokens["access"], tokens["refresh"]
+        return response is not None
+
+    async def renew_token(self):
+        access, self.access = self.access, None
+        response = await self.call(
+            "token_refresh",
+            "POST",
+            "/api/authentication/token/refresh/",
+            {"refresh": self.refresh},
+        )
+        if response is not None:
+            self.access = response.json()["access"]
+        elif not await self.login():
+            self.access = access
+
+    async def setup(self):
+        """Register, log in and open an account; ``False`` if any step failed."""
+        registered = await self.call(
+            "register",
+            "POST",
+            "/api/authentication/register/",
+            {
+                "username": self.username,
+                "password": self.password,
+                "email": f"{self.username}@example.com",
+            },
+            expected=(201,),
+        )
+        if registered is None or not await self.login():
+            return False
+        response = await self.call(
+            "account_create",
+            "POST",
+            "/api/accounts/create/",
+            {"account_type": "individual"},
+            expected=(201,),
+        )
+        if response is None:
+            return False
+        self.account_id = response.json()["id"]
+        self.pool.add(self)
+        return True
+
+    async def run(self, mix, budget):
+        names = list(mix)
+        weights = [mix[name] for name in names]
+        while budget.take():
+            scenario = self.rng.choices(names, weights)[0]
+            await getattr(self, scenario)()
+
+    async def transfer(self):
+        recipient = self.pool.other_account(self)
+        if recipient is None:
+            return await self.statement()
+        self.transfers += 1
+        await self.call(
+            "transfer",
+            "POST",
+            "/api/accounts/transactions/create/",
+            {
+                "transaction_type": "transfer",
+                "sender": self.account_id,
+                "recipient": recipient,
+                "amount": f"{self.rng.randint(1, 500) / 100:.2f}",
+            },
+            expected=(201,),
+            # Lets the client resend the transfer if the connection drops
+            headers={"Idempotency-Key": f"{self.username}-{self.transfers}"},
+        )
+
+    async def statement(self):
+        await self.call(
+            "statement",
+            "GET",
+            f"/api/accounts/{self.account_id}/statements/?page_size=50",
+        )
+
+    async def notifications(self):
+        await self.call(
+            "notifications",
+            "GET",
+            "/api/accounts/notifications/unread/?page_size=50",
+        )
+
+    async def accounts(self):
+        await self.call("accounts", "GET", "/api/accounts/")
@@ -0,0 +1,93 @@
+"""Latency, throughput and error statistics, and comparison of saved reports."""
+
+import json
+import math
+from collections import Counter, defaultdict
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()
+
+    def record(self, step, status, elapsed, ok):
+        self.latencies[step].append(elapsed)
+        self.statuses[step][status] += 1
+        if not ok:
+            self.errors[step] += 1
+
+    def record_failure(self, step):
+        # The request never got a response (connection error or timeout)
+        self.statuses[step]["failed"] += 1
+        self.errors[step] += 1
+
+    def report(self, duration, config):
+        steps = {}
+        total_requests = 0
+        total_errors = 0
+        all_latencies = []
+        for step in sorted(self.statuses):
+            latencies = sorted(self.latencies[step])
+            requests = sum(self.statuses[step].values())
+            total_requests += requests
+            total_errors += self.errors[step]
+            all_latencies.extend(latencies)
+            steps[step] = summarize(
+                latencies, requests, self.errors[step], duration
+            ) | {"statuses": {str(k): v for k, v in self.statuses[step].items()}}
+
+        return {
+            "config": config,
+            "duration_seconds": round(duration, 3),
+            "total": summarize(
+                sorted(all_latencies), total_requests, total_errors, duration
+            ),
+            "steps": steps,
+        }
+
+
+def summarize(latencies, requests, errors, duration):
+    summary = {
+        "requests": requests,
+        "throughput_rps": round(requests / duration, 2) if duration else None,
+        "error_rate": round(errors / requests, 4) if requests else 0.0,
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        summary[f"p{p}_ms"] = None if value is None else round(value * 1000, 2)
+    return summary
+
+
+def compare(baseline, current):
+    """Lines describing how ``current`` moved relative to ``baseline``."""
+    if baseline.get("config") != current.get("config"):
+        yield "warning: the runs used different configurations"
+    keys = ["throughput_rps", "error_rate"] + [f"p{p}_ms" for p in PERCENTILES]
+    sections = [("total", baseline["total"], current["total"])] + [
+        (step, baseline["steps"][step], current["steps"][step])
+        for step in sorted(current["steps"])
+        if step in baseline["steps"]
+    ]
+    for name, before, after in sections:
+        for key in keys:
+            old, new = before.get(key), after.get(key)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            yield f"{name:<24} {key:<15} {old:>10} -> {new:>10} ({change})"
+
+
+def load_report(path):
+    with open(path) as file:
+        return json.load(file)
@@ -1,8 +1,50 @@
-from django.test import TestCase
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient,
+    LiveServerTestCase,
+    RequestFactory,
+    TestCase,
+    override_settings,
+)
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from django.contrib.auth.models import User
+from authentication import urls as authentication_urls
+from banking import urls as banking_urls
+from benchmarks import cases as benchmark_cases
+from benchmarks.concurrency import main as run_concurrency_benchmark
+from benchmarks.runner import compare as compare_benchmarks, run_suite
+from banking import read_cache
 from banking.models import Account, Transaction
+from banking.posting import post_transactions
+from bankly.log_pipeline import JsonFormatter, QueuedFileHandler
+from bankly import routers
+from bankly.metrics import Histogram, registry
+from bankly.postgresql import databases_from_env
+from bankly.routers import PrimaryReplicaRouter
+from bankly.sqlite import PRODUCTION_OPTIONS as SQLITE_PRODUCTION_OPTIONS
+from bankly.sqlite.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from bankly.middleware import CustomMiddleware
+from bankly.testing import QueryCountRegressionMixin
+from loadtest.__main__ import main as run_load_test
+from loadtest.client import HttpClient, HttpError
+from loadtest.stats import compare, percentile
 
 
 class BigBangIntegrationTest(TestCase):
@@ -85,3 +127,552 @@ class BigBangIntegrationTest(TestCase):
             response.data[0]["message"], "You sent 500.00 EGP in a transaction."
         )
         self.assertEqual(response.data[0]["is_read"], False)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(
+            "admin", "admin@example.com", "adminpassword"
+        )
+        self.user = User.objects.create_user(
+            "testuser", "test@example.com", "testpassword"
+        )
+        registry.reset()
+        read_cache.clear()
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_requests_are_recorded(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.get(reverse("account_list"))
+        self.client.get(reverse("account_list"))
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        labels = 'method="GET",route="api/accounts/",status="200"'
+        self.assertIn(f"bankly_request_duration_seconds_count{{{labels}}} 2", body)
+        self.assertIn(
+            f'bankly_request_latency_seconds{{{labels},quantile="0.99"}}', body
+        )
+        # The second account list request is served from the read cache
+        self.assertIn(f"bankly_db_queries_total{{{labels}}} 1", body)
+
+    @override_settings(ROOT_URLCONF="bankly.asgi_urls")
+    async def test_async_requests_are_recorded(self):
+        token = AccessToken.for_user(self.user)
+        response = await AsyncClient().get(
+            reverse("account_list"), headers={"authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # The middleware ran in async mode and still counted the user and
+        # account queries the views awaited
+        metrics = registry.routes[("GET", "api/accounts/", 200)]
+        self.assertEqual(metrics.latency.count, 1)
+        self.assertEqual(metrics.queries, 2)
+
+    @override_settings(ROOT_URLCONF="bankly.asgi_urls")
+    async def test_concurrent_async_requests_count_their_own_queries(self):
+        headers = {"authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        route = ("GET", "api/accounts/notifications/unread/", 200)
+        await AsyncClient().get(reverse("unread_notifications"), headers=headers)
+        single = registry.routes[route].queries
+        self.assertGreater(single, 0)
+        registry.reset()
+
+        responses = await asyncio.gather(
+            *(
+                AsyncClient().get(reverse("unread_notifications"), headers=headers)
+                for _ in range(5)
+            )
+        )
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        self.assertEqual(registry.routes[route].queries, 5 * single)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram(buckets=(1.0, 2.0, 3.0))
+        for value in (0.5, 1.5, 1.5, 2.5):
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(histogram.quantile(1.0), 3.0)
+
+
+class LogPipelineTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "performance.log")
+        self.logger = logging.getLogger("log_pipeline_test")
+        self.logger.propagate = False
+        self.handler = QueuedFileHandler(self.filename, max_bytes=400, backup_count=3)
+        self.handler.setFormatter(JsonFormatter())
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+        shutil.rmtree(self.directory)
+
+    def test_json_lines_and_rotation(self):
+        for index in range(10):
+            self.logger.warning("Request %d", index, extra={"queries": index})
+        # Closing drains the queue
+        self.handler.close()
+
+        with open(self.filename) as file:
+            entries = [json.loads(line) for line in file]
+        self.assertEqual(entries[-1]["message"], "Request 9")
+        self.assertEqual(entries[-1]["queries"], 9)
+        self.assertEqual(entries[-1]["level"], "WARNING")
+        self.assertTrue(os.path.exists(self.filename + ".1"))
+
+    def test_missing_directory_is_created(self):
+        filename = os.path.join(self.directory, "logs", "performance.log")
+        handler = QueuedFileHandler(filename)
+        self.logger.addHandler(handler)
+        try:
+            self.logger.warning("Request")
+        finally:
+            self.logger.removeHandler(handler)
+            handler.close()
+        self.assertTrue(os.path.exists(filename))
+
+    def test_tests_do_not_write_the_performance_log(self):
+        self.assertEqual(
+            settings.LOGGING["handlers"]["file"]["class"], "logging.NullHandler"
+        )
+
+    @override_settings(
+        PERFORMANCE_LOG_SAMPLE_RATE=3, PERFORMANCE_LOG_SLOW_REQUEST_SECONDS=0.5
+    )
+    def test_sampling(self):
+        middleware = CustomMiddleware(lambda request: None)
+        sampled = [middleware.should_log(0.01) for _ in range(6)]
+        self.assertEqual(sampled, [True, False, False, True, False, False])
+        # Slow requests are always logged
+        self.assertTrue(middleware.should_log(1.0))
+
+
+class QueryCountRegressionTest(QueryCountRegressionMixin, TestCase):
+    """Runs every API route against growing data and expects constant queries."""
+
+    password = "ownerpassword"
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def build_fixture(self, size):
+        owner = User.objects.create_user("owner", password=self.password)
+        company = User.objects.create(username="company")
+        account = Account.objects.create(user=owner, balance=1000000)
+        company_account = Account.objects.create(
+            user=company, account_type=Account.COMPANY
+        )
+        Account.objects.bulk_create(Account(user=owner) for _ in range(size - 1))
+        post_transactions(
+            [
+                Transaction(
+                    sender=account,
+                    recipient=company_account,
+                    transaction_type=Transaction.PAY_BILL,
+                    amount=1,
+                )
+                for _ in range(size)
+            ]
+        )
+        return SimpleNamespace(
+            size=size, owner=owner, account=account, company_account=company_account
+        )
+
+    def transfer(self, fixture):
+        return {
+            "transaction_type": Transaction.TRANSFER,
+            "amount": 1,
+            "sender": fixture.account.id,
+            "recipient": fixture.company_account.id,
+        }
+
+    def provision(self, fixture):
+        fixture.owner.is_staff = True
+        rows = [
+            {"username": f"provisioned{index}", "password": "password"}
+            for index in range(3)
+        ]
+        return self.client.post(reverse("account_provision"), rows, format="json")
+
+    def export(self, fixture):
+        response = self.client.get(
+            reverse(
+                "bank_statement_export",
+                kwargs={"account_id": fixture.account.id, "export_format": "csv"},
+            )
+        )
+        b"".join(response.streaming_content)
+        return response
+
+    def stream(self, fixture):
+        # Only the replay of the missed notifications touches the database
+        response = self.client.get(
+            reverse("notification_stream"), HTTP_LAST_EVENT_ID="0"
+        )
+        response.close()
+        return response
+
+    def scenarios(self):
+        """Every route, as ``name: (expected status, request)``."""
+        statement_kwargs = lambda fixture: {"account_id": fixture.account.id}
+        return {
+            "account_create": (
+                201,
+                lambda f: self.client.post(
+                    reverse("account_create"), {"account_type": Account.INDIVIDUAL}
+                ),
+            ),
+            "account_provision": (201, self.provision),
+            "account_list": (200, lambda f: self.client.get(reverse("account_list"))),
+            "transaction_create": (
+                201,
+                lambda f: self.client.post(
+                    reverse("transaction_create"), self.transfer(f)
+                ),
+            ),
+            "transaction_batch_create": (
+                201,
+                lambda f: self.client.post(
+                    reverse("transaction_batch_create"),
+                    {"transactions": [self.transfer(f)] * 10},
+                    format="json",
+                ),
+            ),
+            "bank_statement_list": (
+                200,
+                lambda f: self.client.get(
+                    reverse("bank_statement_list", kwargs=statement_kwargs(f))
+                ),
+            ),
+            "bank_statement_export": (200, self.export),
+            "account_summary": (
+                200,
+                lambda f: self.client.get(
+                    reverse("account_summary", kwargs=statement_kwargs(f))
+                ),
+            ),
+            "unread_notifications": (
+                200,
+                lambda f: self.client.get(reverse("unread_notifications")),
+            ),
+            "notifications_mark_read": (
+                200,
+                lambda f: self.client.post(
+                    reverse("notifications_mark_read"),
+                    {"up_to_id": 2**31},
+                    format="json",
+                ),
+            ),
+            "notification_stream": (200, self.stream),
+            "token_obtain_pair": (
+                200,
+                lambda f: self.client.post(
+                    reverse("token_obtain_pair"),
+                    {"username": "owner", "password": self.password},
+                ),
+            ),
+            "token_refresh": (
+                200,
+                lambda f: self.client.post(
+                    reverse("token_refresh"),
+                    {"refresh": str(RefreshToken.for_user(f.owner))},
+                ),
+            ),
+            "register": (
+                201,
+                lambda f: self.client.post(
+                    reverse("register"),
+                    {"username": "newuser", "password": "newpassword"},
+                ),
+            ),
+        }
+
+    def test_every_route_has_a_scenario(self):
+        names = {
+            pattern.name
+            for pattern in banking_urls.urlpatterns + authentication_urls.urlpatterns
+        }
+        self.assertEqual(names - set(self.scenarios()), set())
+
+    def test_query_counts_are_constant(self):
+        for name, (status, scenario) in self.scenarios().items():
+            with self.subTest(route=name):
+
+                def run(fixture):
+                    self.client.force_authenticate(user=fixture.owner)
+                    response = scenario(fixture)
+                    # A request that fails early runs fewer queries
+                    self.assertEqual(response.status_code, status)
+
+                self.assertConstantQueries(self.build_fixture, run)
+
+    @override_settings(DEBUG=True, REPEATED_QUERY_WARNING_THRESHOLD=3)
+    def test_repeated_queries_are_flagged(self):
+        user = User.objects.create(username="someone")
+
+        def n_plus_one(request):
+            for _ in range(3):
+                User.objects.get(id=user.id)
+            return HttpResponse()
+
+        middleware = CustomMiddleware(n_plus_one)
+        with self.assertLogs("custom_logger", level="WARNING") as logs:
+            middleware(RequestFactory().get("/"))
+        self.assertIn("ran 3 identical queries", logs.output[0])
+
+
+class LoadTestHarnessTest(LiveServerTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, "report.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_harness(self, *args):
+        run_load_test(
+            ["--base-url", self.live_server_url, "--output", self.output, *args]
+        )
+        with open(self.output) as file:
+            return json.load(file)
+
+    def test_report(self):
+        report = self.run_harness(
+            "--users", "3", "--requests", "30", "--mix", "statement=2,accounts=1"
+        )
+
+        self.assertEqual(report["config"]["users"], 3)
+        self.assertEqual(report["config"]["mix"], {"statement": 2, "accounts": 1})
+        self.assertEqual(report["total"]["requests"], 30)
+        self.assertEqual(report["total"]["error_rate"], 0.0)
+        self.assertEqual(set(report["steps"]), {"statement", "accounts"})
+        self.assertEqual(set(report["setup"]), {"register", "token", "account_create"})
+        self.assertEqual(report["setup"]["register"]["statuses"], {"201": 3})
+
+    def test_percentiles_and_comparison(self):
+        values = [0.001 * i for i in range(1, 101)]
+        self.assertAlmostEqual(percentile(values, 50), 0.05)
+        self.assertAlmostEqual(percentile(values, 99), 0.099)
+        self.assertIsNone(percentile([], 50))
+
+        before = {"config": {}, "total": {"p50_ms": 10.0}, "steps": {}}
+        after = {"config": {}, "total": {"p50_ms": 15.0}, "steps": {}}
+        (line,) = compare(before, after)
+        self.assertIn("+50.0%", line)
+
+    def test_posts_are_not_resent(self):
+        # The server drops the first connection after reading the request, as
+        # if it closed an idle keep-alive connection at the same moment
+        received = []
+
+        async def handle(reader, writer):
+            received.append(await reader.readuntil(b"\r\n\r\n"))
+            if len(received) > 1:
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+            writer.close()
+
+        async def send(method, headers=None):
+            received.clear()
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            client = HttpClient(f"http://127.0.0.1:{port}")
+            try:
+                return await client.request(method, "/", {}, headers)
+            finally:
+                await client.close()
+                server.close()
+                await server.wait_closed()
+
+        with self.assertRaises(HttpError):
+            asyncio.run(send("POST"))
+        self.assertEqual(len(received), 1)
+
+        response = asyncio.run(send("POST", {"Idempotency-Key": "transfer-1"}))
+        self.assertEqual(response.status, 200)
+        self.assertEqual(len(received), 2)
+        self.assertEqual(asyncio.run(send("GET")).status, 200)
+
+
+class SQLiteProfileTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "profile.sqlite3")
+
+    def tearDown(self):
+        if "profile" in connections:
+            connections["profile"].close()
+            del connections["profile"]
+        shutil.rmtree(self.directory)
+
+    def connect(self, options):
+        connections["profile"] = SQLiteDatabaseWrapper(
+            {
+                **connection.settings_dict,
+                "ENGINE": "bankly.sqlite",
+                "NAME": self.path,
+                "OPTIONS": options,
+            },
+            alias="profile",
+        )
+        return connections["profile"]
+
+    def test_pragmas_are_applied(self):
+        with self.connect(SQLITE_PRODUCTION_OPTIONS).cursor() as cursor:
+            pragmas = {}
+            for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size"):
+                cursor.execute(f"PRAGMA {name}")
+                pragmas[name] = cursor.fetchone()[0]
+        self.assertEqual(
+            pragmas,
+            {
+                "journal_mode": "wal",
+                "synchronous": 1,
+                "busy_timeout": 5000,
+                "mmap_size": 256 * 2**20,
+            },
+        )
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        self.connect(SQLITE_PRODUCTION_OPTIONS).ensure_connection()
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with transaction.atomic(using="profile"):
+            with self.assertRaisesMessage(sqlite3.OperationalError, "locked"):
+                other.execute("BEGIN IMMEDIATE")
+        other.execute("BEGIN IMMEDIATE")
+        other.execute("ROLLBACK")
+
+        with self.assertRaises(ImproperlyConfigured):
+            with transaction.atomic(
+                using=self.connect({"transaction_mode": "LAZY"}).alias
+            ):
+                pass
+
+    def test_concurrency_benchmark(self):
+        output = os.path.join(self.directory, "concurrency.json")
+        with redirect_stdout(StringIO()):
+            run_concurrency_benchmark(
+                ["--duration", "0.5", "--threads", "2", "--output", output]
+            )
+        with open(output) as file:
+            results = json.load(file)["results"]
+        self.assertEqual(
+            [result["profile"] for result in results], ["stock", "production"]
+        )
+        for result in results:
+            self.assertGreater(result["transfers"], 0)
+            self.assertEqual(result["errors"], 0)
+        self.assertEqual(results[1]["locked"], 0)
+
+
+class DatabaseSettingsTest(TestCase):
+    def test_postgres_settings_from_the_environment(self):
+        databases = databases_from_env(
+            {
+                "POSTGRES_DB": "bankly",
+                "POSTGRES_USER": "bankly",
+                "POSTGRES_HOST": "primary",
+                "POSTGRES_REPLICA_HOSTS": "replica-a, replica-b:5433",
+                "POSTGRES_POOL_SIZE": "8",
+            }
+        )
+        self.assertEqual(list(databases), ["default", "replica_1", "replica_2"])
+        default = databases["default"]
+        self.assertEqual(default["ENGINE"], "bankly.postgresql")
+        self.assertEqual((default["HOST"], default["PORT"]), ("primary", "5432"))
+        self.assertEqual(default["CONN_MAX_AGE"], 0)
+        self.assertEqual(default["OPTIONS"]["pool"]["max_size"], 8)
+        self.assertEqual(
+            (databases["replica_2"]["HOST"], databases["replica_2"]["PORT"]),
+            ("replica-b", "5433"),
+        )
+        self.assertEqual(databases["replica_1"]["TEST"], {"MIRROR": "default"})
+
+        databases = databases_from_env({"POSTGRES_DB": "bankly"})
+        self.assertEqual(list(databases), ["default"])
+        self.assertEqual(databases["default"]["CONN_MAX_AGE"], 600)
+        self.assertEqual(databases["default"]["OPTIONS"], {})
+
+    @override_settings(DATABASE_REPLICAS=["replica"])
+    def test_router_keeps_writes_and_migrations_on_the_primary(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_write(User), "default")
+        self.assertFalse(router.allow_migrate("replica", "banking"))
+        self.assertIsNone(router.allow_migrate("default", "banking"))
+        self.assertEqual(routers.choose(pinned=False), "replica")
+        self.assertEqual(routers.choose(pinned=True), "default")
+
+
+class BenchmarkSuiteTest(TestCase):
+    def test_run_suite(self):
+        results = run_suite(
+            benchmark_cases,
+            [2],
+            min_time=0.001,
+            repeat=1,
+            selected=["IsAccountOwner", "view:account_list", "pair(async)"],
+        )
+
+        self.assertEqual(
+            set(results),
+            {
+                "IsAccountOwner.has_permission[2]",
+                "view:account_list[2]",
+                "view:token_obtain_pair(async)[2]",
+            },
+        )
+        for result in results.values():
+            self.assertGreater(result["ops_per_sec"], 0)
+            self.assertGreater(result["peak_bytes"], 0)
+        # Every size and case is rolled back
+        self.assertFalse(User.objects.exists())
+
+    def test_every_route_has_a_case(self):
+        names = {
+            pattern.name
+            for pattern in banking_urls.urlpatterns + authentication_urls.urlpatterns
+        }
+        cases = {name.removeprefix("view:") for name in benchmark_cases.CASES}
+        self.assertEqual(names - cases, set())
+
+    def test_regression_threshold(self):
+        baseline = {"case[10]": {"ops_per_sec": 100.0, "peak_bytes": 10000}}
+
+        self.assertEqual(
+            compare_benchmarks(
+                baseline, {"case[10]": {"ops_per_sec": 80.0, "peak_bytes": 10500}}, 0.25
+            ),
+            [],
+        )
+        slower = compare_benchmarks(
+            baseline, {"case[10]": {"ops_per_sec": 70.0, "peak_bytes": 10000}}, 0.25
+        )
+        self.assertEqual(len(slower), 1)
+        self.assertIn("ops/s", slower[0])
+        bigger = compare_benchmarks(
+            baseline, {"case[10]": {"ops_per_sec": 100.0, "peak_bytes": 20000}}, 0.25
+        )
+        self.assertEqual(len(bigger), 1)
+        self.assertIn("peak", bigger[0])
+        # Rates recorded on another machine are not compared
+        self.assertEqual(
+            compare_benchmarks(
+                baseline,
+                {"case[10]": {"ops_per_sec": 10.0, "peak_bytes": 20000}},
+                0.25,
+                rates=False,
+            ),
+            bigger,
+        )